@@ -0,0 +1,182 @@
+# acquisition.py
+# e-Stat のワークブックと議事録・国会会議録の言及件数を、asyncio で同時に取得するランナー。
+# 各ソースは独立したタスクグループとして動き、全体の所要時間は最も遅いソースに近づく。
+#   python src/acquisition.py                      # すべてのソース
+#   python src/acquisition.py --sources estat      # e-Stat だけ
+import argparse
+import asyncio
+import random
+import time
+from urllib.parse import urlparse
+
+import settings
+
+
+class HostRateLimiter:
+    """
+    ホストごとに、リクエストの開始間隔を min_interval 秒以上あける。
+    """
+    def __init__(self, min_interval: float = settings.ACQ_HOST_MIN_INTERVAL):
+        self.min_interval = min_interval
+        self.locks = {}
+        self.next_start = {}
+
+    async def wait(self, host: str):
+        lock = self.locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            now = time.monotonic()
+            start = max(now, self.next_start.get(host, now))
+            self.next_start[host] = start + self.min_interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+class AcquisitionRunner:
+    """
+    ブロッキングな取得処理をスレッドで実行し、全体の同時実行数・ホストごとの間隔・再試行を管理する。
+    """
+    def __init__(self, max_concurrency: int = settings.ACQ_MAX_CONCURRENCY,
+                 host_min_interval: float = settings.ACQ_HOST_MIN_INTERVAL,
+                 retries: int = settings.ACQ_RETRIES, backoff: float = settings.ACQ_BACKOFF_BASE,
+                 max_backoff: float = settings.ACQ_BACKOFF_MAX):
+        self.budget = asyncio.Semaphore(max_concurrency)
+        self.limiter = HostRateLimiter(host_min_interval)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.stats = {"calls": 0, "retries": 0, "failures": 0}
+
+    async def call(self, host: str, func, *args, is_failure=None, **kwargs):
+        """
+        func(*args, **kwargs) をスレッドで実行する。例外（または is_failure(結果) が真）のときは
+        指数バックオフ＋ジッターで再試行し、回数を使い切ったら最後の例外を送出する（is_failure の場合は結果を返す）。
+        """
+        for attempt in range(self.retries + 1):
+            async with self.budget:
+                await self.limiter.wait(host)
+                self.stats["calls"] += 1
+                try:
+                    result = await asyncio.to_thread(func, *args, **kwargs)
+                    error = None
+                except Exception as e:
+                    result, error = None, e
+            failed = error is not None or (is_failure is not None and is_failure(result))
+            if not failed:
+                return result
+            if attempt == self.retries:
+                self.stats["failures"] += 1
+                if error is not None:
+                    raise error
+                return result
+            self.stats["retries"] += 1
+            delay = min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.5)
+            await asyncio.sleep(delay)
+
+
+async def acquire_estat(runner: AcquisitionRunner, scraper):
+    """
+    e-Stat の一覧ページを取得し、対象のワークブックをダウンロードする。
+    """
+    started = time.perf_counter()
+    # scrape_excel_links も download_file も例外を送出しないので、失敗は戻り値で判定する
+    # （一覧ページの取得に失敗すると空のリストが返る）
+    pages = await asyncio.gather(*[
+        runner.call(urlparse(url).netloc, scraper.scrape_excel_links, url, is_failure=lambda links: not links)
+        for url in scraper.base_urls])
+    targets = []
+    for i, items in enumerate(pages):
+        print(f"▶ {scraper.base_urls[i]} → Found {len(items)} EXCEL links")
+        targets.extend(scraper.select_targets(i, items))
+    sizes = await asyncio.gather(*[
+        runner.call(urlparse(url).netloc, scraper.download_file, url, table_name, year, is_failure=lambda r: r is None)
+        for url, table_name, year in targets])
+    scraper.print_summary(started, len(pages), sum(len(items) for items in pages), list(sizes))
+
+
+async def acquire_mentions(runner: AcquisitionRunner, source, pool, cache=None):
+    """
+    1つのソースの言及件数を産業ごとに取得してチェックポイントに追記し、表を返す。
+    ブラウザの空きを待つスレッドが全体の同時実行枠をふさがないように、同時に取得するクエリ数を pool.size までに抑える。
+    """
+    import main_scrapeminutes as minutes
+
+    host = urlparse(source.build_yonalog_url([])).netloc
+    checkpoint, todo = minutes.plan_mention_queries(source)
+    slots = asyncio.Semaphore(pool.size)
+
+    async def fetch(industry_id, industry):
+        try:
+            async with slots:
+                df = await runner.call(host, source.get_industry_mention_counts, industry, pool, cache)
+        except Exception as e:
+            print(f"Error processing {industry_id} ({industry}): {e}")
+            return
+        # イベントループのスレッドで追記するので、書き込みが混ざらない
+        checkpoint.append(industry_id, minutes.id2industries_dict[industry_id], df)
+
+    async with asyncio.TaskGroup() as group:
+        for industry_id, industry in todo.items():
+            group.create_task(fetch(industry_id, industry))
+    return minutes.assemble_mention_table(checkpoint)
+
+
+async def acquire_all(sources: list, use_cache: bool = True):
+    """
+    指定されたソースを独立に並行取得する。あるソースが失敗しても他のソースは続行する。
+    """
+    runner = AcquisitionRunner()
+    jobs = {}
+    pools = {}
+    cache = None
+    mention_sources = [s for s in sources if s in ("gijiroku", "kokkai")]
+    if "estat" in sources:
+        import data_processor
+        # 再試行はランナーに任せるので、セッション側では再試行しない
+        scraper = data_processor.DataScraper(settings.BASE_URLs_scrape, settings.DOWNLOAD_DIR, settings.YEARS_TO_SCRAPE,
+                                             http_retries=0)
+        jobs["estat"] = acquire_estat(runner, scraper)
+    if mention_sources:
+        import main_scrapeminutes as minutes
+        cache = minutes.MentionCache() if use_cache else None
+        # ソースごとに別のブラウザプールを使う
+        for name in mention_sources:
+            pools[name] = minutes.BrowserPool()
+            jobs[name] = acquire_mentions(runner, getattr(minutes, name), pools[name], cache)
+
+    started = time.perf_counter()
+    try:
+        results = await asyncio.gather(*jobs.values(), return_exceptions=True)
+    finally:
+        for pool in pools.values():
+            pool.close()
+    results = dict(zip(jobs, results))
+    for name, result in results.items():
+        if isinstance(result, BaseException):
+            print(f"✗ {name}: {result!r}")
+
+    if mention_sources:
+        tables = {name: r for name, r in results.items() if name in mention_sources and not isinstance(r, BaseException)}
+        minutes.save_mention_tables(tables.get("gijiroku"), tables.get("kokkai"))
+        if cache is not None:
+            cache.report()
+            cache.close()
+    print(f"\n✓ Acquisition finished in {time.perf_counter() - started:.1f}s "
+          f"({runner.stats['calls']} calls, {runner.stats['retries']} retries, {runner.stats['failures']} failures)")
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="データ取得（e-Stat・議事録・国会会議録）を並行実行する")
+    parser.add_argument("--sources", nargs="+", choices=["estat", "gijiroku", "kokkai"],
+                        default=["estat", "gijiroku", "kokkai"])
+    parser.add_argument("--no-cache", action="store_true", help="言及件数のクエリキャッシュを使わない")
+    return parser.parse_args(argv)
+
+
+def main(args=None):
+    args = args or parse_args()
+    asyncio.run(acquire_all(args.sources, use_cache=not args.no_cache))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,510 @@
+# benchmark.py
+# パイプラインの各処理の速度を計測するスクリプト。リポジトリのルートで実行する。
+#   python src/benchmark.py labor-parse
+#   python src/benchmark.py storage
+#   python src/benchmark.py panel-assembly
+#   python src/benchmark.py importtime [--ref <git revision>]
+#   python src/benchmark.py regression-prep
+#   python src/benchmark.py spec-grid
+#   python src/benchmark.py resampling
+#   python src/benchmark.py clean-read
+#   python src/benchmark.py panel-get
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+import settings
+
+
+@contextmanager
+def count_xlrd_parses():
+    """
+    xlrd.open_workbook の呼び出し回数（= ワークブックのパース回数）を数える。
+    """
+    import xlrd
+    original = xlrd.open_workbook
+    counter = {"parses": 0}
+
+    def counting_open_workbook(*args, **kwargs):
+        counter["parses"] += 1
+        return original(*args, **kwargs)
+
+    xlrd.open_workbook = counting_open_workbook
+    try:
+        yield counter
+    finally:
+        xlrd.open_workbook = original
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def print_table(rows: list, columns: list):
+    print(pd.DataFrame(rows, columns=columns).to_string(index=False, float_format=lambda v: f"{v:.1f}"))
+
+
+### labor-parse ###
+
+def bench_labor_parse(args):
+    """
+    労働者数ワークブック1冊あたりのパース回数と処理時間を、旧方式（シートごとに read_excel）と比較する。
+    """
+    import data_processor
+
+    class LegacyLaborNumberCleaner(data_processor.LaborNumberCleaner):
+        # 旧実装: ExcelFile でシート名を取得した後、シートごとにファイルを開き直す
+        def read_sheets(self, full_path):
+            xls = pd.ExcelFile(full_path, engine='xlrd')
+            for sheet in xls.sheet_names:
+                yield sheet, pd.read_excel(full_path, sheet_name=sheet, engine='xlrd', header=[0, 1], skiprows=0)
+
+    cleaners = {
+        "before": LegacyLaborNumberCleaner(settings.DOWNLOAD_DIR, settings.CLEAND_DIR),
+        "after": data_processor.LaborNumberCleaner(settings.DOWNLOAD_DIR, settings.CLEAND_DIR),
+    }
+    tasks = [(fp, data_processor.extract_year(fp)) for fp in sorted(os.listdir(settings.DOWNLOAD_DIR))
+             if settings.LABOR_NUMBER_FILE_KEY in fp and data_processor.extract_year(fp)]
+
+    rows = []
+    for file_path, year in tasks:
+        row = [year]
+        for name, cleaner in cleaners.items():
+            best = float("inf")
+            for _ in range(args.repeat):
+                with count_xlrd_parses() as counter:
+                    _, elapsed = timed(cleaner.clean_workbook, file_path, year)
+                best = min(best, elapsed)
+            row += [counter["parses"], best * 1000]
+        rows.append(row)
+    print_table(rows, ["year", "parses_before", "ms_before", "parses_after", "ms_after"])
+    total = pd.DataFrame(rows).sum()
+    print(f"\nTotal: {int(total[1])} → {int(total[3])} parses, {total[2]:.0f} ms → {total[4]:.0f} ms")
+
+
+### clean-read ###
+
+def peak_memory(func, *args):
+    """func を実行し、(結果, 秒, Python のヒープのピーク KiB) を返す。"""
+    import tracemalloc
+    tracemalloc.start()
+    try:
+        result, seconds = timed(func, *args)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, seconds, peak / 1024
+
+
+def bench_clean_read(args):
+    """
+    第10表・第11表の年ごとのワークブックについて、read_excel でシート全体を読む方法と、
+    必要なセルだけを直接読む方法の処理時間とメモリのピークを比較する。
+    """
+    import layouts
+    import storage
+
+    tables = [(settings.RESEARCH_EXPENSE_FILE_KEY, layouts.RESEARCH_EXPENSE_LAYOUTS),
+              (settings.PATENT_COUNT_FILE_KEY, layouts.PATENT_COUNT_LAYOUTS)]
+    rows = []
+    for key, table_layouts in tables:
+        for filename in sorted(os.listdir(settings.DOWNLOAD_DIR)):
+            if key not in filename:
+                continue
+            year = int(re.search(r"_(\d{4})", filename).group(1))
+            path = os.path.join(settings.DOWNLOAD_DIR, filename)
+            layout = layouts.layout_for(table_layouts, year)
+            row = [key[:4], year]
+            results = []
+            for reader in [layouts.read_with_pandas, layouts.read_layout]:
+                best = min(timed(reader, path, layout)[1] for _ in range(args.repeat))
+                result, _, peak = peak_memory(reader, path, layout)
+                results.append(storage.to_typed_frame(result))
+                row += [best * 1000, peak]
+            pd.testing.assert_frame_equal(*results, check_dtype=False)
+            rows.append(row + [row[2] / row[4]])
+    df = pd.DataFrame(rows, columns=["table", "year", "pandas_ms", "pandas_peak_kib", "cells_ms", "cells_peak_kib",
+                                     "speedup"])
+    print(df.to_string(index=False, float_format=lambda v: f"{v:.1f}"))
+    print(f"\n合計: pandas {df['pandas_ms'].sum():.0f} ms → cells {df['cells_ms'].sum():.0f} ms, "
+          f"ピークの中央値 {df['pandas_peak_kib'].median():.0f} KiB → {df['cells_peak_kib'].median():.0f} KiB")
+
+
+### storage ###
+
+def bench_storage(args):
+    """
+    クリーニング済みテーブルとパネルデータを CSV / Parquet で保存し、サイズと読み込み時間を比較する。
+    """
+    import tempfile
+    import data_processor
+    import storage
+
+    tables = {key: data_processor.PanelDataProducer.load_cleaned_data(key) for key in [
+        settings.LABOR_NUMBER_FILE_KEY, settings.RESEARCH_EXPENSE_FILE_KEY, settings.PATENT_COUNT_FILE_KEY]}
+    tables["panel"] = {settings.PANEL_DATA_NAME: storage.load_panel_data()}
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, df_dict in tables.items():
+            row = [name[:12]]
+            for backend in [storage.CsvStorage(), storage.get_storage("parquet")]:
+                directory = os.path.join(tmp_dir, backend.name, name)
+                paths = [backend.save(df, directory, key) for key, df in df_dict.items()]
+                best = min(timed(lambda: [backend.load(p) for p in paths])[1] for _ in range(args.repeat))
+                row += [sum(os.path.getsize(p) for p in paths) / 1024, best * 1000]
+            rows.append(row)
+    print_table(rows, ["table", "csv_kb", "csv_load_ms", "parquet_kb", "parquet_load_ms"])
+
+
+### panel-assembly ###
+
+def synthetic_cleaned_tables(n_years: int, n_industries: int, seed: int = 0):
+    """
+    実在の産業名（足りない分は架空の名前）で、研究開発費と特許のクリーニング済みテーブルを合成する。
+    """
+    import numpy as np
+    from industries import id2industries_dict
+
+    rng = np.random.default_rng(seed)
+    names = list(id2industries_dict.values())
+    names = (names + [f"架空産業{i}" for i in range(n_industries)])[:n_industries]
+    research_dict, patent_dict = {}, {}
+    for year in range(2000, 2000 + n_years):
+        ints = lambda: rng.integers(1, 10**6, n_industries)
+        research_dict[year] = pd.DataFrame({
+            "産業": names, "企業数": ints(), "研究開発_売上高（百万円）": ints(), "研究開発_研究開発費_計": ints()})
+        patent_dict[year] = pd.DataFrame({
+            "産業": names, "特許権_企業数": ints(), "特許権_件数_所有数": ints(),
+            "実用新案権_企業数": ints(), "実用新案権_件数_所有数": ints(),
+            "意匠権_企業数": ints(), "意匠権_件数_所有数": ints()})
+    return research_dict, patent_dict
+
+
+def legacy_assemble_panel(research_dict: dict, patent_dict: dict) -> pd.DataFrame:
+    """
+    旧実装: 年ごとにマージした後、iterrows で1行ずつ産業IDを解決して行を組み立てる。
+    """
+    import data_processor
+    from industries import get_industries_id, get_industries_name
+
+    producer = data_processor.PanelDataProducer
+    rows = []
+    for year, r_and_d_df in research_dict.items():
+        patent_df = patent_dict.get(year)
+        if patent_df is None:
+            continue
+        merged = pd.merge(r_and_d_df.rename(columns=producer.RESEARCH_COLUMNS),
+                          patent_df.rename(columns=producer.PATENT_COLUMNS), on="industry_name", how="inner")
+        for _, row in merged.iterrows():
+            industry_id = get_industries_id(row["industry_name"])
+            rows.append({"year": year, "industry_name": get_industries_name(industry_id), "industry_id": industry_id,
+                         **{jp: row.get(col) for col, jp in producer.PANEL_COLUMNS.items()}})
+    return pd.DataFrame(rows, columns=["year", "industry_name", "industry_id", *producer.PANEL_COLUMNS.values()])
+
+
+def bench_panel_assembly(args):
+    """
+    パネルデータの組み立て（iterrows 版とベクトル化版）を、年数×産業数を増やしながら比較する。
+    """
+    import data_processor
+
+    rows = []
+    for n_years, n_industries in [(12, 160), (50, 160), (50, 1000), (100, 2000)]:
+        research_dict, patent_dict = synthetic_cleaned_tables(n_years, n_industries)
+        legacy, legacy_s = timed(legacy_assemble_panel, research_dict, patent_dict)
+        panel, vectorized_s = timed(data_processor.PanelDataProducer.assemble_panel, research_dict, patent_dict)
+        pd.testing.assert_frame_equal(legacy.astype(str), panel.astype(str))
+        rows.append([n_years, n_industries, len(panel), legacy_s * 1000, vectorized_s * 1000, legacy_s / vectorized_s])
+    print_table(rows, ["years", "industries", "rows", "iterrows_ms", "vectorized_ms", "speedup"])
+
+
+### regression-prep ###
+
+def synthetic_analysis_frame(n_industries: int, n_years: int, seed: int = 0) -> pd.DataFrame:
+    """
+    run_regressions の前処理後と同じ列・型のデータを、産業数×年数に拡大して合成する。
+    産業IDは実在の形式（3桁の数字と英字）をまねて、大分類ごとに多数の産業がまとまるようにする。
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    letters = [chr(c) for c in range(ord("A"), ord("Z") + 1)]
+    ids = [f"{i % 9 + 1}{i // 9:05d}" if i % 4 else f"{letters[i % 26]}{i}" for i in range(n_industries)]
+    n = n_industries * n_years
+    df = pd.DataFrame({
+        "year": np.tile(np.arange(2000, 2000 + n_years), n_industries),
+        "industry_name": np.repeat([f"産業{i}" for i in range(n_industries)], n_years),
+        "industry_id": np.repeat(ids, n_years),
+    })
+    for col in ["company_count", "r_and_d_sales", "r_and_d_total", "patent_count", "utility_count", "design_count"]:
+        df[col] = pd.array(rng.integers(1, 10**6, n), dtype="Int64")
+    return df
+
+
+def synthetic_industry_major(industry_id: str) -> int:
+    """合成データの産業IDをまとめるグループ（回帰と同じ IndustryHierarchy.code_group）。"""
+    from industries import IndustryHierarchy
+    return IndustryHierarchy.code_group(industry_id)
+
+
+def legacy_panel_variables(analysis_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    旧実装: industry_id ごとに apply で大分類を求め、groupby.apply のコールバックで変数を作る。
+    """
+    analysis_df = analysis_df.copy()
+    analysis_df["industry_major"] = analysis_df["industry_id"].apply(synthetic_industry_major)
+    analysis_df = analysis_df.sort_values(["industry_major", "year"])
+
+    def create_panel_variables(group):
+        group["patent_diff"] = group["patent_count"].diff()
+        group["patent_intensity"] = group["patent_diff"] / group["r_and_d_sales"]
+        group["rd_intensity"] = group["r_and_d_total"] / group["r_and_d_sales"]
+        group["company_count_norm"] = group["company_count"] / group["r_and_d_sales"]
+        group["utility_intensity"] = group["utility_count"] / group["r_and_d_sales"]
+        group["design_intensity"] = group["design_count"] / group["r_and_d_sales"]
+        group["rd_intensity_lag1"] = group["rd_intensity"].shift(1)
+        group["rd_intensity_lag2"] = group["rd_intensity"].shift(2)
+        group["company_count_lag1"] = group["company_count_norm"].shift(1)
+        group["utility_count_lag1"] = group["utility_intensity"].shift(1)
+        group["design_count_lag1"] = group["design_intensity"].shift(1)
+        return group
+
+    return analysis_df.groupby("industry_major").apply(create_panel_variables).reset_index(drop=True)
+
+
+def vectorized_panel_variables(analysis_df: pd.DataFrame) -> pd.DataFrame:
+    import regression
+
+    analysis_df = analysis_df.copy()
+    majors = {industry_id: synthetic_industry_major(industry_id) for industry_id in analysis_df["industry_id"].unique()}
+    analysis_df["industry_major"] = analysis_df["industry_id"].map(majors)
+    analysis_df = analysis_df.sort_values(["industry_major", "year"])
+    return regression.create_panel_variables(analysis_df)
+
+
+def bench_regression_prep(args):
+    """
+    回帰の前処理（産業大分類の付与と差分・比率・ラグ変数の作成）を、旧実装とベクトル化版で比較する。
+    """
+    import warnings
+    import regression  # noqa: F401  読み込み時間を計測に含めない
+
+    rows = []
+    for n_industries, n_years in [(160, 20), (1000, 30), (5000, 50)]:
+        df = synthetic_analysis_frame(n_industries, n_years)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            legacy, legacy_s = timed(legacy_panel_variables, df)
+        best = min(timed(vectorized_panel_variables, df)[1] for _ in range(args.repeat))
+        pd.testing.assert_frame_equal(legacy, vectorized_panel_variables(df))
+        rows.append([n_industries, n_years, len(df), legacy_s * 1000, best * 1000, legacy_s / best])
+    print_table(rows, ["industries", "years", "rows", "apply_ms", "vectorized_ms", "speedup"])
+
+
+### panel-get ###
+
+def bench_panel_get(args):
+    """
+    (industry_id, year) で行を引く処理を、毎回ブールマスクで絞り込む方法と PanelStore.get で比較する。
+    1回の問い合わせは産業5つ × 3年分。
+    """
+    import numpy as np
+    import storage
+
+    rows = []
+    for n_industries, n_years in [(160, 20), (1000, 30), (5000, 50)]:
+        df = synthetic_analysis_frame(n_industries, n_years)
+        rng = np.random.default_rng(0)
+        ids = df["industry_id"].unique()
+        queries = [(list(rng.choice(ids, 5, replace=False)), [2000 + n_years - 1 - k for k in range(3)])
+                   for _ in range(200)]
+
+        def masked():
+            return [df[df["industry_id"].isin(q_ids) & df["year"].isin(q_years)] for q_ids, q_years in queries]
+
+        store, build_s = timed(storage.PanelStore, df, verbose=False)
+
+        def indexed():
+            return [store.get(q_ids, q_years) for q_ids, q_years in queries]
+
+        mask_best = min(timed(masked)[1] for _ in range(args.repeat))
+        get_best = min(timed(indexed)[1] for _ in range(args.repeat))
+        for expected, result in zip(masked(), indexed()):
+            pd.testing.assert_frame_equal(expected.reset_index(drop=True), result.reset_index(drop=True))
+        rows.append([n_industries, n_years, len(df), build_s * 1000, mask_best / len(queries) * 1e6,
+                     get_best / len(queries) * 1e6, mask_best / get_best])
+    print_table(rows, ["industries", "years", "rows", "build_ms", "mask_us", "get_us", "speedup"])
+
+
+def bench_spec_grid(args):
+    """
+    定式化グリッド（ラグの組 × 効果 × 共分散推定量）の推定を、PanelOLS を1つずつ当てはめる場合と比較する。
+    """
+    import warnings
+    import estimation
+    import regression
+    from linearmodels import PanelOLS
+
+    def panelols_loop(panel, specs):
+        for spec in specs:
+            data = panel.dropna(subset=[spec.dependent, *spec.regressors])
+            entity, time = estimation.EFFECTS[spec.effects]
+            options = {"cluster_entity": True} if spec.cov_type == "clustered" else {}
+            PanelOLS(data[spec.dependent].astype(float), data[list(spec.regressors)].astype(float),
+                     entity_effects=entity, time_effects=time).fit(cov_type=spec.cov_type, **options)
+
+    rows = []
+    for n_industries, n_years in [(160, 20), (1000, 30)]:
+        analysis_df = regression.add_lag_columns(
+            vectorized_panel_variables(synthetic_analysis_frame(n_industries, n_years)), "rd_intensity", range(1, 5))
+        panel = analysis_df.set_index(["industry_major", "year"])
+        specs = estimation.specification_grid(["patent_intensity"], regression.grid_lag_sets(4),
+                                              ["entity", "twoway"], ["clustered", "robust", "unadjusted"])
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            _, loop_s = timed(panelols_loop, panel, specs)
+        best = min(timed(estimation.fit_grid, panel, specs)[1] for _ in range(args.repeat))
+        rows.append([n_industries, n_years, len(specs), loop_s * 1000, best * 1000, loop_s / best])
+    print_table(rows, ["industries", "years", "specs", "panelols_ms", "grid_ms", "speedup"])
+
+
+def bench_resampling(args):
+    """
+    ワイルド・クラスタ・ブートストラップと並べ替え検定の1秒あたりの複製数を、複製ごとに推定し直す素朴な実装と比較する。
+    """
+    import numpy as np
+    import estimation
+
+    def naive_wild_bootstrap(problem, reps, seed):
+        rng = np.random.default_rng(seed)
+        x, ids = problem["x"], problem["entity_ids"]
+        stats = []
+        for _ in range(reps):
+            v = rng.choice(estimation.BOOTSTRAP_WEIGHTS["webb"], size=ids.max() + 1)
+            y = problem["fitted"] + problem["resid"] * v[ids]
+            beta = np.linalg.lstsq(x, y, rcond=None)[0]
+            scores = np.zeros((ids.max() + 1, x.shape[1]))
+            np.add.at(scores, ids, x * (y - x @ beta)[:, None])
+            cov = problem["xpx_inv"] @ (problem["scale"] * scores.T @ scores) @ problem["xpx_inv"]
+            stats.append(beta[problem["j"]] / np.sqrt(cov[problem["j"], problem["j"]]))
+        return np.array(stats)
+
+    rows = []
+    for n_industries, n_years in [(160, 20), (1000, 30)]:
+        panel = vectorized_panel_variables(synthetic_analysis_frame(n_industries, n_years)).set_index(
+            ["industry_major", "year"])
+        spec = estimation.Specification("patent_intensity", ["rd_intensity_lag1", "rd_intensity_lag2"])
+        sample = estimation.prepare_samples(panel, [spec])[estimation.sample_columns(spec)]
+        problem = estimation.resampling_problem(sample, spec, "rd_intensity_lag1")
+        label = f"{n_industries}x{n_years} (G={sample.n_entities})"
+
+        naive_reps = 200
+        _, naive_s = timed(naive_wild_bootstrap, problem, naive_reps, 0)
+        rows.append([label, "wild (refit per draw)", naive_reps, naive_s * 1000, naive_reps / naive_s])
+        for jobs in sorted({1, settings.RESAMPLING_JOBS}):
+            reps = 99999
+            best = min(timed(estimation.wild_cluster_bootstrap, sample, spec, "rd_intensity_lag1",
+                             reps=reps, jobs=jobs)[1] for _ in range(args.repeat))
+            rows.append([label, f"wild (vectorized, jobs={jobs})", reps, best * 1000, reps / best])
+            reps = 9999
+            best = min(timed(estimation.permutation_test, sample, spec, "rd_intensity_lag1",
+                             reps=reps, jobs=jobs)[1] for _ in range(args.repeat))
+            rows.append([label, f"permutation (vectorized, jobs={jobs})", reps, best * 1000, reps / best])
+    print_table(rows, ["panel", "method", "reps", "ms", "reps_per_s"])
+
+
+### importtime ###
+
+IMPORT_TARGETS = {
+    # main.py --only regression が読み込むもの
+    "regression path": ["main", "regression"],
+    "main": ["main"],
+    "pipeline": ["pipeline"],
+    "data_processor": ["data_processor"],
+    "visualization": ["visualization"],
+    "main_scrapeminutes": ["main_scrapeminutes"],
+}
+HEAVY_PACKAGES = ["selenium", "webdriver_manager", "seaborn", "matplotlib", "japanize_matplotlib",
+                  "bs4", "requests", "tqdm", "linearmodels"]
+
+
+def measure_imports(src_dir: str, modules: list) -> tuple:
+    """
+    新しいプロセスで python -X importtime を実行し、(合計ミリ秒, 読み込まれた重いパッケージ) を返す。
+    """
+    code = "; ".join(f"import {m}" for m in modules)
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=src_dir,
+                          capture_output=True, text=True, env={**os.environ, "MPLBACKEND": "Agg"})
+    if proc.returncode != 0:
+        return None, []
+    total, loaded = 0, set()
+    for line in proc.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)", line)
+        if not match:
+            continue
+        loaded.add(match.group(3).split(".")[0])
+        if len(match.group(2)) == 1:  # トップレベルの import だけを合計する
+            total += int(match.group(1))
+    return total / 1000, [p for p in HEAVY_PACKAGES if p in loaded]
+
+
+def bench_importtime(args):
+    """
+    各モジュールを読み込むだけにかかる時間と、そのとき読み込まれる重い依存を表示する。
+    --ref を指定すると、その git リビジョンの src と比較する。
+    """
+    trees = {"current": os.path.dirname(os.path.abspath(__file__))}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.ref:
+            repo = os.path.dirname(trees["current"])
+            archive = subprocess.run(["git", "-C", repo, "archive", args.ref, "src"], capture_output=True, check=True)
+            subprocess.run(["tar", "-x", "-C", tmp_dir], input=archive.stdout, check=True)
+            trees = {args.ref: os.path.join(tmp_dir, "src"), **trees}
+
+        rows = []
+        for name, modules in IMPORT_TARGETS.items():
+            for tree, src_dir in trees.items():
+                if not all(os.path.exists(os.path.join(src_dir, f"{m}.py")) for m in modules):
+                    continue
+                best, heavy = float("inf"), []
+                for _ in range(args.repeat):
+                    ms, heavy = measure_imports(src_dir, modules)
+                    best = min(best, ms if ms is not None else float("inf"))
+                rows.append([name, tree, best, ", ".join(heavy)])
+    print_table(rows, ["target", "tree", "import_ms", "heavy packages loaded"])
+
+
+BENCHMARKS = {
+    "labor-parse": bench_labor_parse,
+    "storage": bench_storage,
+    "panel-assembly": bench_panel_assembly,
+    "importtime": bench_importtime,
+    "regression-prep": bench_regression_prep,
+    "spec-grid": bench_spec_grid,
+    "resampling": bench_resampling,
+    "clean-read": bench_clean_read,
+    "panel-get": bench_panel_get,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="パイプラインのベンチマーク")
+    parser.add_argument("name", choices=sorted(BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=3, help="各計測の繰り返し回数（最小値を表示）")
+    parser.add_argument("--ref", help="importtime: 比較する git リビジョン")
+    args = parser.parse_args()
+    BENCHMARKS[args.name](args)
+
+
+if __name__ == "__main__":
+    main()
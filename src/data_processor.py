@@ -1,42 +1,189 @@
 # data_processor.py
 
 import os
-import glob
 import shutil
 import time
 import re
-import requests
-import tqdm
+import json
+import hashlib
+import threading
 import pandas as pd
-import numpy as np
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin
-from industries import get_industries_id, get_industries_name
+from urllib.parse import urljoin, urlparse
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+import layouts
+import schema
+from industries import get_industries_id, get_industries_name, industry_resolver
+from storage import PanelStore, get_cleaned_storage, get_storage
 
 # 設定ファイルをインポート
 import settings
 
+# ファイル名から年を取り出す（例: "..._2019.xls", 旧形式 "..._2019_1748253286.xls"）
+YEAR_IN_FILENAME = re.compile(r"_(\d{4})(?:_\d{10,})?\.xls[xm]?$")
+
+def extract_year(filename: str):
+    match = YEAR_IN_FILENAME.search(filename)
+    return int(match.group(1)) if match else None
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class JsonManifest:
+    """
+    キー → メタデータ(dict) を保持するJSONファイル。スレッドセーフに更新し、アトミックに保存する。
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def get(self, key: str):
+        with self.lock:
+            return self.entries.get(key)
+
+    def set(self, key: str, value: dict):
+        with self.lock:
+            self.entries[key] = value
+
+    def pop(self, key: str):
+        with self.lock:
+            return self.entries.pop(key, None)
+
+    def save(self):
+        with self.lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+class CleanManifest(JsonManifest):
+    """
+    クリーニング済みの (テーブル, 年) ごとに、入力ファイルの指紋とクリーナーのバージョンを記録する。
+    キーは "<テーブル>/<年>"。
+    """
+    def fingerprint(self, key: str, path: str, cleaner_version: int) -> dict:
+        stat = os.stat(path)
+        previous = self.get(key) or {}
+        if (previous.get("source") == os.path.basename(path)
+                and previous.get("size") == stat.st_size
+                and previous.get("mtime") == stat.st_mtime):
+            # サイズと更新時刻が同じならハッシュを再計算しない
+            sha256 = previous.get("sha256")
+        else:
+            sha256 = file_sha256(path)
+        return {
+            "source": os.path.basename(path),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "sha256": sha256,
+            "cleaner_version": cleaner_version,
+        }
+
+    def is_current(self, key: str, fingerprint: dict, output_path: str) -> bool:
+        previous = self.get(key)
+        return (previous is not None
+                and os.path.exists(output_path)
+                and previous.get("sha256") == fingerprint["sha256"]
+                and previous.get("cleaner_version") == fingerprint["cleaner_version"])
+
+    def prune(self, table: str, output_dir: str, years: set, extension: str):
+        """
+        入力ファイルがなくなった年の出力と記録を削除する。
+        """
+        for key in [k for k in self.entries if k.startswith(table + "/")]:
+            year = key.split("/")[-1]
+            if year not in years:
+                self.pop(key)
+                output_path = os.path.join(output_dir, f"{year}{extension}")
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+
 class DataScraper:
     """
     指定されたURLからEXCELファイルをスクレイピングしてダウンロードするクラス。
+
+    すべてのリクエストは1つの requests.Session（コネクションプール）を共有し、
+    ホストごとの同時接続数は max_per_host で制限される。
+
+    ダウンロード済みファイルは download_dir/manifest.json に URL ごとの
+    ETag / Last-Modified / SHA-256 と一緒に記録され、次回以降は条件付きGETで
+    変更のないファイルをスキップする。
     """
-    def __init__(self, base_urls, download_dir, years):
+    def __init__(self, base_urls, download_dir, years,
+                 max_workers=settings.SCRAPER_MAX_WORKERS,
+                 max_per_host=settings.SCRAPER_MAX_PER_HOST,
+                 timeout=settings.SCRAPER_TIMEOUT,
+                 http_retries=settings.SCRAPER_HTTP_RETRIES,
+                 session=None):
         self.base_urls = base_urls
         self.download_dir = download_dir
         self.years = years
-        
-        if os.path.exists(self.download_dir):
-            shutil.rmtree(self.download_dir)
-        os.makedirs(self.download_dir)
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.http_retries = http_retries
+        self.session = session if session is not None else self.build_session()
+        self._host_slots = {}
+        self._host_slots_lock = threading.Lock()
+        os.makedirs(self.download_dir, exist_ok=True)
+        self.manifest = JsonManifest(os.path.join(self.download_dir, settings.DOWNLOAD_MANIFEST))
+
+    def build_session(self) -> "requests.Session":
+        """
+        コネクションを再利用するためのプール付きセッションを作成する。
+        http_retries が0なら再試行しない（呼び出し側が再試行する場合）。
+        """
+        # スクレイピング用の依存は、スクレイパーを使うときにだけ読み込む
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.max_per_host,
+            pool_maxsize=self.max_per_host,
+            max_retries=Retry(total=self.http_retries, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+            if self.http_retries else 0,
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def host_slot(self, url: str) -> threading.BoundedSemaphore:
+        """
+        URLのホストに対応するセマフォを返す（ホストごとの同時リクエスト数の上限）。
+        """
+        host = urlparse(url).netloc
+        with self._host_slots_lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._host_slots[host]
+
+    def fetch(self, url: str, **kwargs) -> "requests.Response":
+        """
+        ホストごとのスロットを確保してGETする。本文はスロットを保持したまま読み切る。
+        """
+        with self.host_slot(url):
+            resp = self.session.get(url, timeout=self.timeout, **kwargs)
+            resp.raise_for_status()
+            return resp
 
     def sanitize_filename(self, text: str) -> str:
         name = re.sub(r"\s+", " ", text.strip())
         return re.sub(r'[\\/:"*?<>|]+', "_", name)
 
     def scrape_excel_links(self, page_url: str) -> list:
+        import requests
+        from bs4 import BeautifulSoup
         try:
-            resp = requests.get(page_url)
-            resp.raise_for_status()
+            resp = self.fetch(page_url)
             soup = BeautifulSoup(resp.text, "html.parser")
             results = []
             for span in soup.find_all("span", class_="stat-dl_text"):
@@ -58,234 +205,336 @@ class DataScraper:
             return []
 
     def download_file(self, url: str, table_name: str, year: str):
+        """
+        ファイルを1つダウンロードする。
+        成功時は受信したバイト数（変更なしで304の場合は0）、失敗時は None を返す。
+        """
+        import requests
         ext_match = re.search(r"\.xls[xm]?$", url)
         ext = ext_match.group(0) if ext_match else ".xls"
         safe_name = self.sanitize_filename(table_name)
-        timestamp = int(time.time())
-        filename = f"{safe_name}_{year}_{timestamp}{ext}"
+        filename = f"{safe_name}_{year}{ext}"
         path = os.path.join(self.download_dir, filename)
-        print(f"↓ Downloading {filename}")
+
+        # 前回の記録があれば条件付きGETにする
+        entry = self.manifest.get(url)
+        headers = {}
+        if entry and entry.get("filename") == filename and os.path.exists(path):
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
         try:
-            r = requests.get(url, stream=True)
-            r.raise_for_status()
-            with open(path, "wb") as f:
-                for chunk in r.iter_content(8 * 1024):
-                    f.write(chunk)
+            r = self.fetch(url, headers=headers)
+            if r.status_code == 304:
+                print(f"✓ Unchanged {filename}")
+                return 0
+            sha256 = hashlib.sha256(r.content).hexdigest()
+            if entry and entry.get("sha256") == sha256 and os.path.exists(path):
+                print(f"✓ Unchanged {filename} (same content)")
+            else:
+                print(f"↓ Downloading {filename}")
+                tmp_path = path + ".part"
+                with open(tmp_path, "wb") as f:
+                    f.write(r.content)
+                os.replace(tmp_path, path)
+                self.remove_timestamped_copies(safe_name, year, ext)
+            self.manifest.set(url, {
+                "filename": filename,
+                "table_name": table_name,
+                "year": year,
+                "etag": r.headers.get("ETag"),
+                "last_modified": r.headers.get("Last-Modified"),
+                "sha256": sha256,
+                "size": len(r.content),
+            })
+            return len(r.content)
         except requests.exceptions.RequestException as e:
             print(f"Error downloading {url}: {e}")
         except Exception as e:
             print(f"Error saving {filename}: {e}")
+        return None
+
+    def remove_timestamped_copies(self, safe_name: str, year: str, ext: str):
+        """
+        旧形式（ファイル名末尾にタイムスタンプ付き）の同じファイルを削除する。
+        """
+        pattern = re.compile(rf"{re.escape(safe_name)}_{year}_\d{{10,}}{re.escape(ext)}$")
+        for name in os.listdir(self.download_dir):
+            if pattern.fullmatch(name):
+                os.remove(os.path.join(self.download_dir, name))
+
+    def select_targets(self, page_index: int, items: list) -> list:
+        """
+        ページ内のリンクから対象テーブルだけを (url, table_name, year) にして返す。
+        """
+        if page_index >= len(self.years):
+            # 年とURLの数が合わない場合はスキップ
+            print("Warning: More base URLs than years provided. Skipping year association.")
+            return []
+        year = str(self.years[page_index])
+        return [(url, table_name, year) for url, table_name in items if table_name in settings.TARGET_TABLE_NAMES]
+
+    def print_summary(self, started: float, pages: int, links: int, sizes: list):
+        self.manifest.save()
+        elapsed = time.perf_counter() - started
+        done = [s for s in sizes if s is not None]
+        unchanged = sum(1 for s in done if s == 0)
+        print(f"\n✓ Scraping summary: {pages} pages, {links} EXCEL links, "
+              f"{len(done)}/{len(sizes)} files ok ({unchanged} unchanged, {sum(done) / 1e6:.1f} MB) in {elapsed:.1f}s")
 
     def run_scraper(self):
+        import tqdm
+        started = time.perf_counter()
+        links, sizes = 0, []
         for i, base_url in enumerate(self.base_urls):
             print(f"\n▶ Scraping {base_url}")
             items = self.scrape_excel_links(base_url)
             print(f"  → Found {len(items)} EXCEL links")
-            for url, table_name in tqdm.tqdm(items):
-                if i < len(self.years) and table_name in settings.TARGET_TABLE_NAMES:
-                    self.download_file(url, table_name, str(self.years[i]))
-                else:
-                    # 年とURLの数が合わない場合はスキップ
-                    print("Warning: More base URLs than years provided. Skipping year association.")
-                    # self.download_file(url, table_name, "")
+            links += len(items)
+            for url, table_name, year in tqdm.tqdm(self.select_targets(i, items)):
+                sizes.append(self.download_file(url, table_name, year))
+        self.print_summary(started, len(self.base_urls), links, sizes)
+
+    def run_scraper_concurrent(self):
+        """
+        一覧ページとEXCELファイルをスレッドプールで並行取得する。
+        同時接続数はホストごとに max_per_host までに制限される。
+        """
+        import tqdm
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # 1) 一覧ページを並行取得（結果はページ順で受け取る）
+            pages = list(executor.map(self.scrape_excel_links, self.base_urls))
+            targets = []
+            for i, items in enumerate(pages):
+                print(f"▶ {self.base_urls[i]} → Found {len(items)} EXCEL links")
+                targets.extend(self.select_targets(i, items))
+
+            # 2) ファイルを並行ダウンロード
+            futures = [executor.submit(self.download_file, *target) for target in targets]
+            sizes = [future.result() for future in tqdm.tqdm(as_completed(futures), total=len(futures))]
+        self.print_summary(started, len(pages), sum(len(items) for items in pages), sizes)
 
 class BaseCleaner:
     """
     A base class for cleaning data.
     """
+    # クリーニング処理を変更したら上げる（インクリメンタルモードで全年が再クリーニングされる）
+    CLEANER_VERSION = 2
+    # {最初の年: layouts.HeaderLayout}（年ごとの表のレイアウト）
+    LAYOUTS = None
+    # 文字列の列（それ以外は schema.coerce_table で数値型にする）
+    TEXT_COLUMNS = schema.TEXT_COLUMNS
+
     def __init__(self, download_dir, cleaned_dir):
         self.download_dir = download_dir
         self.cleaned_dir = cleaned_dir
+        self.storage = get_cleaned_storage()
+        self.failures = []
 
-    def clean_data(self, target_file_name: str):
+    def plan(self, target_file_name: str, manifest: CleanManifest = None) -> list:
         """
-        Placeholder for data cleaning method.
+        Prepare the output directory and list the workbooks to clean as (filename, year, fingerprint).
+        With a manifest, workbooks whose source file and cleaner version are unchanged are left out.
         """
-        if os.path.exists(self.cleaned_dir + "/" + target_file_name):
-            shutil.rmtree(self.cleaned_dir + "/" + target_file_name)
-        os.makedirs(self.cleaned_dir + "/" + target_file_name)
+        output_dir = os.path.join(self.cleaned_dir, target_file_name)
+        if manifest is None:
+            if os.path.exists(output_dir):
+                shutil.rmtree(output_dir)
+            os.makedirs(output_dir)
+        else:
+            os.makedirs(output_dir, exist_ok=True)
 
-        df_dict = {}
+        tasks = []
+        years_present = set()
         file_paths = [fp for fp in os.listdir(self.download_dir) if target_file_name in fp]
         for file_path in file_paths:
-            year = int(file_path.split("_")[1])
-            if year < 2020:
-                df = self.clean_data_before_2020(file_path, year)
-            else:
-                df = self.clean_data_after_2020(file_path)
-            df_dict[year] = df
-        return df_dict
-    
-    def clean_data_before_2020(self, filename, year):
+            year = extract_year(file_path)
+            if year is None:
+                print(f"Could not extract year from filename: {file_path}. Skipping.")
+                continue
+            years_present.add(str(year))
+            fingerprint = None
+            if manifest is not None:
+                key = f"{target_file_name}/{year}"
+                fingerprint = manifest.fingerprint(key, os.path.join(self.download_dir, file_path), self.CLEANER_VERSION)
+                if manifest.is_current(key, fingerprint, self.storage.path(output_dir, year)):
+                    continue
+            tasks.append((file_path, year, fingerprint))
+
+        if manifest is not None:
+            manifest.prune(target_file_name, output_dir, years_present, self.storage.extension)
+            print(f"✓ {target_file_name}: {len(tasks)} to clean, {len(years_present) - len(tasks)} unchanged")
+        return tasks
+
+    def clean_workbook(self, filename, year):
         """
-        Placeholder for data cleaning method for years before 2020.
+        Clean one workbook of the table with the layout declared for its year in LAYOUTS.
         """
-        raise NotImplementedError("This method should be overridden in subclasses.")
-    
-    def clean_data_after_2020(self, filename):
+        if self.LAYOUTS is None:
+            raise NotImplementedError("Subclasses should set LAYOUTS or override clean_workbook.")
+        layout = layouts.layout_for(self.LAYOUTS, year)
+        path = os.path.join(self.download_dir, filename)
+        if settings.CLEAN_READER == "pandas":
+            return layouts.read_with_pandas(path, layout)
+        return layouts.read_layout(path, layout)
+
+    def clean_year(self, filename, year):
+        """
+        Clean one workbook and coerce its numeric columns (missing markers → NA, nullable Int64/Float64).
+        Returns None when the workbook produced no table.
         """
-        Placeholder for data cleaning method for years after 2020.
+        df = self.clean_workbook(filename, year)
+        if df is None:
+            return None
+        return schema.coerce_table(df, self.TEXT_COLUMNS, label=filename)
+
+    def clean_data(self, target_file_name: str, manifest: CleanManifest = None):
+        """
+        Clean every workbook of the table and return {year: DataFrame}.
+        With a manifest, only the years whose source file or cleaner version changed are cleaned.
+        A workbook that fails is reported in self.failures and does not stop the others.
         """
-        raise NotImplementedError("This method should be overridden in subclasses.")
+        df_dict = {}
+        for file_path, year, fingerprint in self.plan(target_file_name, manifest):
+            try:
+                df = self.clean_year(file_path, year)
+            except Exception as e:
+                print(f"✗ Error cleaning {file_path}: {e}")
+                self.failures.append((target_file_name, year, repr(e)))
+                continue
+            if df is None:
+                continue
+            df_dict[year] = df
+            if manifest is not None:
+                manifest.set(f"{target_file_name}/{year}", fingerprint)
+        return df_dict
 
 class ResearchExpenseCleaner(BaseCleaner):
     """
     A class to clean and process research expense data.
     """
-    def __init__(self, download_dir, cleaned_dir):
-        super().__init__(download_dir, cleaned_dir)
+    LAYOUTS = layouts.RESEARCH_EXPENSE_LAYOUTS
 
-    def clean_data_before_2020(self, filename, year):
-        year = int(year)
-        print(filename, year)
-        df = pd.read_excel(os.path.join(self.download_dir, filename), header=1)
-        # Drop all empty columns
-        df = df.dropna(axis=1, how='all')
-
-        # 結合されたセルとコピーが必要な回数
-        merged_headers = {
-            "研究開発": 9,
-            "研究開発投資": 1,
-            "能力開発": 1,
-            "研究開発費": 4,
-            "委託研究開発費（百万円）": 2,
-            "受託研究費（百万円）": 2,
-            "うち、関係会社への委託": 1,
-            "うち、関係会社からの受託": 1
-        }
-        if year == 2010 or year == 2013 or year == 2014:
-            merged_headers['研究開発'] = 10
-            if year == 2010:
-                # Remove rows 0 to 1
-                df = df.iloc[2:].reset_index(drop=True)
-        else:
-            if year < 2011 or year > 2013:
-                # Remove rows 0 to 2
-                df = df.iloc[2:].reset_index(drop=True)
-        if year == 2014:
-            # Remove rows 0 to 1
-            df = df.iloc[2:].reset_index(drop=True)
-    
-        # Remove all whitespaces from the dataframe
-        df.replace(to_replace=r'\s+', value='', regex=True, inplace=True)
-        
-        # Handle merged cells based on merged_headers
-        for key, value in merged_headers.items():
-            # 5行目まではヘッダー行
-            for row in range(5):
-                if key in df.iloc[row].values:
-                    # 結合された行を取得
-                    col_index = df.iloc[row].tolist().index(key)
-                    for i in range(value):
-                        # 結合されたセルの右側の列に値をコピー
-                        # 右側の列が空であれば値をコピー
-                        if pd.isna(df.iloc[row, col_index + i + 1]):
-                            df.iloc[row, col_index + i + 1] = key
-                    break
-        
-        df.iloc[0,0] = "産業"
-        # Process the first five rows to create a single header row
-        header_rows = df.iloc[:5].fillna('').astype(str)
-        header = header_rows.apply(lambda x: '_'.join(x).replace('__', '_').rstrip('_'), axis=0)
-
-        # Update the dataframe with the new header
-        df.columns = header
-        df = df.iloc[5:].reset_index(drop=True)
-
-        df = df.iloc[5:].reset_index(drop=True)
-        df.replace({'X': np.nan, 'x': np.nan, '-': np.nan}, inplace=True)
-        return df   
-
-    # 2020年以降のデータ
-    def clean_data_after_2020(self, filename):
-        df = pd.read_excel(os.path.join(self.download_dir, filename), header=0)
-        # Drop all empty columns
-        df = df.dropna(axis=1, how='all')
-        # drop columns 0, 1, 3
-        df = df.drop(columns=[df.columns[0], df.columns[2], df.columns[3]])
-        df.iloc[0, 0] = "産業"
-        header_rows = df.iloc[:6].fillna('').astype(str)
-        header = header_rows.apply(lambda x: '_'.join(x).replace('__', '_').replace('__', '_').rstrip('_').rstrip('_社'), axis=0)
-        df.columns = header
-        df = df.iloc[5:].reset_index(drop=True)
-        df = df.iloc[7:].reset_index(drop=True)
-        df.replace({'X': np.nan, 'x': np.nan, '-': np.nan}, inplace=True)
-        return df  
 
 class PatentCountCleaner(BaseCleaner):
     """
     A class to clean and process patent count data.
     """
+    LAYOUTS = layouts.PATENT_COUNT_LAYOUTS
+
+
+class LaborNumberCleaner(BaseCleaner):
+    """
+    A class to clean and process labor number (常時従業者数) data.
+    """
     def __init__(self, download_dir, cleaned_dir):
         super().__init__(download_dir, cleaned_dir)
 
-    def clean_data_before_2020(self, filename, year):
-        df = pd.read_excel(os.path.join(self.download_dir, filename), header=1)
-        # Remove all whitespaces from the dataframe
-        df.replace(to_replace=r'\s+', value='', regex=True, inplace=True)
-        df = df.copy()
-        # 結合されたセルとコピーが必要な回数
-        merged_headers = {
-            "特許権": 3,
-            "実用新案権": 3,
-            "意匠権": 3,
-            "件数": 2,
-            "使用のもの（含供与）": 1
-        }
-        
-        if year < 2011 or year > 2013:
-            # remove column 0
-            df = df.drop(columns=df.columns[0])
-        if year >= 2014:
-            df = df.iloc[2:].reset_index(drop=True)
-        
-        # Remove all whitespaces from the dataframe
-        df.replace(to_replace=r'\s+', value='', regex=True, inplace=True)
-        
-        # Handle merged cells based on merged_headers
-        for key, value in merged_headers.items():
-            # 6行目まではヘッダー行
-            for row in range(6):
-                if key in df.iloc[row].values:
-                    # 結合された行を取得
-                    col_index = df.iloc[row].tolist().index(key)
-                    for i in range(value):
-                        # 結合されたセルの右側の列に値をコピー
-                        # 右側の列が空であれば値をコピー
-                        if pd.isna(df.iloc[row, col_index + i + 1]):
-                            df.iloc[row, col_index + i + 1] = key
-                    break
-        
-        # Process the first five rows to create a single header row
-        df.iloc[0,0] = "産業"
-        header_rows = df.iloc[:6].fillna('').astype(str)
-        header = header_rows.apply(lambda x: '_'.join(x).replace('__', '_').replace('__', '_').rstrip('_'), axis=0)
-
-        # Update the dataframe with the new header
-        df.columns = header
-        df = df.iloc[5:].reset_index(drop=True)
-
-        df = df.iloc[6:].reset_index(drop=True)
-        df.replace({'X': np.nan, 'x': np.nan,'Ｘ': np.nan, 'ｘ':np.nan, '***':np.nan, '-': np.nan}, inplace=True)
-        return df   
-
-    # 2020年以降の特許データ
-    def clean_data_after_2020(self, filename):
-        df = pd.read_excel(os.path.join(self.download_dir, filename), header=0)
-        # Drop all empty columns
-        df = df.dropna(axis=1, how='all')
-        # drop columns 0, 1, 3
-        df = df.drop(columns=[df.columns[0], df.columns[2], df.columns[3]])
-        df.iloc[0,0] = "産業"
-        header_rows = df.iloc[:6].fillna('').astype(str)
-        header = header_rows.apply(lambda x: '_'.join(x).replace('__', '_').replace('__', '_').rstrip('_').rstrip('_社'), axis=0)
-        header = header.str.replace('特許権_件数_所有数_件', '特許権_件数_所有数', regex=True)
-
-        df.columns = header
-        df = df.iloc[5:].reset_index(drop=True)
-        df = df.iloc[7:].reset_index(drop=True)
-        df.replace({'X': np.nan, 'x': np.nan,'Ｘ': np.nan,'ｘ':np.nan, '***':np.nan, '-': np.nan}, inplace=True)
-        return df  
+    def read_sheets(self, full_path):
+        """
+        Open the workbook once and yield (sheet_name, DataFrame) for each sheet.
+        Sheets are parsed lazily from the already-open book, so the file is parsed only once.
+        """
+        # 2. Open the workbook and list sheets
+        try:
+            xls = pd.ExcelFile(full_path, engine='xlrd')
+        except Exception as e:
+            print(f"Error opening Excel file {full_path} with xlrd: {e}. Trying openpyxl.")
+            try:
+                xls = pd.ExcelFile(full_path, engine='openpyxl')
+            except Exception as e_opxl:
+                print(f"Error opening Excel file {full_path} with openpyxl: {e_opxl}. Skipping.")
+                return
+
+        with xls:
+            print("Available sheets:", xls.sheet_names)
+            for sheet in xls.sheet_names:
+                try:
+                    df = xls.parse(sheet, header=[0, 1], skiprows=0)
+                except Exception as e:
+                    print(f"Error reading sheet {sheet} from {full_path}: {e}. Skipping sheet.")
+                    continue
+                yield sheet, df
+
+    def clean_workbook(self, filename, year):
+        """
+        Clean one labor workbook. Returns None when no sheet could be read.
+        """
+        year = str(year)
+        full_path = os.path.join(self.download_dir, filename)
+        cleaned = None
+        # 3. Read and clean each sheet into a DataFrame
+        for sheet, df in self.read_sheets(full_path):
+            df.dropna(how='all', inplace=True)
+            df.dropna(axis=1, how='all', inplace=True)
+
+            if isinstance(df.columns, pd.MultiIndex):
+                df.columns = [
+                    "_".join([str(c).strip() for c in col if str(c).strip()])
+                    for col in df.columns.values
+                ]
+            else:
+                df.columns = [str(col).strip() for col in df.columns]
+
+            if year == "2004" or year == "2005":
+                merged_headers = df.iloc[1:5].fillna('').astype(str).agg(' '.join, axis=0).str.strip()
+                df = df.iloc[5:] 
+                df.columns = merged_headers
+                df.columns.values[0] = "年度"
+                df.insert(0, "産業", None)
+                df.loc[~df.iloc[:, 1].str.contains("年度", na=False), "産業"] = df.iloc[:, 1]
+                df.loc[~df.iloc[:, 1].str.contains("年度", na=False), df.columns[1]] = None
+                df.iloc[:, 0] = df.iloc[:, 0].ffill()
+                df = df.dropna(subset=[df.columns[1]])
+            elif year == "2007":
+                merged_headers = df.iloc[1:4].fillna('').astype(str).agg(' '.join, axis=0).str.strip()
+                df = df.iloc[4:] 
+                df.columns = merged_headers
+                df.columns.values[0] = "産業"
+                df.columns.values[1] = "年度"
+                df.iloc[:, 0] = df.iloc[:, 0].ffill()
+                df = df.drop(df.columns[2], axis=1)
+            elif year == "2009" or year == "2011" or year == "2012" or year == "2013":
+                merged_headers = df.iloc[0:3].fillna('').astype(str).agg(' '.join, axis=0).str.strip()
+                df = df.iloc[3:] 
+                df.columns = merged_headers
+                df.columns.values[0] = "産業"
+                df.columns.values[1] = "年度"
+                df.iloc[:, 0] = df.iloc[:, 0].ffill()
+            elif int(year) >= 2020:
+                merged_headers = df.iloc[0:1].fillna('').astype(str).agg(' '.join, axis=0).str.strip()
+                df = df.iloc[3:] 
+                df.columns = merged_headers
+                df.columns.values[1] = "産業"
+                df.columns.values[3] = "年度"
+                df = df.drop(df.columns[0], axis=1)
+            else: 
+                merged_headers = df.iloc[2:5].fillna('').astype(str).agg(' '.join, axis=0).str.strip()
+                df = df.iloc[5:] 
+                df.columns = merged_headers
+                df.columns.values[0] = "産業"
+                df.columns.values[1] = "年度"
+                df.iloc[:, 0] = df.iloc[:, 0].ffill()
+                df = df.dropna(subset=[df.columns[1]])
+                if year == "2003" or year == "2006" or year == "2008": 
+                    df = df.drop(df.columns[2], axis=1)
+            
+            try:    
+                df.iloc[:, 1] = df.iloc[:, 1].str.strip()
+            except AttributeError:
+                pass
+            
+            cleaned = df
+
+        return cleaned
+
+def clean_workbook_task(cleaner_class, download_dir, cleaned_dir, filename, year):
+    """
+    プロセスプールの各ワーカーで1ワークブックをクリーニングする（pickle可能なトップレベル関数）。
+    """
+    return cleaner_class(download_dir, cleaned_dir).clean_year(filename, year)
 
 class DataCleaner:
     """
@@ -294,161 +543,196 @@ class DataCleaner:
     def __init__(self, download_dir, cleaned_dir):
         self.download_dir = download_dir
         self.cleaned_dir = cleaned_dir
+        self.labor_number_cleaner = LaborNumberCleaner(download_dir, cleaned_dir)
         self.research_expense_cleaner = ResearchExpenseCleaner(download_dir, cleaned_dir)
         self.patent_count_cleaner = PatentCountCleaner(download_dir, cleaned_dir)
+        self.storage = get_cleaned_storage()
+        self.failures = []
         
     def sanitize_filename(self, text: str) -> str:
         name = re.sub(r"\s+", " ", text.strip())
         return re.sub(r'[\\/:"*?<>|]+', "_", name)
+
+    def table_cleaners(self) -> dict:
+        return {
+            settings.LABOR_NUMBER_FILE_KEY: self.labor_number_cleaner,
+            settings.RESEARCH_EXPENSE_FILE_KEY: self.research_expense_cleaner,
+            settings.PATENT_COUNT_FILE_KEY: self.patent_count_cleaner,
+        }
     
-    def clean_all_data(self):
+    def clean_all_data(self, incremental: bool = False, jobs: int = 1):
         """
         ダウンロードされたすべてのデータをクリーニングする。
+        incremental=True の場合、入力ファイルかクリーナーのバージョンが変わった年だけを再クリーニングする。
+        jobs > 1 の場合、(テーブル, 年) ごとのワークブックをプロセスプールで並列にクリーニングする。
         """
-        # 各クリーニング関数を呼び出す
-        self.clean_labor_number_data(target_file_name=settings.LABOR_NUMBER_FILE_KEY)
-        self.ResearchExpenseDict = self.research_expense_cleaner.clean_data(target_file_name=settings.RESEARCH_EXPENSE_FILE_KEY)
-        self.PatentCountDict = self.patent_count_cleaner.clean_data(target_file_name=settings.PATENT_COUNT_FILE_KEY)
-
-        # クリーニング済みデータをCSVファイルとして保存
-        for key, df_to_save in self.ResearchExpenseDict.items():
-            save_dir = os.path.join(self.cleaned_dir, settings.RESEARCH_EXPENSE_FILE_KEY)
-            os.makedirs(save_dir, exist_ok=True)
-            df_to_save.to_csv(os.path.join(save_dir, f"{key}.csv"), index=True)
-            
-        for key, df_to_save in self.PatentCountDict.items():
-            save_dir = os.path.join(self.cleaned_dir, settings.PATENT_COUNT_FILE_KEY)
-            os.makedirs(save_dir, exist_ok=True)
-            df_to_save.to_csv(os.path.join(save_dir, f"{key}.csv"), index=True)
+        manifest = CleanManifest(os.path.join(self.cleaned_dir, settings.CLEAN_MANIFEST)) if incremental else None
 
-    def clean_labor_number_data(self, target_file_name):
+        # 各クリーニング関数を呼び出す
+        if jobs > 1:
+            results = self.clean_in_process_pool(manifest, jobs)
+        else:
+            results = {}
+            for table, cleaner in self.table_cleaners().items():
+                results[table] = cleaner.clean_data(target_file_name=table, manifest=manifest)
+                self.failures.extend(cleaner.failures)
+
+        # クリーニング済みデータを保存（形式は settings.CLEANED_STORAGE_FORMAT）
+        for table, df_dict in results.items():
+            self.save_table(table, df_dict)
+        self.ResearchExpenseDict = results[settings.RESEARCH_EXPENSE_FILE_KEY]
+        self.PatentCountDict = results[settings.PATENT_COUNT_FILE_KEY]
+
+        self.discard_failed(manifest)
+        if manifest is not None:
+            manifest.save()
+        if self.failures:
+            print(f"⚠ {len(self.failures)} workbook(s) failed to clean:")
+            for table, year, error in self.failures:
+                print(f"  - {table} {year}: {error}")
+
+    def discard_failed(self, manifest: CleanManifest = None):
         """
-        Clean the labor number data from Excel files.
+        クリーニングに失敗した年の、前回までの出力と記録を削除する（古い出力が下流で使われないように）。
         """
-        dfs = {}
-        # 1. Get the list of files in the directory
-        # 2. Open the workbook and list sheets
-        # 3. Read and clean each sheet into a DataFrame
-        # 4. Save each DataFrame to a CSV file
-
-        if os.path.exists(self.cleaned_dir + "/" + target_file_name):
-            shutil.rmtree(self.cleaned_dir + "/" + target_file_name)
-        os.makedirs(self.cleaned_dir + "/" + target_file_name)
-
-        filepaths = [fp for fp in os.listdir(self.download_dir) if target_file_name in fp]
-        for file_path in filepaths:
-            year = file_path[-8:-4] # This might need adjustment if timestamp is present
-            # Adjust to find year correctly if filename format changed due to timestamp
-            match = re.search(r"_(\d{4})_\d{10,}\.xls[xm]?$", file_path)
-            if match:
-                year = match.group(1)
-            else:
-                # Fallback or error handling if year cannot be extracted
-                print(f"Could not extract year from filename: {file_path}. Skipping.")
-                continue
-
-            full_path = os.path.join(self.download_dir, file_path)
-            # 2. Open the workbook and list sheets
-            try:
-                xls = pd.ExcelFile(full_path, engine='xlrd')
-            except Exception as e:
-                print(f"Error opening Excel file {full_path} with xlrd: {e}. Trying openpyxl.")
-                try:
-                    xls = pd.ExcelFile(full_path, engine='openpyxl')
-                except Exception as e_opxl:
-                    print(f"Error opening Excel file {full_path} with openpyxl: {e_opxl}. Skipping.")
-                    continue
-
-            print("Available sheets:", xls.sheet_names)
-            # 3. Read and clean each sheet into a DataFrame
-            for sheet in xls.sheet_names:
+        for table, year, _ in self.failures:
+            output_path = self.storage.path(os.path.join(self.cleaned_dir, table), year)
+            if os.path.exists(output_path):
+                os.remove(output_path)
+                print(f"✗ Removed stale {output_path}")
+            if manifest is not None:
+                manifest.pop(f"{table}/{year}")
+
+    def clean_in_process_pool(self, manifest: CleanManifest, jobs: int) -> dict:
+        """
+        (テーブル, 年) ごとに1タスクとしてプロセスプールでクリーニングし、
+        テーブルごとに年順の {year: DataFrame} を返す。失敗した年は self.failures に記録する。
+        """
+        import tqdm
+        results = {table: {} for table in self.table_cleaners()}
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {}
+            for table, cleaner in self.table_cleaners().items():
+                for file_path, year, fingerprint in cleaner.plan(table, manifest):
+                    future = executor.submit(clean_workbook_task, type(cleaner), self.download_dir, self.cleaned_dir, file_path, year)
+                    futures[future] = (table, file_path, year, fingerprint)
+            for future in tqdm.tqdm(as_completed(futures), total=len(futures)):
+                table, file_path, year, fingerprint = futures[future]
                 try:
-                    df = pd.read_excel(
-                        full_path,
-                        sheet_name=sheet,
-                        engine='xlrd' if '.xls' == os.path.splitext(full_path)[1].lower() else 'openpyxl',
-                        header=[0, 1],
-                        skiprows=0
-                    )
+                    df = future.result()
                 except Exception as e:
-                    print(f"Error reading sheet {sheet} from {full_path}: {e}. Skipping sheet.")
+                    print(f"✗ Error cleaning {file_path}: {e}")
+                    self.failures.append((table, year, repr(e)))
                     continue
-                
-                df.dropna(how='all', inplace=True)
-                df.dropna(axis=1, how='all', inplace=True)
-
-                if isinstance(df.columns, pd.MultiIndex):
-                    df.columns = [
-                        "_".join([str(c).strip() for c in col if str(c).strip()])
-                        for col in df.columns.values
-                    ]
-                else:
-                    df.columns = [str(col).strip() for col in df.columns]
-
-                if year == "2004" or year == "2005":
-                    merged_headers = df.iloc[1:5].fillna('').astype(str).agg(' '.join, axis=0).str.strip()
-                    df = df.iloc[5:] 
-                    df.columns = merged_headers
-                    df.columns.values[0] = "年度"
-                    df.insert(0, "産業", None)
-                    df.loc[~df.iloc[:, 1].str.contains("年度", na=False), "産業"] = df.iloc[:, 1]
-                    df.loc[~df.iloc[:, 1].str.contains("年度", na=False), df.columns[1]] = None
-                    df.iloc[:, 0] = df.iloc[:, 0].ffill()
-                    df = df.dropna(subset=[df.columns[1]])
-                elif year == "2007":
-                    merged_headers = df.iloc[1:4].fillna('').astype(str).agg(' '.join, axis=0).str.strip()
-                    df = df.iloc[4:] 
-                    df.columns = merged_headers
-                    df.columns.values[0] = "産業"
-                    df.columns.values[1] = "年度"
-                    df.iloc[:, 0] = df.iloc[:, 0].ffill()
-                    df = df.drop(df.columns[2], axis=1)
-                elif year == "2009" or year == "2011" or year == "2012" or year == "2013":
-                    merged_headers = df.iloc[0:3].fillna('').astype(str).agg(' '.join, axis=0).str.strip()
-                    df = df.iloc[3:] 
-                    df.columns = merged_headers
-                    df.columns.values[0] = "産業"
-                    df.columns.values[1] = "年度"
-                    df.iloc[:, 0] = df.iloc[:, 0].ffill()
-                elif int(year) >= 2020:
-                    merged_headers = df.iloc[0:1].fillna('').astype(str).agg(' '.join, axis=0).str.strip()
-                    df = df.iloc[3:] 
-                    df.columns = merged_headers
-                    df.columns.values[1] = "産業"
-                    df.columns.values[3] = "年度"
-                    df = df.drop(df.columns[0], axis=1)
-                else: 
-                    merged_headers = df.iloc[2:5].fillna('').astype(str).agg(' '.join, axis=0).str.strip()
-                    df = df.iloc[5:] 
-                    df.columns = merged_headers
-                    df.columns.values[0] = "産業"
-                    df.columns.values[1] = "年度"
-                    df.iloc[:, 0] = df.iloc[:, 0].ffill()
-                    df = df.dropna(subset=[df.columns[1]])
-                    if year == "2003" or year == "2006" or year == "2008": 
-                        df = df.drop(df.columns[2], axis=1)
-                
-                try:    
-                    df.iloc[:, 1] = df.iloc[:, 1].str.strip()
-                except AttributeError:
-                    pass
-                
-                dfs[f"{year}"] = df
-
-        for key, df_to_save in dfs.items():
-            df_to_save.to_csv(self.cleaned_dir + "/" + target_file_name + f"/{key}.csv", index=True)
+                if df is None:
+                    continue
+                results[table][year] = df
+                if manifest is not None:
+                    manifest.set(f"{table}/{year}", fingerprint)
+        # 完了順に依存しないよう年順に並べる
+        return {table: dict(sorted(df_dict.items())) for table, df_dict in results.items()}
+
+    def save_table(self, target_file_name: str, df_dict: dict):
+        save_dir = os.path.join(self.cleaned_dir, target_file_name)
+        for key, df_to_save in df_dict.items():
+            self.storage.save(df_to_save, save_dir, key)
+
+    def clean_labor_number_data(self, target_file_name, manifest: CleanManifest = None):
+        """
+        Clean the labor number data from Excel files and save each year.
+        """
+        dfs = self.labor_number_cleaner.clean_data(target_file_name, manifest)
+        self.failures.extend(self.labor_number_cleaner.failures)
+        self.save_table(target_file_name, dfs)
+        return dfs
 
 class PanelDataProducer:
-    def load_data_from_csv(directory_name: str):
-        path = os.path.join(settings.CLEAND_DIR, directory_name, "*.csv")
-        files = glob.glob(path)
+    # 年によって異なる列名を共通の名前にそろえる
+    RESEARCH_COLUMNS = {
+        "産業": "industry_name",
+        "研究開発_研究開発費_計": "r_and_d_total",
+        "研究開発_研究開発費_計_百万円": "r_and_d_total",
+        "研究開発_売上高（百万円）": "r_and_d_sales",
+        "研究開発_売上高_百万円": "r_and_d_sales",
+        "企業数": "company_count",
+        "研究開発_企業数": "company_count"
+    }
+    PATENT_COLUMNS = {
+        "産業": "industry_name",
+        "特許権_企業数": "patent_company_count",
+        "特許権_企業数_社": "patent_company_count",
+        "_特許権_企業数": "patent_company_count",
+        "特許権_件数_所有数": "patent_count",
+        "特許権_件数_所有数_件": "patent_count",
+        "_特許権_件数_所有数": "patent_count",
+        "実用新案権_企業数": "utility_company_count",
+        "実用新案権_企業数_社": "utility_company_count",
+        "実用新案権_件数_所有数": "utility_count",
+        "実用新案権_件数_所有数_件": "utility_count",
+        "意匠権_企業数": "design_company_count",
+        "意匠権_企業数_社": "design_company_count",
+        "意匠権_件数_所有数": "design_count",
+        "意匠権_件数_所有数_件": "design_count"
+    }
+    # 共通の列名 → パネルデータ（日本語版）の列名
+    PANEL_COLUMNS = {
+        "company_count": "企業数",
+        "r_and_d_sales": "研究開発_売上高_百万円",
+        "r_and_d_total": "研究開発_研究開発費_計",
+        "patent_company_count": "特許権_企業数",
+        "patent_count": "特許権_件数_所有数",
+        "utility_company_count": "実用新案権_企業数",
+        "utility_count": "実用新案権_件数_所有数",
+        "design_company_count": "意匠権_企業数",
+        "design_count": "意匠権_件数_所有数",
+    }
+
+    def assemble_panel(research_dict: dict, patent_dict: dict, with_name_match: bool = False) -> pd.DataFrame:
+        """
+        年ごとに研究開発費と特許のテーブルを産業名でマージし、全年を1回の concat でまとめる。
+        産業IDはユニークな産業名ごとに1回だけ解決して列としてマップする。
+        with_name_match=True の場合、元の産業名がIDの名前と（正規化して）一致した行かを name_matched 列に加える。
+        """
+        frames = []
+        for year, r_and_d_df in research_dict.items():
+            patent_df = patent_dict.get(year)
+            if patent_df is None:
+                continue
+            # Merge on industry name
+            merged = pd.merge(
+                r_and_d_df.rename(columns=PanelDataProducer.RESEARCH_COLUMNS),
+                patent_df.rename(columns=PanelDataProducer.PATENT_COLUMNS),
+                on="industry_name", how="inner",
+            )
+            # 存在しない列は欠損値になる。全て欠損の列も型をそろえておく（concat で型が変わらないように）
+            frame = merged.reindex(columns=["industry_name", *PanelDataProducer.PANEL_COLUMNS])
+            frame.insert(0, "year", year)
+            frames.append(schema.apply_panel_schema(frame))
+
+        columns = ["year", "industry_name", "industry_id", *PanelDataProducer.PANEL_COLUMNS.values()]
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        panel_data = pd.concat(frames, ignore_index=True)
+
+        industry_ids = {name: get_industries_id(name) for name in panel_data["industry_name"].unique()}
+        panel_data["industry_id"] = panel_data["industry_name"].map(industry_ids)
+        source_names = panel_data["industry_name"]
+        panel_data["industry_name"] = panel_data["industry_id"].map(get_industries_name)
+        if with_name_match:
+            normalize = industry_resolver.normalize
+            panel_data["name_matched"] = [normalize(str(a).strip()) == normalize(b)
+                                          for a, b in zip(source_names, panel_data["industry_name"])]
+            columns.append("name_matched")
+        return panel_data.rename(columns=PanelDataProducer.PANEL_COLUMNS)[columns]
+
+    def load_cleaned_data(directory_name: str):
+        storage = get_cleaned_storage()
+        files = storage.list(os.path.join(settings.CLEAND_DIR, directory_name))
         if not files:
-            print(f"警告: ディレクトリ '{directory_name}' にCSVファイルが見つかりません。")
+            print(f"警告: ディレクトリ '{directory_name}' に{storage.extension}ファイルが見つかりません。")
             return {}
-        data_dict = {
-            int(os.path.splitext(os.path.basename(f))[0]): pd.read_csv(f, index_col=0)
-            for f in files
-        }
+        # 保存形式によらず、クリーニング時と同じ nullable な数値型で返す
+        data_dict = {int(year): schema.coerce_table(storage.load(f), label=f) for year, f in files.items()}
         return data_dict
 
     def create_panel_data():
@@ -458,101 +742,41 @@ class PanelDataProducer:
         print("--- データ処理を開始します: パネルデータを生成 ---")
 
         # データをロード
-        research_dict = PanelDataProducer.load_data_from_csv(settings.RESEARCH_EXPENSE_FILE_KEY)
-        patent_dict = PanelDataProducer.load_data_from_csv(settings.PATENT_COUNT_FILE_KEY)
-        labor_dict = PanelDataProducer.load_data_from_csv(settings.LABOR_NUMBER_FILE_KEY)
+        research_dict = PanelDataProducer.load_cleaned_data(settings.RESEARCH_EXPENSE_FILE_KEY)
+        patent_dict = PanelDataProducer.load_cleaned_data(settings.PATENT_COUNT_FILE_KEY)
+        labor_dict = PanelDataProducer.load_cleaned_data(settings.LABOR_NUMBER_FILE_KEY)
         if not research_dict or not patent_dict or not labor_dict:
             print("エラー: 必要なデータが読み込めませんでした。処理を中断します。")
             return None, None, None, None
 
         # パネルデータ作成
-        panel_data_list = []
-        rows = []
-        for year, df_research in research_dict.items():
-            r_and_d_df = research_dict[year]
-            patent_df = patent_dict.get(year)
-            if patent_df is None:
-                continue
-            
-            # Standardize column names for merging
-            r_and_d_df = r_and_d_df.rename(columns={
-                "産業": "industry_name",
-                "研究開発_研究開発費_計": "r_and_d_total",
-                "研究開発_研究開発費_計_百万円": "r_and_d_total",
-                "研究開発_売上高（百万円）": "r_and_d_sales",
-                "研究開発_売上高_百万円": "r_and_d_sales",
-                "企業数": "company_count",
-                "研究開発_企業数": "company_count"
-            })
-            patent_df = patent_df.rename(columns={
-                "産業": "industry_name",
-                "特許権_企業数": "patent_company_count",
-                "特許権_企業数_社": "patent_company_count",
-                "_特許権_企業数": "patent_company_count",
-                "特許権_件数_所有数": "patent_count",
-                "特許権_件数_所有数_件": "patent_count",
-                "_特許権_件数_所有数": "patent_count",
-                "実用新案権_企業数": "utility_company_count",
-                "実用新案権_企業数_社": "utility_company_count",
-                "実用新案権_件数_所有数": "utility_count",
-                "実用新案権_件数_所有数_件": "utility_count",
-                "意匠権_企業数": "design_company_count",
-                "意匠権_企業数_社": "design_company_count",
-                "意匠権_件数_所有数": "design_count",
-                "意匠権_件数_所有数_件": "design_count"
-            })
-
-            # Merge on industry name
-            merged = pd.merge(r_and_d_df, patent_df, on="industry_name", how="inner")
-
-            #if not merged:
-             #   print("エラー: マージできるデータがありませんでした。")
-              #  return None, None, None, None
-
-            for _, row in merged.iterrows():
-                industry_id = get_industries_id(row["industry_name"])
-                industry_name = get_industries_name(industry_id)
-                rows.append({
-                    "year": year,
-                    "industry_name": industry_name,
-                    "industry_id": industry_id,
-                    "企業数": row.get("company_count"),
-                    "研究開発_売上高_百万円": row.get("r_and_d_sales"),
-                    "研究開発_研究開発費_計": row.get("r_and_d_total"),
-                    "特許権_企業数": row.get("patent_company_count"),
-                    "特許権_件数_所有数": row.get("patent_count"),
-                    "実用新案権_企業数": row.get("utility_company_count"),
-                    "実用新案権_件数_所有数": row.get("utility_count"),
-                    "意匠権_企業数": row.get("design_company_count"),
-                    "意匠権_件数_所有数": row.get("design_count"),
-                })
-        
-        panel_data = pd.DataFrame(rows, columns=[
-                "year", "industry_name", "industry_id", "企業数", "研究開発_売上高_百万円",
-                "研究開発_研究開発費_計", "特許権_企業数", "特許権_件数_所有数", "実用新案権_企業数",
-                "実用新案権_件数_所有数", "意匠権_企業数", "意匠権_件数_所有数"
-            ])
-        # Remove rows with NaN
-        panel_data = panel_data.replace(["", "ｘ", "x", "Ｘ", "***"], np.nan)
-        panel_data.dropna(inplace=True)
-        # 結果を保存
-        os.makedirs(settings.PANELDATA_DIR, exist_ok=True)
-        save_path = os.path.join(settings.PANELDATA_DIR, 'パネルデータ.csv')            
-        panel_data.to_csv(save_path, index=False)
-        
+        panel_data = PanelDataProducer.assemble_panel(research_dict, patent_dict, with_name_match=True)
+        # 一意に解決できなかった産業名の行は産業ID不明としてパネルデータから除外される
+        for name, candidates in industry_resolver.ambiguous.items():
+            print(f"⚠ 産業名 '{name}' は産業IDが一意に決まらないため除外します（候補: {', '.join(candidates[:5])}）")
+        # 欠損の記号はクリーニング時に NA になっているので、欠損のある行を落とすだけでよい
+        panel_data = panel_data.dropna()
+        name_matched = panel_data.pop("name_matched")
+        japanese_columns = list(panel_data.columns)
         panel_data.columns = [
             "year", "industry_name", "industry_id", "company_count", "r_and_d_sales",
             "r_and_d_total", "patent_company_count", "patent_count",
             "utility_company_count", "utility_count", "design_company_count",
             "design_count"
         ]
-        # Remove rows with NaN
-        panel_data = panel_data.replace(["", "ｘ", "x", "Ｘ", "***"], np.nan)
-        panel_data.dropna(inplace=True)
-        
+        panel_data = schema.apply_panel_schema(panel_data)
+        # (industry_id, year) を一意にする。重複するキーでは、元の産業名がIDの名前と一致した行を優先する
+        panel_data = PanelStore(panel_data, preferred=name_matched).data
+        # 結果を保存（日本語列名の版はCSVエクスポートのみ）
         os.makedirs(settings.PANELDATA_DIR, exist_ok=True)
-        save_path = os.path.join(settings.PANELDATA_DIR, 'panel_data.csv')
-        panel_data.to_csv(save_path, index=False)
+        if settings.EXPORT_PANEL_CSV:
+            save_path = os.path.join(settings.PANELDATA_DIR, 'パネルデータ.csv')
+            panel_data.set_axis(japanese_columns, axis=1).to_csv(save_path, index=False)
+        
+        storage = get_storage()
+        save_path = storage.save(panel_data, settings.PANELDATA_DIR, settings.PANEL_DATA_NAME, index=False)
+        if settings.EXPORT_PANEL_CSV and storage.extension != ".csv":
+            panel_data.to_csv(os.path.join(settings.PANELDATA_DIR, f"{settings.PANEL_DATA_NAME}.csv"), index=False)
     
         print(f"✓ パネルデータを保存しました: {save_path}")
         print("--- データ処理完了 ---")
@@ -0,0 +1,431 @@
+# estimation.py
+# 固定効果パネル回帰を多数の定式化（被説明変数 × ラグの組 × 効果 × 共分散推定量）について一度に推定する。
+# 推定量は linearmodels.PanelOLS（定数項なし、debiased=True）と同じ係数・標準誤差・p値・R² を返す。
+# 同じ標本の定式化は、効果ごとに一度だけ作った demean 済みの行列を共有する。
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+
+import numpy as np
+import pandas as pd
+
+import settings
+
+# 効果の種類 → (entity_effects, time_effects)
+EFFECTS = {
+    "none": (False, False),
+    "entity": (True, False),
+    "time": (False, True),
+    "twoway": (True, True),
+}
+# "clustered" は産業（エンティティ）単位のクラスタ
+COV_TYPES = ("unadjusted", "robust", "clustered")
+
+
+class Specification:
+    """
+    1つの定式化。regressors は説明変数の列名のタプル。
+    """
+    def __init__(self, dependent: str, regressors, effects: str = "entity", cov_type: str = "clustered"):
+        if effects not in EFFECTS:
+            raise ValueError(f"Unknown effects '{effects}'. Choose from {sorted(EFFECTS)}.")
+        if cov_type not in COV_TYPES:
+            raise ValueError(f"Unknown cov_type '{cov_type}'. Choose from {COV_TYPES}.")
+        self.dependent = dependent
+        self.regressors = tuple(regressors)
+        self.effects = effects
+        self.cov_type = cov_type
+
+    @property
+    def name(self) -> str:
+        return f"{self.dependent} ~ {' + '.join(self.regressors)} | {self.effects} | {self.cov_type}"
+
+    def __repr__(self):
+        return f"Specification({self.name})"
+
+
+def specification_grid(dependents, lag_sets, effects=("entity",), cov_types=("clustered",)) -> list:
+    """
+    被説明変数 × ラグの組 × 効果 × 共分散推定量 のすべての組み合わせを返す。
+    """
+    return [Specification(dep, lags, eff, cov) for dep, lags, eff, cov in product(dependents, lag_sets, effects, cov_types)]
+
+
+class PanelSample:
+    """
+    1つの推定標本（欠損のない行）と、効果ごとに demean した行列のキャッシュ。
+    panel_df はエンティティ・時点の MultiIndex を持つこと。
+    """
+    def __init__(self, panel_df: pd.DataFrame, columns: list):
+        data = panel_df[list(columns)].astype(float).dropna()
+        self.columns = list(columns)
+        self.position = {c: i for i, c in enumerate(self.columns)}
+        self.values = data.to_numpy()
+        self.entity_ids = pd.factorize(data.index.get_level_values(0), sort=True)[0]
+        self.time_ids = pd.factorize(data.index.get_level_values(1), sort=True)[0]
+        self.nobs = len(data)
+        self.n_entities = int(self.entity_ids.max()) + 1 if self.nobs else 0
+        self.n_periods = int(self.time_ids.max()) + 1 if self.nobs else 0
+        self.demeaned = {}
+
+    def group_demean(self, values: np.ndarray, ids: np.ndarray, n_groups: int) -> np.ndarray:
+        counts = np.bincount(ids, minlength=n_groups)[:, None]
+        sums = np.zeros((n_groups, values.shape[1]))
+        np.add.at(sums, ids, values)
+        return values - (sums / counts)[ids]
+
+    def transformed(self, effects: str) -> np.ndarray:
+        """
+        効果を取り除いた全列の行列（効果ごとに一度だけ計算する）。
+        二元固定効果はエンティティで demean した後、同じく demean した時点ダミーに射影した残差を使う（非バランスでも厳密）。
+        """
+        if effects not in self.demeaned:
+            entity, time = EFFECTS[effects]
+            values = self.values
+            if entity:
+                values = self.group_demean(values, self.entity_ids, self.n_entities)
+            if time and not entity:
+                values = self.group_demean(values, self.time_ids, self.n_periods)
+            elif time:
+                dummies = np.zeros((self.nobs, self.n_periods))
+                dummies[np.arange(self.nobs), self.time_ids] = 1.0
+                dummies = self.group_demean(dummies, self.entity_ids, self.n_entities)
+                values = values - dummies @ np.linalg.lstsq(dummies, values, rcond=None)[0]
+            self.demeaned[effects] = values
+        return self.demeaned[effects]
+
+    def n_effects(self, effects: str) -> int:
+        # PanelOLS と同じく、定数項がないので最初の効果は全水準を数え、2つ目の効果は1つ落とす
+        entity, time = EFFECTS[effects]
+        return (self.n_entities if entity else 0) + ((self.n_periods - entity) if time else 0)
+
+
+def cov_scale(sample: PanelSample, effects: str, cov_type: str, k: int) -> float:
+    """
+    共分散の自由度調整 nobs / (nobs - 効果の数 - k)。
+    エンティティ固定効果だけをエンティティでクラスタする場合、効果はクラスタに入れ子なので効果の数を数えない。
+    """
+    entity, time = EFFECTS[effects]
+    nested = cov_type == "clustered" and entity and not time
+    extra_df = 0 if nested else sample.n_effects(effects)
+    return sample.nobs / (sample.nobs - extra_df - k)
+
+
+def fit_on_sample(sample: PanelSample, spec: Specification) -> dict:
+    """
+    標本上で1つの定式化を推定し、係数と統計量を dict で返す。
+    """
+    from scipy import stats
+
+    y_col = sample.position[spec.dependent]
+    x_cols = [sample.position[c] for c in spec.regressors]
+    transformed = sample.transformed(spec.effects)
+    y, x = transformed[:, y_col], transformed[:, x_cols]
+    nobs, k = x.shape
+    params = np.linalg.lstsq(x, y, rcond=None)[0]
+    eps = y - x @ params
+
+    n_effects = sample.n_effects(spec.effects)
+    df_resid = nobs - k - n_effects
+    scale = cov_scale(sample, spec.effects, spec.cov_type, k)
+
+    xpx_inv = np.linalg.inv(x.T @ x)
+    if spec.cov_type == "unadjusted":
+        cov = scale * (eps @ eps) / nobs * xpx_inv
+    else:
+        scores = x * eps[:, None]
+        if spec.cov_type == "clustered":
+            sums = np.zeros((sample.n_entities, k))
+            np.add.at(sums, sample.entity_ids, scores)
+            meat = sums.T @ sums
+        else:
+            meat = scores.T @ scores
+        cov = xpx_inv @ (scale * meat) @ xpx_inv
+    cov = (cov + cov.T) / 2
+    std_errors = np.sqrt(np.diag(cov))
+    tstats = params / std_errors
+    pvalues = 2 * (1 - stats.t.cdf(np.abs(tstats), df_resid))
+    crit = stats.t.ppf(0.975, df_resid)
+
+    # R²（PanelOLS と同じ定義。定数項がないので平均を引かない）
+    raw_y, raw_x = sample.values[:, y_col], sample.values[:, x_cols]
+    r2 = 1 - (eps @ eps) / (y @ y)
+    r2_overall = 1 - np.sum((raw_y - raw_x @ params) ** 2) / (raw_y @ raw_y)
+    within = sample.transformed("entity")
+    w_y, w_x = within[:, y_col], within[:, x_cols]
+    r2_within = 1 - np.sum((w_y - w_x @ params) ** 2) / (w_y @ w_y)
+    counts = np.bincount(sample.entity_ids, minlength=sample.n_entities)
+    mean_y = np.bincount(sample.entity_ids, weights=raw_y, minlength=sample.n_entities) / counts
+    mean_x = np.column_stack([np.bincount(sample.entity_ids, weights=raw_x[:, j], minlength=sample.n_entities)
+                              for j in range(k)]) / counts[:, None]
+    r2_between = 1 - np.sum((mean_y - mean_x @ params) ** 2) / (mean_y @ mean_y)
+
+    # 係数がすべてゼロであることの F 検定（均一分散と、推定した共分散によるワルド検定）と対数尤度
+    f_statistic = ((y @ y - eps @ eps) / k) / ((eps @ eps) / df_resid)
+    f_statistic_robust = float(params @ np.linalg.solve(cov, params)) / k
+    loglik = -0.5 * nobs * (np.log(2 * np.pi) + np.log((eps @ eps) / nobs) + 1)
+
+    # 効果がゼロであることの F 検定（Pooled F）
+    f_pooled, f_pooled_pvalue = np.nan, np.nan
+    if n_effects:
+        py, px = raw_y - raw_y.mean(), raw_x - raw_x.mean(axis=0)
+        pooled_eps = py - px @ np.linalg.lstsq(px, py, rcond=None)[0]
+        df_num = n_effects - 1
+        f_pooled = ((pooled_eps @ pooled_eps - eps @ eps) / df_num) / ((eps @ eps) / df_resid)
+        f_pooled_pvalue = float(stats.f.sf(f_pooled, df_num, df_resid))
+
+    return {
+        "params": params, "std_errors": std_errors, "tstats": tstats, "pvalues": pvalues,
+        "ci_lower": params - crit * std_errors, "ci_upper": params + crit * std_errors,
+        "nobs": nobs, "n_entities": sample.n_entities, "n_periods": sample.n_periods, "df_resid": df_resid,
+        "rsquared": r2, "rsquared_within": r2_within, "rsquared_between": r2_between,
+        "rsquared_overall": r2_overall, "loglik": loglik,
+        "f_statistic": f_statistic, "f_statistic_pvalue": float(stats.f.sf(f_statistic, k, df_resid)),
+        "f_statistic_robust": f_statistic_robust,
+        "f_statistic_robust_pvalue": float(stats.f.sf(f_statistic_robust, k, df_resid)),
+        "f_pooled": f_pooled, "f_pooled_pvalue": f_pooled_pvalue, "df_pooled": n_effects - 1,
+        "entity_obs": group_sizes(sample.entity_ids, sample.n_entities),
+        "time_obs": group_sizes(sample.time_ids, sample.n_periods),
+    }
+
+
+def group_sizes(ids: np.ndarray, n_groups: int) -> dict:
+    counts = np.bincount(ids, minlength=n_groups)
+    return {"min": int(counts.min()), "mean": float(counts.mean()), "max": int(counts.max())}
+
+
+def sample_columns(spec: Specification) -> tuple:
+    return (spec.dependent, *spec.regressors)
+
+
+def prepare_samples(panel_df: pd.DataFrame, specs: list, common_sample: bool = False) -> dict:
+    """
+    定式化が使う標本を {sample_columns(spec): PanelSample} で返す。
+
+    既定では定式化ごとに使う列の欠損を除いた標本で推定する（PanelOLS に各モデルを渡す場合と同じ）。
+    common_sample=True の場合は、グリッド全体の列がそろった行だけを共通の標本にする。
+    """
+    if common_sample:
+        all_columns = list(dict.fromkeys(c for spec in specs for c in sample_columns(spec)))
+        shared = PanelSample(panel_df, all_columns)
+        samples = {sample_columns(spec): shared for spec in specs}
+    else:
+        samples = {}
+        for spec in specs:
+            key = sample_columns(spec)
+            if key not in samples:
+                samples[key] = PanelSample(panel_df, list(dict.fromkeys(key)))
+
+    # demean は標本ごと・効果ごとに1回だけ行う（並行推定の前に済ませておく）
+    for spec in specs:
+        samples[sample_columns(spec)].transformed(spec.effects)
+        samples[sample_columns(spec)].transformed("entity")
+    return samples
+
+
+def fit_specifications(panel_df: pd.DataFrame, specs: list, jobs: int = settings.REGRESSION_GRID_JOBS,
+                       common_sample: bool = False, samples: dict = None) -> list:
+    """
+    定式化のリストを推定し、定式化と同じ順に fit_on_sample の結果（推定できなかった場合は例外）を返す。
+    同じ標本の定式化は demean 済み行列を共有し、推定はスレッドで並行に行う。
+    samples に prepare_samples の結果を渡すと、それを使う（再標本化と行列を共有する場合）。
+    """
+    samples = samples or prepare_samples(panel_df, specs, common_sample)
+
+    def fit(spec):
+        try:
+            return fit_on_sample(samples[sample_columns(spec)], spec)
+        except (np.linalg.LinAlgError, ValueError, ZeroDivisionError) as e:
+            print(f"⚠ {spec.name} を推定できませんでした: {e}")
+            return e
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        return list(executor.map(fit, specs))
+
+
+# 係数表に載せる定式化ごとの統計量
+SUMMARY_FIELDS = ["nobs", "n_entities", "n_periods", "df_resid", "rsquared", "rsquared_within",
+                  "rsquared_between", "rsquared_overall", "f_pooled", "f_pooled_pvalue"]
+
+
+def coefficient_table(specs: list, fits: list) -> pd.DataFrame:
+    """
+    推定結果を、1行が（定式化, 説明変数）の整然とした係数表にする。推定できなかった定式化は含めない。
+    """
+    rows = []
+    for spec_id, (spec, result) in enumerate(zip(specs, fits)):
+        if not isinstance(result, dict):
+            continue
+        for j, term in enumerate(spec.regressors):
+            rows.append({
+                "spec_id": spec_id, "spec": spec.name, "dependent": spec.dependent,
+                "regressors": " + ".join(spec.regressors), "effects": spec.effects, "cov_type": spec.cov_type,
+                "term": term, "coef": result["params"][j], "std_err": result["std_errors"][j],
+                "t_stat": result["tstats"][j], "p_value": result["pvalues"][j],
+                "ci_lower": result["ci_lower"][j], "ci_upper": result["ci_upper"][j],
+                **{key: result[key] for key in SUMMARY_FIELDS},
+            })
+    return pd.DataFrame(rows)
+
+
+def fit_grid(panel_df: pd.DataFrame, specs: list, jobs: int = settings.REGRESSION_GRID_JOBS,
+             common_sample: bool = False) -> pd.DataFrame:
+    """
+    定式化のリストを推定し、整然とした係数表を返す（引数は fit_specifications と同じ）。
+    """
+    return coefficient_table(specs, fit_specifications(panel_df, specs, jobs, common_sample))
+
+
+### 再標本化による推論（クラスタ数が少ないときのワイルド・クラスタ・ブートストラップと並べ替え検定） ###
+
+# ワイルド・ブートストラップのクラスタ重み
+BOOTSTRAP_WEIGHTS = {
+    "rademacher": np.array([-1.0, 1.0]),
+    # Webb の6点分布（クラスタ数が少ないときに Rademacher より重みの組み合わせが多い）
+    "webb": np.array([-np.sqrt(1.5), -1.0, -np.sqrt(0.5), np.sqrt(0.5), 1.0, np.sqrt(1.5)]),
+}
+
+
+def resampling_problem(sample: PanelSample, spec: Specification, term: str) -> dict:
+    """
+    H0: term の係数 = 0 を課した制約付きモデルを demean 済み行列で推定し、再標本化に必要な量をまとめる。
+    検定統計量はエンティティ・クラスタの t 値（共分散の自由度調整は fit_on_sample と同じ）。
+    """
+    transformed = sample.transformed(spec.effects)
+    y = transformed[:, sample.position[spec.dependent]]
+    x = transformed[:, [sample.position[c] for c in spec.regressors]]
+    j = spec.regressors.index(term)
+    xpx_inv = np.linalg.inv(x.T @ x)
+    # 制約付きモデル（term を除いた回帰）の当てはめ値と残差
+    others = np.delete(x, j, axis=1)
+    fitted = others @ np.linalg.lstsq(others, y, rcond=None)[0] if others.shape[1] else np.zeros_like(y)
+    resid = y - fitted
+    # β_j の推定誤差の、クラスタ g からの寄与は Σ_{i∈g} w_i e_i（w = X (X'X)^-1 の j 列）
+    w = x @ xpx_inv[j]
+    clusters = np.zeros((sample.nobs, sample.n_entities))
+    clusters[np.arange(sample.nobs), sample.entity_ids] = 1.0
+    params = xpx_inv @ (x.T @ y)
+    return {
+        "y": y, "x": x, "j": j, "xpx_inv": xpx_inv, "fitted": fitted, "resid": resid, "w": w,
+        "weighted_clusters": clusters * w[:, None], "clusters": clusters, "entity_ids": sample.entity_ids,
+        "scale": cov_scale(sample, spec.effects, "clustered", x.shape[1]),
+        "t_stat": params[j] / np.sqrt(cov_scale(sample, spec.effects, "clustered", x.shape[1])
+                                      * np.sum((clusters.T @ (w * (y - x @ params))) ** 2)),
+    }
+
+
+def wild_bootstrap_terms(problem: dict) -> dict:
+    """
+    ワイルド・クラスタ・ブートストラップ（制約付き）は y* = ŷ_r + u_r ⊙ v_g なので、
+    β*_j とクラスタごとのスコアはどちらもクラスタ重み v（G 次元）の一次式になる。
+    その係数をまとめておけば、1回の複製は G×G の行列積だけで済む（Roodman ほか "Fast and wild"）。
+    """
+    x, xpx_inv, j = problem["x"], problem["xpx_inv"], problem["j"]
+    clusters, weighted = problem["clusters"], problem["weighted_clusters"]
+    resid, fitted = problem["resid"], problem["fitted"]
+    beta0 = xpx_inv @ (x.T @ fitted)
+    # β* = β0 + A v
+    a = xpx_inv @ (x.T @ (clusters * resid[:, None]))
+    # スコア c = c0 + H v
+    f = weighted.T @ x
+    c0 = weighted.T @ fitted - f @ beta0
+    h = np.diag(weighted.T @ resid) - f @ a
+    return {"beta0": beta0[j], "a": a[j], "c0": c0, "h": h, "scale": problem["scale"]}
+
+
+def wild_bootstrap_chunk(terms: dict, reps: int, weights: str, seed) -> np.ndarray:
+    """ワイルド・ブートストラップの複製 reps 回分の t 値"""
+    rng = np.random.default_rng(seed)
+    v = rng.choice(BOOTSTRAP_WEIGHTS[weights], size=(len(terms["c0"]), reps))
+    beta = terms["beta0"] + terms["a"] @ v
+    scores = terms["c0"][:, None] + terms["h"] @ v
+    return beta / np.sqrt(terms["scale"] * np.sum(scores ** 2, axis=0))
+
+
+def permutation_terms(problem: dict) -> dict:
+    """
+    並べ替えた残差 u* に対して β* = β0 + (X'X)^-1 X'u*、クラスタごとのスコア c = c0 + W'u* - F (X'X)^-1 X'u* なので、
+    複製ごとに必要なのはクラスタごとの X_g'u*_g と w_g'u*_g だけになる。
+    """
+    x, xpx_inv, weighted = problem["x"], problem["xpx_inv"], problem["weighted_clusters"]
+    beta0 = xpx_inv @ (x.T @ problem["fitted"])
+    f = weighted.T @ x
+    ids = problem["entity_ids"]
+    return {
+        "rows": [np.flatnonzero(ids == g) for g in range(weighted.shape[1])],
+        "x": x, "w": problem["w"], "resid": problem["resid"], "xpx_inv": xpx_inv, "j": problem["j"],
+        "beta0": beta0, "f": f, "c0": weighted.T @ problem["fitted"] - f @ beta0, "scale": problem["scale"],
+    }
+
+
+def permutation_chunk(terms: dict, reps: int, seed) -> np.ndarray:
+    """
+    Freedman–Lane の並べ替え検定の複製 reps 回分の t 値。
+    制約付きモデルの残差を同じクラスタ（産業大分類）の中で並べ替え、全複製をクラスタごとの行列積でまとめて計算する。
+    """
+    rng = np.random.default_rng(seed)
+    x, w, resid = terms["x"], terms["w"], terms["resid"]
+    xu = np.zeros((x.shape[1], reps))
+    wu = np.zeros((len(terms["rows"]), reps))
+    for g, rows in enumerate(terms["rows"]):
+        u = rng.permuted(np.repeat(resid[rows][:, None], reps, axis=1), axis=0)
+        xu += x[rows].T @ u
+        wu[g] = w[rows] @ u
+    step = terms["xpx_inv"] @ xu
+    beta = terms["beta0"][:, None] + step
+    scores = terms["c0"][:, None] + wu - terms["f"] @ step
+    return beta[terms["j"]] / np.sqrt(terms["scale"] * np.sum(scores ** 2, axis=0))
+
+
+def run_chunks(func, payload, reps: int, seed: int, jobs: int, chunk_size: int, *args) -> np.ndarray:
+    """
+    reps 回の複製を chunk_size ごとに分けて実行する。チャンクごとの乱数は SeedSequence から作るので、
+    同じ seed と chunk_size なら jobs の数によらず同じ結果になる。
+    """
+    sizes = [min(chunk_size, reps - start) for start in range(0, reps, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    if jobs > 1 and len(sizes) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=min(jobs, len(sizes))) as executor:
+            chunks = list(executor.map(func, [payload] * len(sizes), sizes, *[[a] * len(sizes) for a in args], seeds))
+    else:
+        chunks = [func(payload, size, *args, s) for size, s in zip(sizes, seeds)]
+    return np.concatenate(chunks)
+
+
+# 再標本化による p 値の定義（ブートストラップと並べ替え検定で共通。結果の JSON に pvalue_rule として残す）
+RESAMPLING_PVALUE_RULE = "(count(|t*| >= |t|) + 1) / (reps + 1)"
+
+
+def resampling_pvalue(draws: np.ndarray, t_stat: float) -> float:
+    """複製した t 値 draws に対する、観測した t_stat の対称な p 値（RESAMPLING_PVALUE_RULE）。"""
+    exceed = np.sum(np.abs(draws) >= abs(t_stat))
+    return float((exceed + 1) / (len(draws) + 1))
+
+
+def wild_cluster_bootstrap(sample: PanelSample, spec: Specification, term: str,
+                           reps: int = settings.BOOTSTRAP_REPS, weights: str = settings.BOOTSTRAP_WEIGHTS,
+                           seed: int = settings.RESAMPLING_SEED, jobs: int = settings.RESAMPLING_JOBS,
+                           chunk_size: int = settings.RESAMPLING_CHUNK_SIZE) -> dict:
+    """
+    H0: term の係数 = 0 に対する、制約付きワイルド・クラスタ・ブートストラップ（WCR）の対称な p 値。
+    """
+    if weights not in BOOTSTRAP_WEIGHTS:
+        raise ValueError(f"Unknown bootstrap weights '{weights}'. Choose from {sorted(BOOTSTRAP_WEIGHTS)}.")
+    problem = resampling_problem(sample, spec, term)
+    draws = run_chunks(wild_bootstrap_chunk, wild_bootstrap_terms(problem), reps, seed, jobs, chunk_size, weights)
+    return {"method": "wild_cluster_bootstrap", "weights": weights, "reps": reps, "seed": seed,
+            "t_stat": float(problem["t_stat"]), "pvalue": resampling_pvalue(draws, problem["t_stat"]),
+            "pvalue_rule": RESAMPLING_PVALUE_RULE}
+
+
+def permutation_test(sample: PanelSample, spec: Specification, term: str,
+                     reps: int = settings.PERMUTATION_REPS, seed: int = settings.RESAMPLING_SEED,
+                     jobs: int = settings.RESAMPLING_JOBS, chunk_size: int = settings.RESAMPLING_CHUNK_SIZE) -> dict:
+    """
+    H0: term の係数 = 0 に対する、クラスタ内で残差を並べ替える Freedman–Lane 検定の p 値。
+    """
+    problem = resampling_problem(sample, spec, term)
+    draws = run_chunks(permutation_chunk, permutation_terms(problem), reps, seed, jobs, chunk_size)
+    return {"method": "permutation", "reps": reps, "seed": seed,
+            "t_stat": float(problem["t_stat"]), "pvalue": resampling_pvalue(draws, problem["t_stat"]),
+            "pvalue_rule": RESAMPLING_PVALUE_RULE}
@@ -1,3 +1,7 @@
+import unicodedata
+
+import pandas as pd
+
 id2industries_dict = {
     "000": "合計",
     "C": "鉱業、採石業、砂利採取業",
@@ -320,18 +324,200 @@ industryjptoen_dict = {
     "その他の産業": "Other Industries"
 }
 
+UNKNOWN_INDUSTRY_ID = "Unknown Industry ID"
+
+class IndustryResolver:
+    """
+    産業名から産業IDを引くための索引。id2industries_dict から一度だけ構築する。
+
+    解決の順序:
+    1. 先頭3文字が数字ならそれをIDとする
+    2. 完全一致（ハッシュ索引）
+    3. 正規化した名前の一致（空白・全角/半角・句読点の違いを無視）
+    4. 部分一致（先頭と末尾の1文字を除いた名前を含む産業）。n-gram索引で候補を絞ってから確認する
+    結果はキャッシュされる。部分一致の候補が複数ある場合と、除いた後の名前が1文字以下で部分一致が
+    意味を持たない場合（例: "総合計" → "合"）は、候補を選ばずに ambiguous に記録して UNKNOWN_INDUSTRY_ID を返す。
+    どれにも当たらない場合も UNKNOWN_INDUSTRY_ID を返す。
+    """
+    def __init__(self, id2name: dict):
+        self.ids = list(id2name)
+        self.names = list(id2name.values())
+        self.exact_index = {}
+        self.normalized_index = {}
+        for industry_id, name in zip(self.ids, self.names):
+            self.exact_index.setdefault(name, industry_id)
+            self.normalized_index.setdefault(self.normalize(name), industry_id)
+        # 名前の1文字・2文字の部分文字列 → 産業の位置
+        self.ngram_index = {}
+        for position, name in enumerate(self.names):
+            for gram in self.ngrams(name):
+                self.ngram_index.setdefault(gram, set()).add(position)
+        self.cache = {}
+        self.ambiguous = {}
+
+    @staticmethod
+    def normalize(name: str) -> str:
+        name = unicodedata.normalize("NFKC", name)
+        return "".join(ch for ch in name if unicodedata.category(ch)[0] not in ("P", "Z", "C"))
+
+    @staticmethod
+    def ngrams(text: str) -> set:
+        return set(text) | {text[i:i + 2] for i in range(len(text) - 1)}
+
+    def substring_candidates(self, query: str) -> list:
+        """
+        名前に query を含む産業IDを辞書順で返す。
+        """
+        if not query:
+            return list(self.ids)
+        grams = self.ngrams(query) if len(query) < 2 else {query[i:i + 2] for i in range(len(query) - 1)}
+        positions = set.intersection(*(self.ngram_index.get(gram, set()) for gram in grams))
+        return [self.ids[p] for p in sorted(positions) if query in self.names[p]]
+
+    def resolve(self, industry_name: str):
+        industry_name = industry_name.strip()
+        if industry_name in self.cache:
+            return self.cache[industry_name]
+
+        # if first three characters are digits, return the id directly
+        if industry_name[:3].isdigit():
+            industry_id = industry_name[:3]
+        elif industry_name in self.exact_index:
+            industry_id = self.exact_index[industry_name]
+        elif self.normalize(industry_name) in self.normalized_index:
+            industry_id = self.normalized_index[self.normalize(industry_name)]
+        else:
+            query = industry_name[1:-1]
+            candidates = self.substring_candidates(query)
+            if len(candidates) == 1 and len(query) > 1:
+                industry_id = candidates[0]
+            else:
+                industry_id = UNKNOWN_INDUSTRY_ID
+                if candidates:
+                    self.ambiguous[industry_name] = candidates
+                    print(f"警告: 産業名 '{industry_name}' は一意に部分一致しません {candidates[:5]}。産業IDを解決できませんでした。")
+
+        self.cache[industry_name] = industry_id
+        return industry_id
+
+
+industry_resolver = IndustryResolver(id2industries_dict)
+
 def get_industries_name(industry_id):
     return id2industries_dict.get(industry_id, "Unknown Industry")
 
 def get_industries_id(industry_name):
-    industry_name = industry_name.strip()
-    # if first three characters are digits, return the id directly
-    if industry_name[:3].isdigit():
-        return industry_name[:3]
-    for id, name in id2industries_dict.items():
-        if name == industry_name:
-            return id
-    for id, name in id2industries_dict.items():
-        if industry_name[1:-1] in name:
-            return id
-    return "Unknown Industry ID"
\ No newline at end of file
+    return industry_resolver.resolve(industry_name)
+
+
+# 産業分類の階層（上から順）
+LEVELS = ("total", "major", "medium", "small")
+TOTAL_INDUSTRY_ID = "000"
+
+
+class IndustryHierarchy:
+    """
+    産業分類の階層（合計 → 大分類 → 中分類 → 小分類）。id2industries_dict から一度だけ構築する。
+
+    id2industries_dict では大分類の直後にその中分類・小分類が並んでいるので、その順に親を決める。
+    "000" が合計、英字を含むIDが大分類、3桁のIDは直前の大分類の中分類。ただし同じ大分類に
+    上2桁が同じで末尾が0の中分類がある場合（例: 091 → 090）は、その中分類の小分類になる。
+    各IDの親・子・レベルと、各レベルの祖先は辞書で引ける。
+    """
+    def __init__(self, id2name: dict, total_id: str = TOTAL_INDUSTRY_ID):
+        self.total_id = total_id
+        self.parent = {}
+        self.level = {}
+        self.children = {}
+        major = None
+        for industry_id in id2name:
+            medium = industry_id[:2] + "0"
+            if industry_id == total_id:
+                level, parent = "total", None
+            elif not industry_id.isdigit():
+                level, parent, major = "major", total_id, industry_id
+            elif medium != industry_id and self.level.get(medium) == "medium" and self.parent[medium] == major:
+                level, parent = "small", medium
+            else:
+                level, parent = "medium", major
+            self.level[industry_id] = level
+            self.parent[industry_id] = parent
+            self.children[industry_id] = []
+            if parent is not None:
+                self.children[parent].append(industry_id)
+        self.ids_by_level = {level: [i for i, l in self.level.items() if l == level] for level in LEVELS}
+        # ID → {レベル: そのレベルの祖先}（自分のレベルでは自分自身）
+        self.ancestors = {}
+        for industry_id in self.level:
+            chain, current = {}, industry_id
+            while current is not None:
+                chain[self.level[current]] = current
+                current = self.parent[current]
+            self.ancestors[industry_id] = chain
+
+    def __contains__(self, industry_id) -> bool:
+        return industry_id in self.level
+
+    def level_of(self, industry_id):
+        """分類のレベル（LEVELS のいずれか）。分類にないIDは None。"""
+        return self.level.get(industry_id)
+
+    def parent_of(self, industry_id):
+        return self.parent.get(industry_id)
+
+    def children_of(self, industry_id) -> list:
+        return list(self.children.get(industry_id, []))
+
+    def descendants(self, industry_id) -> list:
+        """子孫のID（分類表の順）。"""
+        result = []
+        for child in self.children.get(industry_id, []):
+            result.append(child)
+            result.extend(self.descendants(child))
+        return result
+
+    def ancestor(self, industry_id, level: str):
+        """level の祖先のID。industry_id が level より上のレベルか、分類にない場合は None。"""
+        return self.ancestors.get(industry_id, {}).get(level)
+
+    @staticmethod
+    def code_group(industry_id) -> int:
+        """
+        IDの先頭の文字による区分（数字はその数字、英字は A=10, B=11, ...）。回帰の産業エンティティに使う
+        従来の区分で、分類の階層とは一致しない（例: 製造業の中分類は先頭の数字ごとに分かれる）。
+        """
+        first_char = str(industry_id)[0]
+        if first_char.isdigit():
+            return int(first_char)
+        return ord(first_char) - ord('A') + 10
+
+    def major_of(self, industry_id):
+        """大分類のID。合計は合計自身にする（どの大分類にも属さないため）。"""
+        if industry_id == self.total_id:
+            return industry_id
+        return self.ancestor(industry_id, "major")
+
+    def ids_at(self, level: str) -> list:
+        """level のID（分類表の順）。"""
+        return list(self.ids_by_level[level])
+
+    def level_mask(self, industry_ids: pd.Series, level: str) -> pd.Series:
+        """industry_ids のうち level のIDである行のマスク。"""
+        return industry_ids.map(self.level).eq(level)
+
+    def rollups(self, panel_data: pd.DataFrame, columns: list) -> dict:
+        """
+        各レベルの産業について、1つ下のレベルの子の columns を年ごとに合計する。
+        {レベル: (industry_id, year) を索引とする DataFrame} を返す（最下位の小分類は含まない）。
+        子が1つもない産業・年は含まない。
+        """
+        levels = panel_data["industry_id"].map(self.level)
+        rollups = {}
+        for level, child_level in zip(LEVELS, LEVELS[1:]):
+            rows = panel_data[levels.eq(child_level)]
+            parents = rows["industry_id"].map(lambda i: self.ancestors[i][level]).rename("industry_id")
+            rollups[level] = rows.groupby([parents, rows["year"]])[columns].sum()
+        return rollups
+
+
+industry_hierarchy = IndustryHierarchy(id2industries_dict)
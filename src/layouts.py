@@ -0,0 +1,342 @@
+# layouts.py
+# e-Stat のワークブック（第10表・第11表）の年ごとのレイアウトと、結合セルのヘッダーを1行の列名に組み立てるエンジン。
+# 年によって異なるのは先頭の不要な行・列、結合セルの幅、データの開始行だけなので、それを HeaderLayout に書いておく。
+# 新しい年の表の形が変わった場合は、その年のエントリを追加する（変わらなければ直前の年のレイアウトが使われる）。
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+import schema
+
+
+class HeaderLayout:
+    """
+    1つの表の1年分のレイアウト。
+
+    read_header: pd.read_excel の header（この行より上は読み飛ばされる）
+    drop_empty_columns: すべて空の列を先に落とす
+    drop_columns: 空の列を落とした後に落とす列の位置
+    skip_rows: 読み込んだ後に先頭から落とす行数
+    strip_whitespace: セル内の空白をすべて取り除く
+    header_rows: ヘッダーの行数（skip_rows の後の先頭から）
+    merged: 結合セルの見出し → 右側に続く結合セルの数（ヘッダー行の中で最初に見つかった位置から右へ埋める）
+    data_start: データの開始行（skip_rows の後の先頭から）
+    collapse: 列名の "__" を "_" にする回数
+    strip_chars: 列名の末尾から取り除く文字
+    renames: 列名の部分文字列の置き換え
+    na_markers: 欠損を表す値（既定は schema.MISSING_MARKERS）
+    """
+    def __init__(self, read_header: int = 1, drop_empty_columns: bool = False, drop_columns=(), skip_rows: int = 0,
+                 strip_whitespace: bool = True, header_rows: int = 5, merged: dict = None, data_start: int = 10,
+                 collapse: int = 1, strip_chars: str = "_", renames: dict = None, na_markers=schema.MISSING_MARKERS):
+        self.read_header = read_header
+        self.drop_empty_columns = drop_empty_columns
+        self.drop_columns = list(drop_columns)
+        self.skip_rows = skip_rows
+        self.strip_whitespace = strip_whitespace
+        self.header_rows = header_rows
+        self.merged = merged or {}
+        self.data_start = data_start
+        self.collapse = collapse
+        self.strip_chars = strip_chars
+        self.renames = renames or {}
+        self.na_markers = list(na_markers)
+
+    def replace(self, **changes) -> "HeaderLayout":
+        """一部の項目だけを変えたレイアウトを返す。"""
+        return HeaderLayout(**{**vars(self), **changes})
+
+
+def layout_for(layouts: dict, year: int) -> HeaderLayout:
+    """
+    {最初の年: レイアウト} から、year 以前で最も新しいエントリのレイアウトを返す。
+    """
+    candidates = [first for first in layouts if first <= int(year)]
+    if not candidates:
+        raise ValueError(f"No layout defined for year {year} (first layout is {min(layouts)}).")
+    return layouts[max(candidates)]
+
+
+def fill_merged_headers(block: np.ndarray, merged: dict) -> np.ndarray:
+    """
+    結合セルの見出しを、右側の空のセルに埋めたヘッダーを返す。
+    見出しごとに最初に見つかった位置から右へ最大 span 列のうち、空のセルを埋める（先に書いた見出しが優先）。
+    """
+    empty = pd.isna(block)
+    labels = np.full(block.shape, None, dtype=object)
+    n_cols = block.shape[1]
+    for key, span in merged.items():
+        rows, cols = np.nonzero(block == key)
+        if not len(rows):
+            continue
+        # np.nonzero は行優先の順に返すので、先頭が最初に見つかった位置
+        row, col = rows[0], cols[0]
+        targets = np.arange(col + 1, min(col + 1 + span, n_cols))
+        targets = targets[empty[row, targets] & np.equal(labels[row, targets], None)]
+        labels[row, targets] = key
+    return np.where(np.equal(labels, None), block, labels)
+
+
+def flatten_header(block: np.ndarray, layout: HeaderLayout) -> list:
+    """
+    ヘッダー行を列ごとに "_" でつないで、1行の列名にする。
+    """
+    cells = np.where(pd.isna(block), "", block.astype(str))
+    names = []
+    for column in cells.T:
+        name = "_".join(column)
+        for _ in range(layout.collapse):
+            name = name.replace("__", "_")
+        name = name.rstrip(layout.strip_chars)
+        for old, new in layout.renames.items():
+            name = name.replace(old, new)
+        names.append(name)
+    return names
+
+
+def apply_layout(df: pd.DataFrame, layout: HeaderLayout) -> pd.DataFrame:
+    """
+    読み込んだシートからヘッダーを組み立て、データ部分を列名付きの DataFrame にして返す。
+    ヘッダーは先頭の数行だけを NumPy 配列で処理し、DataFrame のセルには書き込まない。
+    """
+    if layout.drop_empty_columns:
+        df = df.dropna(axis=1, how='all')
+    if layout.drop_columns:
+        df = df.drop(columns=df.columns[layout.drop_columns])
+    if layout.skip_rows:
+        df = df.iloc[layout.skip_rows:]
+    if layout.strip_whitespace:
+        df = df.replace(to_replace=r'\s+', value='', regex=True)
+
+    block = fill_merged_headers(df.iloc[:layout.header_rows].to_numpy(dtype=object), layout.merged)
+    block[0, 0] = "産業"
+    data = df.iloc[layout.data_start:].reset_index(drop=True)
+    data.columns = flatten_header(block, layout)
+    return data.mask(data.isin(list(layout.na_markers)))
+
+
+def read_with_pandas(path: str, layout: HeaderLayout) -> pd.DataFrame:
+    """シート全体を pd.read_excel で読み込んでからレイアウトを適用する。"""
+    return apply_layout(pd.read_excel(path, header=layout.read_header), layout)
+
+
+### ワークブックのセルを直接読むリーダー ###
+
+# pd.read_excel が欠損として扱う文字列（pandas の既定の na_values）
+PANDAS_NA_STRINGS = {"", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+                     "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null"}
+WHITESPACE = re.compile(r"\s+")
+
+
+class XlrdSheet:
+    """
+    .xls の最初のシートを xlrd で開き、セルを pd.read_excel と同じ Python の値で返す（空のセルは None）。
+    """
+    def __init__(self, path: str):
+        import xlrd
+        self.xlrd = xlrd
+        self.book = xlrd.open_workbook(path, on_demand=True)
+        self.sheet = self.book.sheet_by_index(0)
+        self.nrows, self.ncols = self.sheet.nrows, self.sheet.ncols
+
+    def row(self, r: int) -> list:
+        xlrd = self.xlrd
+        values = []
+        for kind, value in zip(self.sheet.row_types(r), self.sheet.row_values(r)):
+            if kind == xlrd.XL_CELL_NUMBER:
+                values.append(int(value) if value.is_integer() else value)
+            elif kind == xlrd.XL_CELL_TEXT:
+                values.append(value)
+            elif kind == xlrd.XL_CELL_DATE:
+                values.append(xlrd.xldate_as_datetime(value, self.book.datemode))
+            elif kind == xlrd.XL_CELL_BOOLEAN:
+                values.append(bool(value))
+            else:
+                values.append(None)
+        return values + [None] * (self.ncols - len(values))
+
+    def close(self):
+        self.book.release_resources()
+
+
+class OpenpyxlSheet:
+    """
+    .xlsx / .xlsm の最初のシートを openpyxl の読み取り専用モードで開く（行は1回だけ読む）。
+    """
+    def __init__(self, path: str):
+        import openpyxl
+        self.book = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        rows = [list(row) for row in self.book.worksheets[0].iter_rows(values_only=True)]
+        self.ncols = max((len(row) for row in rows), default=0)
+        self.rows = [[int(v) if isinstance(v, float) and v.is_integer() else v for v in row]
+                     + [None] * (self.ncols - len(row)) for row in rows]
+        self.nrows = len(self.rows)
+
+    def row(self, r: int) -> list:
+        return self.rows[r]
+
+    def close(self):
+        self.book.close()
+
+
+def open_sheet(path: str):
+    return XlrdSheet(path) if os.path.splitext(path)[1].lower() == ".xls" else OpenpyxlSheet(path)
+
+
+def parse_cell(value):
+    """read_excel と同じく、欠損を表す文字列を None にする。"""
+    if isinstance(value, str) and value in PANDAS_NA_STRINGS:
+        return None
+    return value
+
+
+def is_number(value) -> bool:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return True
+    if isinstance(value, str):
+        try:
+            float(value)
+        except ValueError:
+            return False
+        return True
+    return False
+
+
+def typed_column(values: list) -> np.ndarray:
+    """
+    1列の値を NumPy 配列にする。欠損以外がすべて数値なら int64（欠損も小数もない場合）か float64、
+    そうでなければ欠損を NaN にした object 配列。
+    """
+    present = [v for v in values if v is not None]
+    if present and all(is_number(v) for v in present):
+        if len(present) == len(values) and all(isinstance(v, int) for v in present):
+            return np.array(values, dtype=np.int64)
+        return np.array([np.nan if v is None else float(v) for v in values], dtype=np.float64)
+    return np.array([np.nan if v is None else v for v in values], dtype=object)
+
+
+def column_summary(values) -> tuple:
+    """1列のセルについて (値があるか, 欠損以外がすべて数値か, 欠損がなくすべて整数か) を返す。"""
+    values = list(values)
+    present = [v for v in values if v is not None]
+    return (bool(present), all(is_number(v) for v in present),
+            len(present) == len(values) and all(isinstance(v, int) for v in present))
+
+
+def read_layout(path: str, layout: HeaderLayout) -> pd.DataFrame:
+    """
+    ワークブックを1回だけ開き、レイアウトが示すヘッダー行とデータ行のセルだけを読んで DataFrame を作る。
+    read_with_pandas と同じ表を返す。シート全体の DataFrame は作らず、文字列の空白除去と欠損の置き換えは
+    セルを読むときに行い、列はそれぞれ型付きの NumPy 配列にする。
+    """
+    sheet = open_sheet(path)
+    try:
+        # read_excel では header の行が列名になり、その下の行がデータの先頭になる
+        first = layout.read_header + 1
+        header_start = first + layout.skip_rows
+        data_start = header_start + layout.data_start
+        header = [[parse_cell(v) for v in sheet.row(r)] for r in range(header_start, min(header_start + layout.header_rows, sheet.nrows))]
+        data = [[parse_cell(v) for v in sheet.row(r)] for r in range(data_start, sheet.nrows)]
+
+        # 空の列の判定と、ヘッダーの数値の書式（read_excel では数値だけの列のセルは float になる）は、
+        # 判定に関わる列だけをヘッダーとデータの範囲で調べる。read_excel が読む残りの行（ヘッダーより上や
+        # ヘッダーとデータの間）は、その範囲で判定が決まらない列があるときだけ読む
+        numeric_header = {c for c in range(sheet.ncols) if any(is_number(row[c]) for row in header)}
+        checked = range(sheet.ncols) if layout.drop_empty_columns else sorted(numeric_header)
+        summaries = {c: column_summary([row[c] for row in header] + [row[c] for row in data]) for c in checked}
+        undecided = [c for c, (has_value, numbers, _) in summaries.items()
+                     if (layout.drop_empty_columns and not has_value) or (c in numeric_header and numbers)]
+        if undecided:
+            rest = [sheet.row(r) for r in range(first, min(data_start, sheet.nrows))
+                    if not header_start <= r < header_start + len(header)]
+            for c in undecided:
+                has_value, numbers, ints = summaries[c]
+                more_value, more_numbers, more_ints = column_summary(parse_cell(row[c]) for row in rest)
+                summaries[c] = (has_value or more_value, numbers and more_numbers, ints and more_ints)
+
+        columns = list(range(sheet.ncols))
+        if layout.drop_empty_columns:
+            columns = [c for c in columns if summaries[c][0]]
+        columns = [c for i, c in enumerate(columns) if i not in set(layout.drop_columns)]
+    finally:
+        sheet.close()
+
+    block = np.empty((len(header), len(columns)), dtype=object)
+    for i, row in enumerate(header):
+        for j, c in enumerate(columns):
+            value = row[c]
+            if is_number(value):
+                _, numbers, ints = summaries[c]
+                if numbers and not ints:
+                    value = float(value)
+            elif isinstance(value, str) and layout.strip_whitespace:
+                value = WHITESPACE.sub("", value)
+            block[i, j] = np.nan if value is None else value
+    block = fill_merged_headers(block, layout.merged)
+    block[0, 0] = "産業"
+
+    markers = set(layout.na_markers)
+    arrays = []
+    for c in columns:
+        values = []
+        for row in data:
+            value = row[c]
+            if isinstance(value, str):
+                if layout.strip_whitespace:
+                    value = WHITESPACE.sub("", value)
+                if value in markers:
+                    value = None
+            values.append(value)
+        arrays.append(typed_column(values))
+    df = pd.DataFrame(dict(enumerate(arrays)), index=pd.RangeIndex(len(data)))
+    df.columns = flatten_header(block, layout)
+    return df
+
+
+### 第10表（企業数、売上高、研究開発費…） ###
+
+RESEARCH_EXPENSE_MERGED = {
+    "研究開発": 9,
+    "研究開発投資": 1,
+    "能力開発": 1,
+    "研究開発費": 4,
+    "委託研究開発費（百万円）": 2,
+    "受託研究費（百万円）": 2,
+    "うち、関係会社への委託": 1,
+    "うち、関係会社からの受託": 1,
+}
+_research_before_2020 = HeaderLayout(drop_empty_columns=True, merged=RESEARCH_EXPENSE_MERGED)
+# 2010・2013・2014年は「研究開発」の結合が1列広い
+_research_wide = {**RESEARCH_EXPENSE_MERGED, "研究開発": 10}
+
+RESEARCH_EXPENSE_LAYOUTS = {
+    2010: _research_before_2020.replace(skip_rows=2, merged=_research_wide),
+    2011: _research_before_2020,
+    2013: _research_before_2020.replace(merged=_research_wide),
+    2014: _research_before_2020.replace(skip_rows=2, merged=_research_wide),
+    2015: _research_before_2020.replace(skip_rows=2),
+    2020: HeaderLayout(read_header=0, drop_empty_columns=True, drop_columns=[0, 2, 3], strip_whitespace=False,
+                       header_rows=6, data_start=12, collapse=2, strip_chars="_社"),
+}
+
+### 第11表（特許権、実用新案権、意匠権…） ###
+
+PATENT_COUNT_MERGED = {
+    "特許権": 3,
+    "実用新案権": 3,
+    "意匠権": 3,
+    "件数": 2,
+    "使用のもの（含供与）": 1,
+}
+_patent_before_2020 = HeaderLayout(header_rows=6, merged=PATENT_COUNT_MERGED, data_start=11, collapse=2)
+
+PATENT_COUNT_LAYOUTS = {
+    2010: _patent_before_2020.replace(drop_columns=[0]),
+    2011: _patent_before_2020,
+    2014: _patent_before_2020.replace(drop_columns=[0], skip_rows=2),
+    2020: HeaderLayout(read_header=0, drop_empty_columns=True, drop_columns=[0, 2, 3], strip_whitespace=False,
+                       header_rows=6, data_start=12, collapse=2, strip_chars="_社",
+                       renames={"特許権_件数_所有数_件": "特許権_件数_所有数"}),
+}
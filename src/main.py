@@ -1,32 +1,35 @@
+import argparse
 import pandas as pd
 import settings
-import data_processor
-import visualization
-import regression
-
-
-def main():
-
-    # Run scraper
-    print("Starting data scraping...")
-    scraper = data_processor.DataScraper(settings.BASE_URLs_scrape, settings.DOWNLOAD_DIR, settings.YEARS_TO_SCRAPE)
-    scraper.run_scraper()
-    print("Data scraping complete.")
-
-    # Run data cleaning
-    print("\nStarting data cleaning...")
-    cleaner = data_processor.DataCleaner(settings.DOWNLOAD_DIR, settings.CLEAND_DIR)
-    cleaner.clean_all_data()
-    print("Data cleaning complete.")
-    
-    # create panale data
-    panel_df, research_dict, patent_dict, labor_dict = data_processor.PanelDataProducer.create_panel_data()
-    if panel_df is not None:
-        # visualization
-        visualization.Plotsproducer.generate_all_visualizations(panel_df, patent_dict)
-        # run regression
-        regression.run_regressions(panel_df)
-        
+import pipeline
+
+
+STAGES = list(pipeline.build_stages())
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="研究開発費と特許件数のパネルデータ分析パイプライン",
+        epilog="scrape ステージは設定（URL・年・表名）だけで判定するので、設定が同じでダウンロード済みの"
+               "ファイルが残っていれば e-Stat を見に行かない。e-Stat 側の更新を取り込むには --force を付ける"
+               "（例: --only scrape --force）。")
+    parser.add_argument("--jobs", type=int, default=settings.CLEAN_JOBS,
+                        help="データクリーニングの並列プロセス数（1 で逐次実行）")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--until", choices=STAGES,
+                        help="指定したステージとその上流だけを実行する（例: --until panel）")
+    target.add_argument("--only", choices=STAGES, nargs="+",
+                        help="指定したステージだけを実行する（上流は既存の出力を使う）")
+    parser.add_argument("--force", action="store_true",
+                        help="入力が変わっていなくても、選んだステージをすべて再実行する（e-Stat の再確認にも必要）")
+    return parser.parse_args()
+
+
+def main(args):
+    # scrape → clean → panel → (visualize, regression)
+    # 入力と処理コードのハッシュが前回と同じで、出力が残っているステージはスキップされる
+    ok = pipeline.Pipeline().run(until=args.until, only=args.only, force=args.force, options={"jobs": args.jobs})
+    if ok:
         print("\n🎉 全ての処理が正常に完了しました。")
     else:
         print("\n❌ パイプラインの実行中にエラーが発生しました。")
@@ -35,4 +38,4 @@ def main():
 
 if __name__ == "__main__":
     pd.set_option('future.no_silent_downcasting', True)
-    main()
+    main(parse_args())
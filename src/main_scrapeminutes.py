@@ -1,46 +1,238 @@
 # scrape_gijiroku
+import argparse
+import json
 import time
+import sqlite3
+import threading
+import unicodedata
 import pandas as pd
 import numpy as np
 import tqdm
+from contextlib import contextmanager
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from industries import id2industries_dict
 import os
-import urllib
+import urllib.parse
 import settings
 
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from webdriver_manager.chrome import ChromeDriverManager
+# Highcharts.charts[0] が作られ、系列が入るまで待つ
+CHART_READY_SCRIPT = (
+    "return typeof Highcharts !== 'undefined' && Highcharts.charts.length > 0"
+    " && !!Highcharts.charts[0] && Highcharts.charts[0].series.length > 0;"
+)
 
-class common:
-    def fetch_yonalog_counts(url: str, wait_seconds: float = 5.0):
+class BrowserPool:
+    """
+    長時間使い回すヘッドレスChromeのプール。
+    最大 size 個のブラウザを必要になった時点で起動し、クエリ間で再利用する。
+    空きがなければ、返却・破棄・起動失敗のいずれかで枠が空くまで condition で待つ。
+    """
+    def __init__(self, size: int = settings.BROWSER_POOL_SIZE):
+        self.size = size
+        self.idle = []
+        self.drivers = []
+        # 起動中のブラウザの数（drivers と合わせて size を超えないようにする）
+        self.launching = 0
+        self.condition = threading.Condition()
+
+    def create_driver(self):
+        # selenium はブラウザを起動するときにだけ読み込む（http / replay バックエンドでは不要）
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
         # 1) Configure headless Chrome
         chrome_opts = Options()
         chrome_opts.add_argument("--headless")
         chrome_opts.add_argument("--disable-gpu")
         chrome_opts.add_argument("--no-sandbox")
         chrome_opts.add_argument("--window-size=1920,1080")
-        
         # 2) Launch driver (auto-downloads chromedriver)
-        driver = webdriver.Chrome(
-            options=chrome_opts
-        )
-        
+        return webdriver.Chrome(options=chrome_opts)
+
+    def acquire(self):
+        """
+        空いているブラウザを返す。なければ上限までは新しく起動し、上限に達していれば枠が空くまで待つ。
+        """
+        with self.condition:
+            while not self.idle and len(self.drivers) + self.launching >= self.size:
+                self.condition.wait()
+            if self.idle:
+                return self.idle.pop()
+            self.launching += 1
+        try:
+            driver = self.create_driver()
+        except BaseException:
+            with self.condition:
+                self.launching -= 1
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.launching -= 1
+            self.drivers.append(driver)
+        return driver
+
+    def release(self, driver):
+        with self.condition:
+            self.idle.append(driver)
+            self.condition.notify()
+
+    @contextmanager
+    def driver(self):
+        """
+        空いているブラウザを1つ借りる。ブロックが正常に終われば返却し、
+        例外（WebDriverException 以外や KeyboardInterrupt も含む）で終わればそのブラウザを終了して枠を空ける。
+        """
+        driver = self.acquire()
+        succeeded = False
+        try:
+            yield driver
+            succeeded = True
+        finally:
+            if succeeded:
+                self.release(driver)
+            else:
+                self.discard(driver)
+
+    def discard(self, driver):
+        with self.condition:
+            if driver in self.drivers:
+                self.drivers.remove(driver)
+            if driver in self.idle:
+                self.idle.remove(driver)
+            self.condition.notify()
         try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def close(self):
+        for driver in list(self.drivers):
+            self.discard(driver)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class MentionCache:
+    """
+    (ソース, 正規化したクエリ) をキーに、年別件数を SQLite に保存するキャッシュ。
+    ttl_days を過ぎた結果は使わず、max_entries を超えたら最も長く使われていないものから削除する。
+    """
+    def __init__(self, path: str = settings.MENTION_CACHE_PATH, ttl_days: float = settings.MENTION_CACHE_TTL_DAYS,
+                 max_entries: int = settings.MENTION_CACHE_MAX_ENTRIES):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.ttl = ttl_days * 24 * 60 * 60
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0}
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS counts ("
+            " source TEXT, query TEXT, counts TEXT, created REAL, accessed REAL,"
+            " PRIMARY KEY (source, query))")
+        self.conn.commit()
+
+    @staticmethod
+    def normalize_query(queries: list[str]) -> str:
+        # 検索語は OR でつなぐので、表記ゆれ（全角/半角・引用符・順序・重複）をそろえる
+        terms = {unicodedata.normalize("NFKC", q).strip().strip('"') for q in queries}
+        return " | ".join(sorted(t for t in terms if t))
+
+    def get(self, source: str, queries: list[str]):
+        key = self.normalize_query(queries)
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT counts, created FROM counts WHERE source = ? AND query = ?", (source, key)).fetchone()
+            if row is not None and now - row[1] > self.ttl:
+                self.conn.execute("DELETE FROM counts WHERE source = ? AND query = ?", (source, key))
+                self.conn.commit()
+                self.stats["expired"] += 1
+                row = None
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            self.conn.execute("UPDATE counts SET accessed = ? WHERE source = ? AND query = ?", (now, source, key))
+            self.conn.commit()
+            self.stats["hits"] += 1
+        return {int(year): count for year, count in json.loads(row[0]).items()}
+
+    def set(self, source: str, queries: list[str], counts: dict):
+        key = self.normalize_query(queries)
+        now = time.time()
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO counts VALUES (?, ?, ?, ?, ?)",
+                              (source, key, json.dumps(counts), now, now))
+            evicted = self.conn.execute(
+                "DELETE FROM counts WHERE rowid IN (SELECT rowid FROM counts ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)).rowcount
+            self.conn.commit()
+            self.stats["evicted"] += evicted
+
+    def report(self):
+        total = self.stats["hits"] + self.stats["misses"]
+        rate = self.stats["hits"] / total * 100 if total else 0.0
+        print(f"Query cache: {self.stats['hits']} hits, {self.stats['misses']} misses ({rate:.1f}% hit rate), "
+              f"{self.stats['expired']} expired, {self.stats['evicted']} evicted")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+class common:
+    def build_query(queries: list[str]) -> str:
+        # Quote each query and join with ' | '
+        return ' | '.join(q if q.startswith('"') else f'"{q}"' for q in queries)
+
+    def get_year_counts(source, industry_name: list[str], pool: BrowserPool = None,
+                        cache: MentionCache = None) -> dict:
+        """
+        クエリの年別件数 {year: count} を返す。cache にあればそれを使い、なければ取得してキャッシュする。
+        """
+        if cache is not None:
+            counts = cache.get(source.SOURCE, industry_name)
+            if counts is not None:
+                return counts
+        cfg = common.fetch_yonalog_counts(source.build_yonalog_url(industry_name), pool)
+        counts = common.get_district_timeseries(cfg, source.SERIES_NAME)
+        if cache is not None:
+            cache.set(source.SOURCE, industry_name, counts)
+        return counts
+
+    def fetch_yonalog_counts(url: str, pool: BrowserPool = None, timeout: float = settings.BROWSER_WAIT_TIMEOUT):
+        """
+        ページを開き、Highcharts のグラフが描画された時点でその options を返す。
+        pool を渡さない場合は1回限りのブラウザを起動する。
+        """
+        if pool is None:
+            with BrowserPool(size=1) as single_pool:
+                return common.fetch_yonalog_counts(url, single_pool, timeout)
+
+        from selenium.webdriver.support.ui import WebDriverWait
+        with pool.driver() as driver:
             # 3) Navigate
             driver.get(url)
-            
-            # 4) Wait for JS to render the chart
-            time.sleep(wait_seconds)
-            
+            # 4) Wait until the chart is actually rendered
+            WebDriverWait(driver, timeout, poll_frequency=0.2).until(
+                lambda d: d.execute_script(CHART_READY_SCRIPT))
             # 5) Extract the live chart options
             #    Highcharts.charts[0] is the first (and only) chart on the page
-            cfg = driver.execute_script("return Highcharts.charts[0].options;")
-            
-        finally:
-            driver.quit()
-        
-            return cfg
+            return driver.execute_script("return Highcharts.charts[0].options;")
+
+    def fetch_all_counts(get_counts, industries: dict, pool: BrowserPool):
+        """
+        industries {industry_id: 検索語リスト} を pool のサイズだけ並行に取得し、
+        完了した順に (industry_id, DataFrame または例外) を返す。
+        """
+        with ThreadPoolExecutor(max_workers=pool.size) as executor:
+            futures = {executor.submit(get_counts, industry, pool): k for k, industry in industries.items()}
+            for future in tqdm.tqdm(as_completed(futures), total=len(futures)):
+                try:
+                    yield futures[future], future.result()
+                except Exception as e:
+                    yield futures[future], e
     
     def get_district_timeseries(cfg: dict, district_name: str):
         """
@@ -84,129 +276,169 @@ class common:
         return [industry] if industry else []
 
 class gijiroku:
+    SOURCE = "gijiroku"
+    SERIES_NAME = "全議会"
+
     def build_yonalog_url(queries):
         # URL encode each query and join with ' | '
-        encoded_queries = [q if q.startswith('"') else f'"{q}"' for q in queries]
-        joined = ' | '.join(encoded_queries)
-        encoded = urllib.parse.quote(joined)
+        encoded = urllib.parse.quote(common.build_query(queries))
         base_url = "https://chiholog.net/yonalog/search.html?meeting_text="
         return f"{base_url}{encoded}"
     
-    def get_industry_mention_counts(industry_name: list[str]):
+    def get_industry_mention_counts(industry_name: list[str], pool: BrowserPool = None,
+                                    cache: MentionCache = None):
         """
         Given the Highcharts options dict and an industry name (e.g. ["鉱業", "採石業", "砂利採取業"]),
         return a pandas dataframe with year as index and counts as a single column.
         The dataframe will have years from 1947 to 2024.
         """
         # 1947 ~ 2024
-        cfg = common.fetch_yonalog_counts(gijiroku.build_yonalog_url(industry_name))
-        dic = common.get_district_timeseries(cfg, "全議会")
+        dic = common.get_year_counts(gijiroku, industry_name, pool, cache)
         df = pd.DataFrame.from_dict(dic, orient='index', columns=['count'])
         return df
     
 
 
 class kokkai:
+    SOURCE = "kokkai"
+    SERIES_NAME = "年の該当件数"
+
     def build_yonalog_url(queries):
         # URL encode each query and join with ' | '
-        encoded_queries = [q if q.startswith('"') else f'"{q}"' for q in queries]
-        joined = ' | '.join(encoded_queries)
-        encoded = urllib.parse.quote(joined)
+        encoded = urllib.parse.quote(common.build_query(queries))
         base_url = "https://kokalog.net/search.html?speech="
         return f"{base_url}{encoded}"
     
-    def get_industry_mention_counts(industry_name: list[str]):
+    def get_industry_mention_counts(industry_name: list[str], pool: BrowserPool = None,
+                                    cache: MentionCache = None):
         """
         Given the Highcharts options dict and an industry name (e.g. ["鉱業", "採石業", "砂利採取業"]),
         return a pandas dataframe with year as index and counts as a single column.
         The dataframe will have years from 1947 to 2024.
         """
         # 1947 ~ 2024
-        cfg = common.fetch_yonalog_counts(kokkai.build_yonalog_url(industry_name))
-        dic = common.get_district_timeseries(cfg, "年の該当件数")
+        dic = common.get_year_counts(kokkai, industry_name, pool, cache)
         df = pd.DataFrame.from_dict(dic, orient='index', columns=['count'])
         return df
 
 
 
-def main():
-    #gijiroku
-    URL = "https://chiholog.net/yonalog/search.html?meeting_text=%22%E9%89%B1%E6%A5%AD%22+%7C+%22%E6%8E%A1%E7%9F%B3%E6%A5%AD%22+%7C+%22%E7%A0%82%E5%88%A9%E6%8E%A1%E5%8F%96%E6%A5%AD%22#google_vignette"
-    checkpoint_path = "all_df_checkpoint.csv"
+class MentionCheckpoint:
+    """
+    取得済みの言及件数を1産業1行で追記していくチェックポイント（JSON Lines）。
+    ソースごとに別ファイルにし、途中で止まっても記録済みの産業は再取得しない。
+    同じ産業が複数回記録されている場合は最後の記録を使う。
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.records = {}
+        if os.path.exists(path):
+            with open(path, "rb+") as f:
+                data = f.read()
+                # 書き込み途中で止まった最終行を切り捨て、次の追記と混ざらないようにする
+                if data and not data.endswith(b"\n"):
+                    f.truncate(data.rfind(b"\n") + 1)
+            for line in data.decode("utf-8", errors="ignore").splitlines()[:data.count(b"\n")]:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"⚠ 壊れた記録を読み飛ばします: {line[:40]}")
+                    continue
+                self.records[record["industry_id"]] = record
+
+    def __contains__(self, industry_id) -> bool:
+        return industry_id in self.records
+
+    def append(self, industry_id: str, column: str, df: pd.DataFrame):
+        record = {"industry_id": industry_id, "column": column,
+                  "counts": {str(year): int(count) for year, count in df.iloc[:, 0].items()}}
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.records[industry_id] = record
+
+    def to_frame(self, order: list = None) -> pd.DataFrame:
+        """
+        記録をまとめて、年を行・産業を列とする表にする。order があればその産業ID順に列を並べる。
+        """
+        ids = [k for k in order if k in self.records] if order is not None else list(self.records)
+        columns = {self.records[k]["column"]: self.records[k]["counts"] for k in ids}
+        df = pd.DataFrame(columns)
+        df.index = df.index.astype(int)
+        return df.sort_index()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="議事録・国会会議録の産業言及件数を取得する")
+    parser.add_argument("--no-cache", action="store_true", help="クエリ結果のキャッシュを使わない")
+    return parser.parse_args(argv)
+
+
+def plan_mention_queries(source):
+    """
+    ソースのチェックポイントを開き、まだ取得していない産業のクエリ {industry_id: 検索語リスト} と一緒に返す。
+    """
+    queries = {k: common.refine_industry_name(v) for k, v in id2industries_dict.items()}
+    checkpoint = MentionCheckpoint(os.path.join(settings.MENTION_CHECKPOINT_DIR, f"{source.SOURCE}.jsonl"))
+    todo = {k: industry for k, industry in queries.items()
+            if industry != ['合計'] and k not in checkpoint}
+    print(f"{source.SOURCE}: {len(todo)} industries to fetch ({len(checkpoint.records)} in checkpoint)")
+    return checkpoint, todo
+
+
+def assemble_mention_table(checkpoint: MentionCheckpoint) -> pd.DataFrame:
+    """
+    チェックポイントから、1行目が industry_id、以降が年の表を作る。
+    """
     indic = id2industries_dict
-    indic2 = {k: gijiroku.refine_industry_name(v) for k, v in indic.items()}
-    for k, v in tqdm.tqdm(indic2.items()):
-        print(f"Processing {k} -> {v}")
-    
-    # Load checkpoint if exists
-    if os.path.exists(checkpoint_path):
-        all_df = pd.read_csv(checkpoint_path, index_col=0)
-    else:
-        all_df = pd.DataFrame()
-
-    for k, industry in tqdm.tqdm(indic2.items()):
-        col_name = ''.join(indic[k])
-        if industry == ['合計'] or col_name in all_df.columns:
-            continue
-        try:
-            df = gijiroku.get_industry_mention_counts(industry)
-            df.columns = [col_name]
-            if all_df.empty:
-                all_df = df
-            else:
-                all_df = all_df.join(df, how='outer')
-            # Save checkpoint after each successful column
-            all_df.to_csv(checkpoint_path)
-        except Exception as e:
-            print(f"Error processing {k} ({industry}): {e}")
-    
-    indic= id2industries_dict
+    all_df = checkpoint.to_frame(order=list(indic))
     reversed_indic = {v: k for k, v in indic.items()}
-    all_df.loc['industry_id'] = [reversed_indic[col] for col in all_df.columns]
-    all_df = all_df.loc[['industry_id'] + [idx for idx in all_df.index if idx != 'industry_id']]
-    save_path = os.path.join(settings.DATA_DIR, "gikai_mention.csv")
-    all_df.to_csv(save_path)
-    
+    id_row = pd.DataFrame([[reversed_indic[col] for col in all_df.columns]], index=['industry_id'], columns=all_df.columns)
+    return pd.concat([id_row, all_df])
+
+
+def collect_mention_counts(source, cache: MentionCache = None) -> pd.DataFrame:
+    """
+    全産業の言及件数を取得して、1行目が industry_id、以降が年の表を返す。
+    チェックポイントに記録済みの産業は取得しない。
+    """
+    checkpoint, todo = plan_mention_queries(source)
+    with BrowserPool() as pool:
+        for k, result in common.fetch_all_counts(
+                partial(source.get_industry_mention_counts, cache=cache), todo, pool):
+            if isinstance(result, Exception):
+                print(f"Error processing {k} ({todo[k]}): {result}")
+                continue
+            checkpoint.append(k, id2industries_dict[k], result)
+    return assemble_mention_table(checkpoint)
+
+
+def save_mention_tables(gikai_df: pd.DataFrame = None, kokkai_df: pd.DataFrame = None):
+    if gikai_df is not None:
+        gikai_df.to_csv(os.path.join(settings.DATA_DIR, "gikai_mention.csv"))
+    if kokkai_df is not None:
+        kokkai_df.to_csv(os.path.join(settings.DATA_DIR, "kokkai_mention.csv"))
+        # choose only rows after 2010
+        years = kokkai_df.drop(index='industry_id')
+        years.loc[years.index >= 2010].to_csv(os.path.join(settings.DATA_DIR, "kokkai_mention_2010.csv"))
+
+
+def main(args=None):
+    args = args or parse_args()
+    cache = None if args.no_cache else MentionCache()
+
+    # gijiroku
+    gikai_df = collect_mention_counts(gijiroku, cache)
     # kokkai
-    URL = "https://kokalog.net/search.html?speech=%22%E9%89%B1%E6%A5%AD%22+%7C+%22%E6%8E%A1%E7%9F%B3%E6%A5%AD%22+%7C+%22%E7%A0%82%E5%88%A9%E6%8E%A1%E5%8F%96%E6%A5%AD%22#google_vignette"
-    checkpoint_path = "all_df_checkpoint.csv"
-    indic = id2industries_dict
-    indic2 = {k: kokkai.refine_industry_name(v) for k, v in indic.items()}
-    for k, v in tqdm.tqdm(indic2.items()):
-        print(f"Processing {k} -> {v}")
-    # Load checkpoint if exists
-    if os.path.exists(checkpoint_path):
-        all_df = pd.read_csv(checkpoint_path, index_col=0)
-    else:
-        all_df = pd.DataFrame()
-
-    for k, industry in tqdm.tqdm(indic2.items()):
-        col_name = ''.join(indic[k])
-        if industry == ['合計'] or col_name in all_df.columns:
-            continue
-        try:
-            df = kokkai.get_industry_mention_counts(industry)
-            df.columns = [col_name]
-            if all_df.empty:
-                all_df = df
-            else:
-                all_df = all_df.join(df, how='outer')
-            # Save checkpoint after each successful column
-            all_df.to_csv(checkpoint_path)
-        except Exception as e:
-            print(f"Error processing {k} ({industry}): {e}")
-    indic = id2industries_dict
-    reversed_indic = {v: k for k, v in indic.items()}
-    all_df.loc['industry_id'] = [reversed_indic[col] for col in all_df.columns]
-    all_df = all_df.loc[['industry_id'] + [idx for idx in all_df.index if idx != 'industry_id']]
-    save_path = os.path.join(settings.DATA_DIR, "gikai_mention.csv")
-    all_df.to_csv(save_path)
-    # choose only rows after 2010
-    df = pd.read_csv("all_df_checkpoint.csv", index_col=0)
-    df = df.loc[df.index >= 2010]
-    save_path2 = os.path.join(settings.DATA_DIR, "all_df_checkpoint_2010.csv")
-    all_df.to_csv(save_path2)
+    kokkai_df = collect_mention_counts(kokkai, cache)
+    save_mention_tables(gikai_df, kokkai_df)
+
+    if cache is not None:
+        cache.report()
+        cache.close()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
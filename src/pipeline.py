@@ -0,0 +1,254 @@
+# pipeline.py
+# main.py の各処理（scrape → clean → panel → visualize / regression）をステージとして定義し、
+# 入力ファイルのハッシュが前回と同じで出力が残っているステージはスキップする小さなパイプライン。
+# 依存関係のないステージ（visualize と regression）は別プロセスで並行に実行する。
+import glob
+import hashlib
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+import settings
+from data_processor import JsonManifest, file_sha256
+
+
+def files(*patterns):
+    """
+    実行時にグロブを展開してファイル一覧を返す関数を作る（上流のステージが作るファイルを指定するため）。
+    """
+    def resolve():
+        return sorted({path for pattern in patterns for path in glob.glob(pattern) if os.path.isfile(path)})
+    return resolve
+
+
+def cleaned_files():
+    from storage import get_cleaned_storage
+    extension = get_cleaned_storage().extension
+    return files(*[os.path.join(settings.CLEAND_DIR, key, f"*{extension}") for key in [
+        settings.RESEARCH_EXPENSE_FILE_KEY, settings.PATENT_COUNT_FILE_KEY, settings.LABOR_NUMBER_FILE_KEY]])()
+
+
+def get_storage_extension():
+    from storage import get_storage
+    return get_storage().extension
+
+
+def panel_files():
+    return [os.path.join(settings.PANELDATA_DIR, f"{settings.PANEL_DATA_NAME}{get_storage_extension()}")]
+
+
+def source_files(*modules):
+    return [os.path.join(settings.BASE_DIR, module) for module in modules]
+
+
+class Stage:
+    """
+    パイプラインの1ステージ。
+    inputs / outputs はファイルパスのリストを返す関数、code はステージの処理を実装しているソースファイル、
+    params はファイル以外で結果に影響する設定値。これらのハッシュが前回と同じならステージをスキップできる。
+    """
+    def __init__(self, name: str, run, deps=(), inputs=None, outputs=None, code=(), params=None):
+        self.name = name
+        self.run = run
+        self.deps = list(deps)
+        self.inputs = inputs or (lambda: [])
+        self.outputs = outputs or (lambda: [])
+        self.code = list(code)
+        self.params = params or (lambda: None)
+
+    def fingerprint(self) -> str:
+        digest = hashlib.sha256()
+        named = [(path, path) for path in self.inputs()] + [(os.path.basename(path), path) for path in self.code]
+        for name, path in named:
+            digest.update(name.encode("utf-8"))
+            digest.update(file_sha256(path).encode("ascii") if os.path.exists(path) else b"missing")
+        digest.update(repr(self.params()).encode("utf-8"))
+        return digest.hexdigest()
+
+
+### ステージの処理（別プロセスから呼べるようにモジュールのトップレベルに置く） ###
+
+def run_scrape(options: dict):
+    import data_processor
+    scraper = data_processor.DataScraper(settings.BASE_URLs_scrape, settings.DOWNLOAD_DIR, settings.YEARS_TO_SCRAPE)
+    if settings.SCRAPER_CONCURRENT:
+        scraper.run_scraper_concurrent()
+    else:
+        scraper.run_scraper()
+
+
+def run_clean(options: dict):
+    import data_processor
+    cleaner = data_processor.DataCleaner(settings.DOWNLOAD_DIR, settings.CLEAND_DIR)
+    cleaner.clean_all_data(incremental=settings.CLEAN_INCREMENTAL, jobs=options.get("jobs", settings.CLEAN_JOBS))
+    # 失敗した年があればステージを記録せず、次回に再実行する
+    if cleaner.failures:
+        raise RuntimeError(f"{len(cleaner.failures)} workbook(s) failed to clean: "
+                           f"{[(table, year) for table, year, _ in cleaner.failures]}")
+
+
+def run_panel(options: dict):
+    import data_processor
+    panel_df, _, _, _ = data_processor.PanelDataProducer.create_panel_data()
+    if panel_df is None:
+        raise RuntimeError("パネルデータを作成できませんでした。")
+
+
+def run_visualize(options: dict):
+    import storage
+    import visualization
+    panel_df = storage.load_panel_data()
+    visualization.Plotsproducer.generate_all_visualizations(panel_df)
+
+
+def run_regression(options: dict):
+    import regression
+    regression.run_regressions()
+    regression.run_specification_grid()
+
+
+def build_stages() -> dict:
+    stages = [
+        Stage("scrape", run_scrape,
+              outputs=files(os.path.join(settings.DOWNLOAD_DIR, "*.xls*")),
+              params=lambda: (settings.BASE_URLs_scrape, settings.YEARS_TO_SCRAPE, settings.TARGET_TABLE_NAMES)),
+        Stage("clean", run_clean, deps=["scrape"],
+              inputs=files(os.path.join(settings.DOWNLOAD_DIR, "*.xls*")),
+              outputs=cleaned_files,
+              code=source_files("data_processor.py", "layouts.py", "schema.py", "storage.py"),
+              params=lambda: settings.CLEANED_STORAGE_FORMAT),
+        Stage("panel", run_panel, deps=["clean"],
+              inputs=cleaned_files,
+              outputs=panel_files,
+              code=source_files("data_processor.py", "industries.py", "schema.py", "storage.py"),
+              params=lambda: settings.PANEL_DUPLICATE_POLICY),
+        Stage("visualize", run_visualize, deps=["panel"],
+              inputs=panel_files,
+              outputs=files(*[os.path.join(d, "*.png") for d in [
+                  settings.BAR_CHARTS_DIR, settings.TIMESERIES_DIR, settings.PLOTS_DIR]]),
+              code=source_files("visualization.py", "industries.py", "schema.py", "storage.py"),
+              params=lambda: (settings.BAR_CHARTS_DIR, settings.TIMESERIES_DIR, settings.PLOTS_DIR,
+                              settings.RENDER_MANIFEST, settings.PLOT_INCREMENTAL)),
+        Stage("regression", run_regression, deps=["panel"],
+              inputs=panel_files,
+              outputs=files(os.path.join(settings.OUTPUT_PATH, "regression_results.txt"),
+                            os.path.join(settings.OUTPUT_PATH, settings.REGRESSION_RESULTS_FILE),
+                            os.path.join(settings.OUTPUT_PATH, f"{settings.REGRESSION_COEFFICIENTS_NAME}.*"),
+                            os.path.join(settings.OUTPUT_PATH, settings.SPEC_GRID_FILE)),
+              code=source_files("regression.py", "estimation.py", "industries.py", "schema.py", "storage.py"),
+              params=lambda: (settings.REGRESSION_GRID_MAX_LAG, settings.REGRESSION_GRID_EFFECTS,
+                              settings.REGRESSION_GRID_COV_TYPES, settings.BOOTSTRAP_REPS, settings.BOOTSTRAP_WEIGHTS,
+                              settings.PERMUTATION_REPS, settings.RESAMPLING_SEED, settings.RESAMPLING_CHUNK_SIZE)),
+    ]
+    return {stage.name: stage for stage in stages}
+
+
+def run_stage_task(name: str, options: dict):
+    """
+    プロセスプールで実行するタスク。ステージは子プロセス側で組み立て直す。
+    """
+    build_stages()[name].run(options)
+
+
+class Pipeline:
+    def __init__(self, stages: dict = None, state_path: str = None, parallel: bool = True):
+        self.stages = stages or build_stages()
+        self.state = JsonManifest(state_path or os.path.join(settings.DATA_DIR, settings.PIPELINE_STATE))
+        self.parallel = parallel
+
+    def ancestors(self, name: str) -> list:
+        """
+        name とその上流のステージを、実行できる順に返す。
+        """
+        order = []
+        def visit(n):
+            for dep in self.stages[n].deps:
+                visit(dep)
+            if n not in order:
+                order.append(n)
+        visit(name)
+        return order
+
+    def select(self, until: str = None, only: list = None) -> list:
+        if only:
+            return [name for name in self.stages if name in only]
+        if until:
+            return self.ancestors(until)
+        return list(self.stages)
+
+    def is_up_to_date(self, stage: Stage, fingerprint: str) -> bool:
+        entry = self.state.get(stage.name)
+        if not entry or entry.get("fingerprint") != fingerprint:
+            return False
+        outputs = entry.get("outputs", [])
+        return bool(outputs) and all(os.path.exists(path) for path in outputs)
+
+    def run(self, until: str = None, only: list = None, force: bool = False, options: dict = None) -> bool:
+        """
+        選ばれたステージを依存順に実行する。上流が終わったステージから順にまとめて（並行に）実行し、
+        失敗したステージの下流は実行しない。すべて成功すれば True を返す。
+        """
+        options = options or {}
+        selected = self.select(until, only)
+        done, failed = set(), set()
+        pending = list(selected)
+        while pending:
+            # 選ばれた上流ステージがすべて終わっているものを、この回にまとめて実行する
+            ready = [n for n in pending if all(d in done | failed or d not in selected for d in self.stages[n].deps)]
+            if not ready:
+                raise ValueError(f"Stages {pending} have unresolvable dependencies.")
+            pending = [n for n in pending if n not in ready]
+            blocked = [n for n in ready if any(d in failed for d in self.stages[n].deps)]
+            for name in blocked:
+                print(f"✗ {name}: 上流のステージが失敗したためスキップします")
+                failed.add(name)
+            ready = [n for n in ready if n not in blocked]
+
+            to_run = {}
+            for name in ready:
+                stage = self.stages[name]
+                fingerprint = stage.fingerprint()
+                if not force and self.is_up_to_date(stage, fingerprint):
+                    print(f"✓ {name}: 最新のためスキップします")
+                    done.add(name)
+                else:
+                    to_run[name] = fingerprint
+            for name, error in self.execute(list(to_run), options).items():
+                if error is None:
+                    stage = self.stages[name]
+                    # 入力は実行前のハッシュを記録する（実行中に変わった場合は次回に再実行される）
+                    self.state.set(name, {"fingerprint": to_run[name], "outputs": stage.outputs(),
+                                          "finished_at": time.strftime("%Y-%m-%d %H:%M:%S")})
+                    self.state.save()
+                    done.add(name)
+                else:
+                    traceback.print_exception(error)
+                    print(f"✗ {name}: {error!r}")
+                    failed.add(name)
+        return not failed
+
+    def execute(self, names: list, options: dict) -> dict:
+        """
+        ステージを実行し、{ステージ名: 例外または None} を返す。2つ以上あれば別プロセスで並行に実行する。
+        """
+        results = {}
+        if len(names) > 1 and self.parallel:
+            print(f"▶ {', '.join(names)} を並行に実行します")
+            with ProcessPoolExecutor(max_workers=len(names)) as executor:
+                futures = {name: executor.submit(run_stage_task, name, options) for name in names}
+                for name, future in futures.items():
+                    try:
+                        future.result()
+                        results[name] = None
+                    except Exception as e:
+                        results[name] = e
+            return results
+        for name in names:
+            print(f"▶ {name}")
+            try:
+                self.stages[name].run(options)
+                results[name] = None
+            except Exception as e:
+                results[name] = e
+        return results
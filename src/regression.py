@@ -1,14 +1,20 @@
 import pandas as pd
 import numpy as np
-from linearmodels import PanelOLS
+import json
+import time
 import warnings
 import os
+import estimation
 import settings
+import storage
+from industries import industry_hierarchy
 warnings.filterwarnings('ignore')
 
 # 出力ファイルパスの設定
 file_name = "regression_results.txt"
 output_text_path = os.path.join(settings.OUTPUT_PATH, file_name)
+# 推定結果の構造化データ（テキストのレポートはここから作る）
+results_json_path = os.path.join(settings.OUTPUT_PATH, settings.REGRESSION_RESULTS_FILE)
 
 # 出力をファイルに書き込むための関数
 def write_to_file(f_obj, content):
@@ -16,298 +22,488 @@ def write_to_file(f_obj, content):
     print(content) # コンソールにも表示したい場合
 
 
-def run_regressions(panel_df = None):
-    # ファイルを開いて処理を開始
-    with open(output_text_path, 'w', encoding='utf-8') as f:
-        # write_to_file 関数を使ってすべての出力をファイルとコンソールに表示
-        writer = lambda content: write_to_file(f, content)
-
-        # Data loading
-        if panel_df is None:
-            df = pd.read_csv(os.path.join(settings.PANELDATA_DIR, 'panel_data.csv'))
-        else:
-            df = panel_df
-        writer("=" * 80)
-        writer("パネルデータ固定効果モデル分析")
-        writer("=" * 80)
-
-        writer("\n=== データ前処理 ===")
-
-        # 必要な列を選択
-        analysis_df = df[['year', 'industry_name', 'industry_id', 'company_count', 
-                        'r_and_d_sales', 'r_and_d_total', 'patent_count', 
-                        'utility_count', 'design_count']].copy()
-
-        writer(f"初期データ数: {len(analysis_df)}")
-
-        # industry_idの確認
-        writer(f"\n【industry_idの値確認】")
-        writer("ユニークなindustry_id:")
-        unique_ids = analysis_df['industry_id'].unique()
-        writer(str(sorted(unique_ids))) # リストを文字列に変換して書き込み
-
-        # 欠損値除去
-        analysis_df = analysis_df.dropna()
-        writer(f"欠損値除去後: {len(analysis_df)}")
-
-        # 数値型に変換
-        numeric_columns = ['company_count', 'r_and_d_sales', 'r_and_d_total', 'patent_count', 
-                        'utility_count', 'design_count']
-        for col in numeric_columns:
-            analysis_df[col] = pd.to_numeric(analysis_df[col], errors='coerce')
-            analysis_df[col] = analysis_df[col].astype('Int64')  # 整数型に変換
-
-        analysis_df['industry_name'] = analysis_df['industry_name'].astype('str')
-
-        # 再度欠損値除去
-        analysis_df = analysis_df.dropna()
-        writer(f"数値変換後: {len(analysis_df)}")
-
-        # ゼロ値や負値の処理
-        analysis_df = analysis_df[analysis_df['r_and_d_sales'] > 0]
-        analysis_df = analysis_df[analysis_df['r_and_d_total'] >= 0]
-        analysis_df = analysis_df[analysis_df['patent_count'] >= 0]
-
-        writer(f"前処理完了後のデータ数: {len(analysis_df)}")
-
-        # 産業大分類を作成（修正版）
-        def create_industry_major(industry_id):
-            """industry_idから産業大分類を作成"""
-            id_str = str(industry_id)
-            
-            # 数字のみの場合は最初の桁を使用
-            if id_str.isdigit():
-                if len(id_str) >= 3:
-                    return int(id_str[0])  # 100の位
-                else:
-                    return int(id_str[0])  # 最初の桁
-            
-            # アルファベットの場合は文字コードを使用
-            elif id_str.isalpha():
-                # A=10, B=11, C=12, ..., Z=35
-                return ord(id_str[0]) - ord('A') + 10
-            
-            # 混合の場合は最初の文字を判定
-            else:
-                first_char = id_str[0]
-                if first_char.isdigit():
-                    return int(first_char)
-                else:
-                    return ord(first_char) - ord('A') + 10
-
-        analysis_df['industry_major'] = analysis_df['industry_id'].apply(create_industry_major)
-
-        writer(f"\n【産業大分類の分布】")
-        industry_mapping = analysis_df.groupby('industry_major')['industry_id'].apply(lambda x: list(x.unique())).to_dict()
-        for major, ids in sorted(industry_mapping.items()):
-            writer(f"大分類 {major}: {ids[:5]}{'...' if len(ids) > 5 else ''}")
-
-        writer(f"\n産業大分類数: {analysis_df['industry_major'].nunique()}")
-        writer(f"年数: {analysis_df['year'].nunique()}")
-        writer(f"年の範囲: {analysis_df['year'].min()} - {analysis_df['year'].max()}")
-
-        # 年でソート
-        analysis_df = analysis_df.sort_values(['industry_major', 'year'])
-
-        writer("\n=== パネルデータ変数作成 ===")
-
-        # 産業大分類ごとにグループ化して変数作成
-        def create_panel_variables(group):
-            """パネルデータ用の変数を作成"""
-            # 特許件数の差分（ストック→フロー変換）
-            group['patent_diff'] = group['patent_count'].diff()
-            
-            # 売上高による正規化
-            group['patent_intensity'] = group['patent_diff'] / group['r_and_d_sales']
-            group['rd_intensity'] = group['r_and_d_total'] / group['r_and_d_sales']
-            group['company_count_norm'] = group['company_count'] / group['r_and_d_sales']
-            group['utility_intensity'] = group['utility_count'] / group['r_and_d_sales']
-            group['design_intensity'] = group['design_count'] / group['r_and_d_sales']
-            
-            # ラグ変数作成
-            group['rd_intensity_lag1'] = group['rd_intensity'].shift(1)
-            group['rd_intensity_lag2'] = group['rd_intensity'].shift(2)
-            group['company_count_lag1'] = group['company_count_norm'].shift(1)
-            group['utility_count_lag1'] = group['utility_intensity'].shift(1)
-            group['design_count_lag1'] = group['design_intensity'].shift(1)
-            
-            return group
-
-        # グループごとに変数作成
-        analysis_df = analysis_df.groupby('industry_major').apply(create_panel_variables).reset_index(drop=True)
-
-        # 無限大値や欠損値を除去
-        analysis_df = analysis_df.replace([np.inf, -np.inf], np.nan)
-
-        writer(f"変数作成後のデータ数: {len(analysis_df)}")
-
-        # パネルデータ用にマルチインデックス設定
-        panel_df = analysis_df.set_index(['industry_major', 'year'])
-
-        writer(f"パネルデータ形状: {panel_df.shape}")
-        writer(f"産業数: {len(panel_df.index.get_level_values(0).unique())}")
-        writer(f"年数: {len(panel_df.index.get_level_values(1).unique())}")
-
+def map_industry_major(industry_ids: pd.Series) -> pd.Series:
+    """industry_id の列を回帰の産業グループ（IndustryHierarchy.code_group）に変換する（ユニークな値ごとに1回だけ計算する）"""
+    mapping = {industry_id: industry_hierarchy.code_group(industry_id) for industry_id in industry_ids.unique()}
+    return industry_ids.map(mapping).astype('int64')
+
+
+# 売上高で割る変数: 列名 → 分子の列（patent_diff は差分を取った後に計算する）
+INTENSITY_COLUMNS = {
+    'patent_intensity': 'patent_diff',
+    'rd_intensity': 'r_and_d_total',
+    'company_count_norm': 'company_count',
+    'utility_intensity': 'utility_count',
+    'design_intensity': 'design_count',
+}
+# ラグ変数: 列名 → (元の列, ラグ)
+LAG_COLUMNS = {
+    'rd_intensity_lag1': ('rd_intensity', 1),
+    'rd_intensity_lag2': ('rd_intensity', 2),
+    'company_count_lag1': ('company_count_norm', 1),
+    'utility_count_lag1': ('utility_intensity', 1),
+    'design_count_lag1': ('design_intensity', 1),
+}
+# 定式化グリッドで研究開発費のラグに加える統制変数
+GRID_CONTROLS = ['company_count_lag1', 'utility_count_lag1', 'design_count_lag1']
+
+
+def create_panel_variables(analysis_df: pd.DataFrame, group_column: str = 'industry_major') -> pd.DataFrame:
+    """
+    パネルデータ用の変数を作成する。analysis_df は group_column と year で並べ替え済みであること。
+    差分とラグはグループ単位の diff / shift でまとめて計算し、グループ外の行をまたがない。
+    """
+    df = analysis_df.copy()
+    groups = df.groupby(group_column, sort=False)
+    # 特許件数の差分（ストック→フロー変換）
+    df['patent_diff'] = groups['patent_count'].diff()
+    # 売上高による正規化
+    for column, numerator in INTENSITY_COLUMNS.items():
+        df[column] = df[numerator] / df['r_and_d_sales']
+    # ラグ変数作成
+    groups = df.groupby(group_column, sort=False)
+    for column, (source, lag) in LAG_COLUMNS.items():
+        df[column] = groups[source].shift(lag)
+    return df.reset_index(drop=True)
+
+
+def prepare_analysis_panel(df: pd.DataFrame) -> tuple:
+    """
+    パネルデータから回帰に使う変数を作り、(analysis_df, 産業大分類×年の MultiIndex を持つ panel_df, 前処理の記録) を返す。
+    """
+    info = {}
+    # (industry_id, year) を一意にする（保存済みのパネルデータでは作成時に一意になっている）
+    store = storage.PanelStore(df)
+    info['rows_dropped_by_key'] = len(store.unresolved) + len(store.duplicates)
+    # 必要な列を選択
+    analysis_df = store.data[['year', 'industry_name', 'industry_id', 'company_count', 
+                    'r_and_d_sales', 'r_and_d_total', 'patent_count', 
+                    'utility_count', 'design_count']].copy()
+
+    info['initial_rows'] = len(analysis_df)
+    # industry_idの確認
+    info['unique_industry_ids'] = [str(i) for i in sorted(analysis_df['industry_id'].unique())]
+
+    # 欠損値除去（数値の列はクリーニング時に nullable な整数型になっている）
+    analysis_df = analysis_df.dropna()
+    info['rows_after_dropna'] = len(analysis_df)
+
+    analysis_df['industry_name'] = analysis_df['industry_name'].astype('str')
+
+    # ゼロ値や負値の処理
+    analysis_df = analysis_df[analysis_df['r_and_d_sales'] > 0]
+    analysis_df = analysis_df[analysis_df['r_and_d_total'] >= 0]
+    analysis_df = analysis_df[analysis_df['patent_count'] >= 0]
+    info['rows_after_filters'] = len(analysis_df)
+
+    # 合計（000）は他の産業を集計した行なので、エンティティに含めない
+    is_total = industry_hierarchy.level_mask(analysis_df['industry_id'], 'total')
+    info['rows_dropped_total'] = int(is_total.sum())
+    analysis_df = analysis_df[~is_total]
+
+    # 産業大分類を作成（修正版）
+    analysis_df['industry_major'] = map_industry_major(analysis_df['industry_id'])
+
+    industry_mapping = analysis_df.groupby('industry_major')['industry_id'].apply(lambda x: list(x.unique())).to_dict()
+    info['industry_majors'] = {str(major): [str(i) for i in ids] for major, ids in sorted(industry_mapping.items())}
+    info['n_majors'] = int(analysis_df['industry_major'].nunique())
+    info['n_years'] = int(analysis_df['year'].nunique())
+    info['year_range'] = [int(analysis_df['year'].min()), int(analysis_df['year'].max())]
+
+    # 年でソート
+    analysis_df = analysis_df.sort_values(['industry_major', 'year'])
+
+    # 産業大分類ごとに変数作成
+    analysis_df = create_panel_variables(analysis_df)
+
+    # 無限大値や欠損値を除去
+    analysis_df = analysis_df.replace([np.inf, -np.inf], np.nan)
+    info['rows_after_variables'] = len(analysis_df)
+
+    # パネルデータ用にマルチインデックス設定
+    panel_df = analysis_df.set_index(['industry_major', 'year'])
+    info['panel_shape'] = list(panel_df.shape)
+    info['panel_entities'] = int(panel_df.index.get_level_values(0).nunique())
+    info['panel_years'] = int(panel_df.index.get_level_values(1).nunique())
+
+    return analysis_df, panel_df, info
+
+
+def add_lag_columns(analysis_df: pd.DataFrame, source: str, lags, group_column: str = 'industry_major') -> pd.DataFrame:
+    """{source}_lag{n} の列がなければ追加する。analysis_df は group_column と year で並べ替え済みであること。"""
+    df = analysis_df.copy()
+    groups = df.groupby(group_column, sort=False)[source]
+    for lag in lags:
+        column = f"{source}_lag{lag}"
+        if column not in df.columns:
+            df[column] = groups.shift(lag)
+    return df
+
+
+def grid_lag_sets(max_lag: int) -> list:
+    """研究開発費集約度の1期〜n期ラグ（n = 1..max_lag）と、それぞれに統制変数を加えた組"""
+    lag_sets = []
+    for n in range(1, max_lag + 1):
+        lags = [f"rd_intensity_lag{lag}" for lag in range(1, n + 1)]
+        lag_sets += [lags, lags + GRID_CONTROLS]
+    return lag_sets
+
+
+def run_specification_grid(panel_df=None, max_lag: int = settings.REGRESSION_GRID_MAX_LAG,
+                           effects=None, cov_types=None, jobs: int = settings.REGRESSION_GRID_JOBS) -> pd.DataFrame:
+    """
+    ラグの組 × 効果 × 共分散推定量 の定式化グリッドを推定し、係数表を reports/ に CSV で保存して返す。
+    """
+    df = storage.load_panel_data() if panel_df is None else panel_df
+    analysis_df, _, _ = prepare_analysis_panel(df)
+    analysis_df = add_lag_columns(analysis_df, 'rd_intensity', range(1, max_lag + 1))
+    panel = analysis_df.set_index(['industry_major', 'year'])
+
+    specs = estimation.specification_grid(
+        ['patent_intensity'], grid_lag_sets(max_lag),
+        effects or settings.REGRESSION_GRID_EFFECTS, cov_types or settings.REGRESSION_GRID_COV_TYPES)
+    table = estimation.fit_grid(panel, specs, jobs=jobs)
+
+    os.makedirs(settings.OUTPUT_PATH, exist_ok=True)
+    path = os.path.join(settings.OUTPUT_PATH, settings.SPEC_GRID_FILE)
+    table.to_csv(path, index=False)
+    print(f"✓ {table['spec_id'].nunique()} / {len(specs)} 個の定式化を推定しました → {path}")
+    return table
+
+
+# レポートに載せるモデル（いずれも産業固定効果・産業クラスタ標準誤差）
+REPORT_MODELS = [
+    {
+        'key': 'model_1',
+        'title': 'モデル① : 1期ラグ固定効果パネルモデル',
+        'formula': ["Δ特許件数/売上高_it = α_i + β₁(研究開発費/売上高)_{i,t-1} + ε_{it}",
+                    "where α_i = 産業固定効果"],
+        'regressors': ['rd_intensity_lag1'],
+    },
+    {
+        'key': 'model_2',
+        'title': 'モデル② : 2期ラグ固定効果パネルモデル',
+        'formula': ["Δ特許件数/売上高_it = α_i + β₁(研究開発費/売上高)_{i,t-1} + β₂(研究開発費/売上高)_{i,t-2} + ε_{it}"],
+        'regressors': ['rd_intensity_lag1', 'rd_intensity_lag2'],
+    },
+]
+TERM_LABELS = {
+    'rd_intensity_lag1': '研究開発費集約度(t-1)',
+    'rd_intensity_lag2': '研究開発費集約度(t-2)',
+}
+SUMMARY_VARS = ['patent_intensity', 'rd_intensity_lag1', 'rd_intensity_lag2']
+RESULTS_SCHEMA_VERSION = 7
+
+
+def significance(pvalue) -> str:
+    if pvalue is None:
+        return ""
+    if pvalue < 0.01:
+        return "***"
+    if pvalue < 0.05:
+        return "**"
+    if pvalue < 0.1:
+        return "*"
+    return ""
+
+
+def to_jsonable(value):
+    """numpy の値を JSON に書ける型にする（NaN は null）"""
+    if isinstance(value, dict):
+        return {str(k): to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [to_jsonable(v) for v in value]
+    if isinstance(value, (np.integer, int)) and not isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (np.floating, float)):
+        return None if np.isnan(value) else float(value)
+    return value
+
+
+def model_record(model: dict, spec, fit) -> dict:
+    """1つのモデルの定式化と推定結果を、結果ファイルに書く形にまとめる。"""
+    record = {
+        'key': model['key'], 'title': model['title'], 'formula': model['formula'],
+        'spec': {'dependent': spec.dependent, 'regressors': list(spec.regressors),
+                 'effects': spec.effects, 'cov_type': spec.cov_type, 'cluster': 'entity'},
+    }
+    if not isinstance(fit, dict):
+        record['error'] = str(fit)
+        return record
+    record['params'] = {
+        term: {'coef': fit['params'][j], 'std_err': fit['std_errors'][j], 't_stat': fit['tstats'][j],
+               'p_value': fit['pvalues'][j], 'ci_lower': fit['ci_lower'][j], 'ci_upper': fit['ci_upper'][j]}
+        for j, term in enumerate(spec.regressors)
+    }
+    for key in ['nobs', 'n_entities', 'n_periods', 'df_resid', 'rsquared', 'rsquared_within',
+                'rsquared_between', 'rsquared_overall', 'loglik', 'entity_obs', 'time_obs']:
+        record[key] = fit[key]
+    record['f_statistic'] = {'stat': fit['f_statistic'], 'pvalue': fit['f_statistic_pvalue'],
+                             'df': len(spec.regressors), 'df_denom': fit['df_resid']}
+    record['f_statistic_robust'] = {'stat': fit['f_statistic_robust'], 'pvalue': fit['f_statistic_robust_pvalue'],
+                                    'df': len(spec.regressors), 'df_denom': fit['df_resid']}
+    record['f_pooled'] = {'stat': fit['f_pooled'], 'pvalue': fit['f_pooled_pvalue'],
+                          'df': fit['df_pooled'], 'df_denom': fit['df_resid']}
+    return record
+
+
+def resampling_record(sample, spec) -> dict:
+    """
+    各説明変数について、係数 = 0 のワイルド・クラスタ・ブートストラップと並べ替え検定の p 値を求める。
+    クラスタ（産業大分類）が少ないとクラスタ標準誤差が不安定になるため、その補完として使う。
+    """
+    record = {}
+    for term in spec.regressors:
+        record[term] = {}
+        if settings.BOOTSTRAP_REPS > 0:
+            record[term]['wild_cluster_bootstrap'] = estimation.wild_cluster_bootstrap(sample, spec, term)
+        if settings.PERMUTATION_REPS > 0:
+            record[term]['permutation'] = estimation.permutation_test(sample, spec, term)
+    return record
+
+
+def build_regression_results(df: pd.DataFrame) -> dict:
+    """
+    前処理・モデル推定・記述統計を行い、レポートの元になる結果を dict で返す。
+    """
+    analysis_df, panel_df, info = prepare_analysis_panel(df)
+    specs = [estimation.Specification('patent_intensity', model['regressors'], 'entity', 'clustered')
+             for model in REPORT_MODELS]
+    # demean 済みの行列は推定と再標本化で共有する
+    samples = estimation.prepare_samples(panel_df, specs)
+    fits = estimation.fit_specifications(panel_df, specs, samples=samples)
+    records = []
+    for model, spec, fit in zip(REPORT_MODELS, specs, fits):
+        record = model_record(model, spec, fit)
+        if 'error' not in record:
+            record['resampling'] = resampling_record(samples[estimation.sample_columns(spec)], spec)
+        records.append(record)
+    return to_jsonable({
+        'schema_version': RESULTS_SCHEMA_VERSION,
+        'generated_at': time.strftime("%Y-%m-%d %H:%M:%S"),
+        'preprocessing': info,
+        'models': records,
+        'descriptive': panel_df[SUMMARY_VARS].astype(float).describe().to_dict(),
+        'industry_counts': analysis_df.groupby('industry_major')['year'].count().sort_index().to_dict(),
+    })
+
+
+def coefficient_frame(results: dict) -> pd.DataFrame:
+    """結果の係数を、1行が（モデル, 説明変数）の表にする。"""
+    rows = []
+    for model in results['models']:
+        for term, values in model.get('params', {}).items():
+            resampling = model.get('resampling', {}).get(term, {})
+            rows.append({'model': model['key'], **model['spec'], 'regressors': " + ".join(model['spec']['regressors']),
+                         'term': term, **values,
+                         'wild_bootstrap_p': resampling.get('wild_cluster_bootstrap', {}).get('pvalue'),
+                         'permutation_p': resampling.get('permutation', {}).get('pvalue'),
+                         'nobs': model['nobs'], 'n_entities': model['n_entities'],
+                         'rsquared': model['rsquared'], 'rsquared_within': model['rsquared_within'],
+                         'rsquared_between': model['rsquared_between'],
+                         'rsquared_overall': model['rsquared_overall']})
+    return pd.DataFrame(rows)
+
+
+def save_regression_results(results: dict, path: str = None) -> str:
+    """結果を JSON で保存し、係数表も中間データと同じ形式（既定は Parquet）で保存する。"""
+    path = path or results_json_path
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    storage.get_storage().save(coefficient_frame(results), os.path.dirname(path) or ".",
+                               settings.REGRESSION_COEFFICIENTS_NAME, index=False)
+    return path
+
+
+def load_regression_results(path: str = None) -> dict:
+    """保存済みの結果を読み込む。"""
+    with open(path or results_json_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def fmt(value, spec: str) -> str:
+    return "nan" if value is None else format(value, spec)
+
+
+def render_summary(model: dict) -> list:
+    """1つのモデルの推定結果の要約表（linearmodels の summary と同じ項目）"""
+    spec = model['spec']
+    effects = {'none': "None", 'entity': "Entity", 'time': "Time", 'twoway': "Entity, Time"}[spec['effects']]
+    f_stat, f_robust, f_pooled = model['f_statistic'], model['f_statistic_robust'], model['f_pooled']
+    left = [
+        ("Dep. Variable:", spec['dependent']), ("Estimator:", "PanelOLS"),
+        ("No. Observations:", model['nobs']), ("Cov. Estimator:", spec['cov_type'].capitalize()), ("", ""),
+        ("Entities:", model['n_entities']), ("Avg Obs:", fmt(model['entity_obs']['mean'], ".3f")),
+        ("Min Obs:", model['entity_obs']['min']), ("Max Obs:", model['entity_obs']['max']), ("", ""),
+        ("Time periods:", model['n_periods']), ("Avg Obs:", fmt(model['time_obs']['mean'], ".3f")),
+        ("Min Obs:", model['time_obs']['min']), ("Max Obs:", model['time_obs']['max']),
+    ]
+    right = [
+        ("R-squared:", fmt(model['rsquared'], ".4f")), ("R-squared (Between):", fmt(model['rsquared_between'], ".4f")),
+        ("R-squared (Within):", fmt(model['rsquared_within'], ".4f")),
+        ("R-squared (Overall):", fmt(model['rsquared_overall'], ".4f")), ("Log-likelihood", fmt(model['loglik'], ".1f")),
+        ("F-statistic:", fmt(f_stat['stat'], ".4f")), ("P-value", fmt(f_stat['pvalue'], ".4f")),
+        ("Distribution:", f"F({f_stat['df']},{f_stat['df_denom']})"), ("", ""),
+        ("F-statistic (robust):", fmt(f_robust['stat'], ".4f")), ("P-value", fmt(f_robust['pvalue'], ".4f")),
+        ("Distribution:", f"F({f_robust['df']},{f_robust['df_denom']})"),
+    ]
+    right += [("", "")] * (len(left) - len(right))
+    lines = [f"{'PanelOLS Estimation Summary':^80}", "=" * 80]
+    for (l_name, l_value), (r_name, r_value) in zip(left, right):
+        lines.append(f"{l_name:<21}{str(l_value):>17}   {r_name:<22}{str(r_value):>18}".rstrip())
+
+    term_width = max(len(term) for term in model['params'])
+    width = term_width + 66
+    lines += ["", f"{'Parameter Estimates':^{width}}", "=" * width,
+              f"{'':<{term_width}}{'Parameter':>11}{'Std. Err.':>11}{'T-stat':>11}{'P-value':>11}{'Lower CI':>11}{'Upper CI':>11}",
+              "-" * width]
+    for term, v in model['params'].items():
+        lines.append(f"{term:<{term_width}}" + "".join(f"{fmt(v[key], '.4f'):>11}" for key in [
+            'coef', 'std_err', 't_stat', 'p_value', 'ci_lower', 'ci_upper']))
+    lines.append("=" * width)
+    if f_pooled['stat'] is not None:
+        lines += ["", f"F-test for Poolability: {fmt(f_pooled['stat'], '.4f')}",
+                  f"P-value: {fmt(f_pooled['pvalue'], '.4f')}",
+                  f"Distribution: F({f_pooled['df']},{f_pooled['df_denom']})"]
+    lines += ["", f"Included effects: {effects}"]
+    return lines
+
+
+def render_report(results: dict) -> list:
+    """
+    結果からテキストのレポートを行のリストとして作る。
+    """
+    lines = []
+    writer = lines.append
+    info = results['preprocessing']
+
+    writer("=" * 80)
+    writer("パネルデータ固定効果モデル分析")
+    writer("=" * 80)
+
+    writer("\n=== データ前処理 ===")
+    writer(f"主キーの重複・産業ID不明で除外: {info['rows_dropped_by_key']}")
+    writer(f"初期データ数: {info['initial_rows']}")
+    writer(f"\n【industry_idの値確認】")
+    writer("ユニークなindustry_id:")
+    writer(str(info['unique_industry_ids']))
+    writer(f"欠損値除去後: {info['rows_after_dropna']}")
+    writer(f"前処理完了後のデータ数: {info['rows_after_filters']}")
+    writer(f"合計（000）の行を除外: {info['rows_dropped_total']}")
+
+    writer(f"\n【産業大分類の分布】")
+    for major, ids in sorted(info['industry_majors'].items(), key=lambda item: int(item[0])):
+        writer(f"大分類 {major}: {ids[:5]}{'...' if len(ids) > 5 else ''}")
+    writer(f"\n産業大分類数: {info['n_majors']}")
+    writer(f"年数: {info['n_years']}")
+    writer(f"年の範囲: {info['year_range'][0]} - {info['year_range'][1]}")
+
+    writer("\n=== パネルデータ変数作成 ===")
+    writer(f"変数作成後のデータ数: {info['rows_after_variables']}")
+    writer(f"パネルデータ形状: {tuple(info['panel_shape'])}")
+    writer(f"産業数: {info['panel_entities']}")
+    writer(f"年数: {info['panel_years']}")
+
+    for model in results['models']:
         writer("\n" + "=" * 80)
-        writer("モデル① : 1期ラグ固定効果パネルモデル")
+        writer(model['title'])
         writer("=" * 80)
-
         writer("\n【数式】")
-        writer("Δ特許件数/売上高_it = α_i + β₁(研究開発費/売上高)_{i,t-1} + ε_{it}")
-        writer("where α_i = 産業固定効果")
-
-        # モデル①：1期ラグ + 固定効果
-        try:
-            # データ準備
-            model_1_data = panel_df.dropna(subset=['patent_intensity', 'rd_intensity_lag1'])
-            
-            dependent_1 = model_1_data['patent_intensity']
-            exog_1 = model_1_data[['rd_intensity_lag1']]
-            
-            writer(f"\n【データ情報】")
-            writer(f"使用データ数: {len(dependent_1)}")
-            writer(f"産業数: {len(dependent_1.index.get_level_values(0).unique())}")
-            writer(f"年数: {len(dependent_1.index.get_level_values(1).unique())}")
-            
-            # 固定効果パネルモデル
-            model_1 = PanelOLS(dependent_1, exog_1, entity_effects=True)
-            results_1 = model_1.fit(cov_type='clustered', cluster_entity=True)
-            
-            writer(f"\n【回帰結果】")
-            # results_1.summary は長いので、文字列に変換して書き込み
-            writer(str(results_1.summary))
-            
-            writer(f"\n【主要結果】")
-            writer(f"研究開発費集約度(t-1)の係数: {results_1.params['rd_intensity_lag1']:.6f}")
-            writer(f"標準誤差: {results_1.std_errors['rd_intensity_lag1']:.6f}")
-            writer(f"t統計量: {results_1.tstats['rd_intensity_lag1']:.6f}")
-            writer(f"p値: {results_1.pvalues['rd_intensity_lag1']:.6f}")
-            writer(f"Overall R²: {results_1.rsquared:.4f}")
-            writer(f"Within R²: {results_1.rsquared_within:.4f}")
-            writer(f"Between R²: {results_1.rsquared_between:.4f}")
-            
-            # 統計的有意性の判定
-            significance_1 = ""
-            if results_1.pvalues['rd_intensity_lag1'] < 0.01:
-                significance_1 = "***"
-            elif results_1.pvalues['rd_intensity_lag1'] < 0.05:
-                significance_1 = "**"
-            elif results_1.pvalues['rd_intensity_lag1'] < 0.1:
-                significance_1 = "*"
-            
-            writer(f"統計的有意性: {significance_1}")
-            
-        except Exception as e:
-            writer(f"モデル①でエラーが発生しました: {e}")
-            results_1 = None
+        for line in model['formula']:
+            writer(line)
+        if 'error' in model:
+            writer(f"{model['title'].split(' ')[0]}でエラーが発生しました: {model['error']}")
+            continue
+
+        writer(f"\n【データ情報】")
+        writer(f"使用データ数: {model['nobs']}")
+        writer(f"産業数: {model['n_entities']}")
+        writer(f"年数: {model['n_periods']}")
+
+        writer(f"\n【回帰結果】")
+        writer("\n".join(render_summary(model)))
+
+        writer(f"\n【主要結果】")
+        for term, v in model['params'].items():
+            label = TERM_LABELS.get(term, term)
+            writer(f"{label}の係数: {v['coef']:.6f}")
+            writer(f"  標準誤差: {v['std_err']:.6f}")
+            writer(f"  t統計量: {v['t_stat']:.6f}")
+            writer(f"  p値: {v['p_value']:.6f}")
+            writer(f"  統計的有意性: {significance(v['p_value'])}")
+            resampling = model.get('resampling', {}).get(term, {})
+            if 'wild_cluster_bootstrap' in resampling:
+                r = resampling['wild_cluster_bootstrap']
+                writer(f"  ワイルド・クラスタ・ブートストラップ p値: {r['pvalue']:.6f}（{r['weights']}, {r['reps']}回）")
+            if 'permutation' in resampling:
+                r = resampling['permutation']
+                writer(f"  クラスタ内並べ替え検定 p値: {r['pvalue']:.6f}（{r['reps']}回）")
+        writer(f"Overall R²: {model['rsquared']:.4f}")
+        writer(f"Within R²: {model['rsquared_within']:.4f}")
+        writer(f"Between R²: {model['rsquared_between']:.4f}")
+
+    writer("\n" + "=" * 80)
+    writer("総合的な結果比較・経済解釈")
+    writer("=" * 80)
+
+    models = {model['key']: model for model in results['models'] if 'error' not in model}
+    if 'model_1' in models and 'model_2' in models:
+        model_1, model_2 = models['model_1'], models['model_2']
+        writer(f"\n【研究開発費効果の比較】")
+        writer(f"{'モデル':<15} {'1期ラグ係数':<15} {'2期ラグ係数':<15} {'Within R²':<10}")
+        writer("-" * 60)
+        writer(f"{'①基本モデル':<15} {model_1['params']['rd_intensity_lag1']['coef']:<15.6f} {'---':<15} {model_1['rsquared_within']:<10.4f}")
+        writer(f"{'②2期ラグ':<15} {model_2['params']['rd_intensity_lag1']['coef']:<15.6f} {model_2['params']['rd_intensity_lag2']['coef']:<15.6f} {model_2['rsquared_within']:<10.4f}")
+
+        # 累積効果の計算
+        cumulative_effect_2 = sum(model_2['params'][term]['coef'] for term in ['rd_intensity_lag1', 'rd_intensity_lag2'])
+        writer(f"\n【累積効果（2年間）】")
+        writer(f"モデル②: {cumulative_effect_2:.6f}")
+
+        writer(f"\n【統計的有意性テスト】")
+        writer(f"モデル① F-test for Poolability p値: {fmt(model_1['f_pooled']['pvalue'], '.6f')}")
+        writer(f"モデル② F-test for Poolability p値: {fmt(model_2['f_pooled']['pvalue'], '.6f')}")
+        writer("→ 固定効果の統計的必要性を確認")
+
+        writer(f"\n【固定効果モデルの妥当性】")
+        writer("✓ Entity effects = True で産業固定効果を推定")
+        writer("✓ Clustered standard errors で産業内相関を調整")
+        writer("✓ Within変動による識別で因果推論を強化")
+        writer("✓ F-test for Poolabilityで固定効果の必要性を確認")
+
+    writer("\n" + "=" * 80)
+    writer("データ概要統計・診断")
+    writer("=" * 80)
+
+    writer("\n【主要変数の記述統計】")
+    writer(str(pd.DataFrame(results['descriptive'])))
+
+    writer(f"\n【産業大分類別データ分布】")
+    writer("産業ID : データ数")
+    for idx, count in sorted(results['industry_counts'].items(), key=lambda item: int(item[0])):
+        writer(f"   {idx}   :   {count}")
+
+    writer(f"\n【分析完了】")
+    writer("=" * 80)
+    return lines
 
-        writer("\n" + "=" * 80)
-        writer("モデル② : 2期ラグ固定効果パネルモデル")
-        writer("=" * 80)
-
-        writer("\n【数式】")
-        writer("Δ特許件数/売上高_it = α_i + β₁(研究開発費/売上高)_{i,t-1} + β₂(研究開発費/売上高)_{i,t-2} + ε_{it}")
-
-        # モデル②：2期ラグ + 固定効果
-        try:
-            # データ準備
-            model_2_data = panel_df.dropna(subset=['patent_intensity', 'rd_intensity_lag1', 'rd_intensity_lag2'])
-            
-            dependent_2 = model_2_data['patent_intensity']
-            exog_2 = model_2_data[['rd_intensity_lag1', 'rd_intensity_lag2']]
-            
-            writer(f"\n【データ情報】")
-            writer(f"使用データ数: {len(dependent_2)}")
-            writer(f"産業数: {len(dependent_2.index.get_level_values(0).unique())}")
-            writer(f"年数: {len(dependent_2.index.get_level_values(1).unique())}")
-            
-            # 固定効果パネルモデル
-            model_2 = PanelOLS(dependent_2, exog_2, entity_effects=True)
-            results_2 = model_2.fit(cov_type='clustered', cluster_entity=True)
-            
-            writer(f"\n【回帰結果】")
-            writer(str(results_2.summary)) # summaryを文字列に変換
-            
-            writer(f"\n【主要結果】")
-            writer(f"研究開発費集約度(t-1)の係数: {results_2.params['rd_intensity_lag1']:.6f}")
-            writer(f"研究開発費集約度(t-2)の係数: {results_2.params['rd_intensity_lag2']:.6f}")
-            writer(f"(t-1) p値: {results_2.pvalues['rd_intensity_lag1']:.6f}")
-            writer(f"(t-2) p値: {results_2.pvalues['rd_intensity_lag2']:.6f}")
-            writer(f"Overall R²: {results_2.rsquared:.4f}")
-            writer(f"Within R²: {results_2.rsquared_within:.4f}")
-            
-            # 統計的有意性の判定
-            significance_2_lag1 = ""
-            significance_2_lag2 = ""
-            if results_2.pvalues['rd_intensity_lag1'] < 0.01:
-                significance_2_lag1 = "***"
-            elif results_2.pvalues['rd_intensity_lag1'] < 0.05:
-                significance_2_lag1 = "**"
-            elif results_2.pvalues['rd_intensity_lag1'] < 0.1:
-                significance_2_lag1 = "*"
-                
-            if results_2.pvalues['rd_intensity_lag2'] < 0.01:
-                significance_2_lag2 = "***"
-            elif results_2.pvalues['rd_intensity_lag2'] < 0.05:
-                significance_2_lag2 = "**"
-            elif results_2.pvalues['rd_intensity_lag2'] < 0.1:
-                significance_2_lag2 = "*"
-            
-            writer(f"(t-1) 統計的有意性: {significance_2_lag1}")
-            writer(f"(t-2) 統計的有意性: {significance_2_lag2}")
-            
-        except Exception as e:
-            writer(f"モデル②でエラーが発生しました: {e}")
-            results_2 = None
 
-        writer("\n" + "=" * 80)
-        writer("総合的な結果比較・経済解釈")
-        writer("=" * 80)
-
-        if results_1 is not None and results_2 is not None:
-            try:
-                writer(f"\n【研究開発費効果の比較】")
-                writer(f"{'モデル':<15} {'1期ラグ係数':<15} {'2期ラグ係数':<15} {'Within R²':<10}")
-                writer("-" * 60)
-                writer(f"{'①基本モデル':<15} {results_1.params['rd_intensity_lag1']:<15.6f} {'---':<15} {results_1.rsquared_within:<10.4f}")
-                writer(f"{'②2期ラグ':<15} {results_2.params['rd_intensity_lag1']:<15.6f} {results_2.params['rd_intensity_lag2']:<15.6f} {results_2.rsquared_within:<10.4f}")
-                
-                # 累積効果の計算
-                cumulative_effect_2 = results_2.params['rd_intensity_lag1'] + results_2.params['rd_intensity_lag2']
-                
-                writer(f"\n【累積効果（2年間）】")
-                writer(f"モデル②: {cumulative_effect_2:.6f}")
-                
-                writer(f"\n【統計的有意性テスト】")
-                writer(f"モデル① F-test for Poolability p値: {results_1.f_pooled.pvalue:.6f}")
-                writer(f"モデル② F-test for Poolability p値: {results_2.f_pooled.pvalue:.6f}")
-                writer("→ 固定効果の統計的必要性を確認")
-                
-                writer(f"\n【固定効果モデルの妥当性】")
-                writer("✓ Entity effects = True で産業固定効果を推定")
-                writer("✓ Clustered standard errors で産業内相関を調整")
-                writer("✓ Within変動による識別で因果推論を強化")
-                writer("✓ F-test for Poolabilityで固定効果の必要性を確認")
-                
-            except Exception as e:
-                writer(f"結果比較でエラーが発生しました: {e}")
-
-        writer("\n" + "=" * 80)
-        writer("データ概要統計・診断")
-        writer("=" * 80)
-
-        writer("\n【主要変数の記述統計】")
-        summary_vars = ['patent_intensity', 'rd_intensity_lag1', 'rd_intensity_lag2']
-        # describe() の出力も文字列に変換
-        writer(str(panel_df[summary_vars].describe()))
+def run_regressions(panel_df = None):
+    # Data loading
+    if panel_df is None:
+        df = storage.load_panel_data()
+    else:
+        df = panel_df
 
-        writer(f"\n【産業大分類別データ分布】")
-        industry_counts = analysis_df.groupby('industry_major')['year'].count().sort_index()
-        writer("産業ID : データ数")
-        for idx, count in industry_counts.items():
-            writer(f"   {idx}   :   {count}")
+    results = build_regression_results(df)
+    json_path = save_regression_results(results)
 
-        writer(f"\n【分析完了】")
-        writer("=" * 80)
+    # レポートは保存した結果から作る
+    with open(output_text_path, 'w', encoding='utf-8') as f:
+        for line in render_report(results):
+            write_to_file(f, line)
 
-    print(f"\nコンソール出力は '{output_text_path}' に保存されました。")
\ No newline at end of file
+    print(f"\nコンソール出力は '{output_text_path}' に保存されました。")
+    print(f"推定結果は '{json_path}' に保存されました。")
+    return results
@@ -0,0 +1,77 @@
+# schema.py
+# クリーニング済みテーブルとパネルデータの列の型。
+# e-Stat の表では秘匿・該当なしのセルが "X" や "***" などの記号で書かれているので、クリーニングの時点で
+# 一度だけこれらを欠損にし、数値の列を nullable な整数型（Int64）か小数型（Float64）にそろえる。
+# パネルデータの作成・可視化・回帰は型の付いた列を受け取り、数値への変換をやり直さない。
+from collections import Counter
+
+import pandas as pd
+
+# 欠損を表す記号（秘匿の "X"、該当なしの "-"、2020年以降の "***" など。全角も含む）
+MISSING_MARKERS = ("X", "x", "Ｘ", "ｘ", "***", "-", "")
+
+# クリーニング済みテーブルの文字列の列（それ以外はすべて数値の列）
+TEXT_COLUMNS = ("産業", "年度")
+
+# パネルデータの列 → 型
+PANEL_SCHEMA = {
+    "year": "int64",
+    "industry_name": object,
+    "industry_id": object,
+    "company_count": "Int64",
+    "r_and_d_sales": "Int64",
+    "r_and_d_total": "Int64",
+    "patent_company_count": "Int64",
+    "patent_count": "Int64",
+    "utility_company_count": "Int64",
+    "utility_count": "Int64",
+    "design_company_count": "Int64",
+    "design_count": "Int64",
+}
+
+
+def numeric_dtype(values: pd.Series) -> str:
+    """欠損以外がすべて整数値なら Int64、そうでなければ Float64。"""
+    present = values.dropna()
+    return "Int64" if (present % 1 == 0).all() else "Float64"
+
+
+def coerce_numeric(values: pd.Series) -> tuple:
+    """
+    1列を nullable な数値型にして (列, 数値でも欠損の記号でもなかった値の Counter) を返す。
+    欠損の記号は前後の空白を除いて判定する。想定外の値も欠損にする。
+    """
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        numbers = values
+        unexpected = Counter()
+    else:
+        cells = values.map(lambda v: v.strip() if isinstance(v, str) else v)
+        cells = cells.mask(cells.isin(MISSING_MARKERS))
+        numbers = pd.to_numeric(cells, errors="coerce")
+        unexpected = Counter(cells[numbers.isna() & cells.notna()].astype(str))
+    return numbers.astype(numeric_dtype(numbers)), unexpected
+
+
+def coerce_table(df: pd.DataFrame, text_columns=TEXT_COLUMNS, label: str = "") -> pd.DataFrame:
+    """
+    クリーニング済みの表の text_columns 以外の列を数値型にする。
+    欠損の記号以外の数値にならない値があれば、欠損にしたうえで警告を出す。
+    """
+    df = df.copy()
+    unexpected = Counter()
+    # 年によっては列名が重複するので位置で置き換える
+    for i, col in enumerate(df.columns):
+        if col in text_columns:
+            continue
+        values, found = coerce_numeric(df.iloc[:, i])
+        df.isetitem(i, values)
+        unexpected += found
+    if unexpected:
+        examples = ", ".join(f"{value!r}×{count}" for value, count in unexpected.most_common(5))
+        print(f"⚠ {label}: {sum(unexpected.values())} non-numeric cell(s) treated as missing ({examples})")
+    return df
+
+
+def apply_panel_schema(panel_data: pd.DataFrame) -> pd.DataFrame:
+    """パネルデータの列を PANEL_SCHEMA の型にする（保存形式によらず同じ型で読めるように）。"""
+    return panel_data.astype({col: dtype for col, dtype in PANEL_SCHEMA.items() if col in panel_data.columns})
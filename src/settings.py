@@ -20,6 +20,9 @@ DATA_DIR = "data"
 PLOTS_DIR = "image/plots"
 TIMESERIES_DIR = "image/timeseries"
 BAR_CHARTS_DIR = "image/barcharts"
+RENDER_MANIFEST = "image/render_manifest.json"  # 図ごとの入力データのハッシュ
+PLOT_JOBS = 4  # 図を並行に描くプロセス数（1 で逐次）
+PLOT_INCREMENTAL = True  # 入力データが変わっていない図は描き直さない
 
 
 emp_data_path = "data/cleand/3 産業別、売上高経常利益率別常時従業者数"
@@ -30,9 +33,64 @@ LABOR_NUMBER_FILE_KEY = "3 産業別、売上高経常利益率別常時従業
 RESEARCH_EXPENSE_FILE_KEY = "第10表 産業別、企業数、売上高、研究開発費及び売上高比率、受託研究費、研究開発投資、能力開発費"
 PATENT_COUNT_FILE_KEY = "第11表 産業別、企業数、特許権、実用新案権、意匠権別の所有件数及び使用件数"
 
+# cleaning
+CLEAN_INCREMENTAL = True  # 入力が変わった年だけを再クリーニングする
+CLEAN_MANIFEST = "clean_manifest.json"  # CLEAND_DIR 内のクリーニング記録
+CLEAN_JOBS = 1  # 並列プロセス数（main.py の --jobs で上書き）
+CLEAN_READER = "cells"  # 第10表・第11表の読み方: "cells"（必要なセルだけを直接読む）または "pandas"（read_excel）
+
+# storage
+STORAGE_FORMAT = "parquet"  # パネルデータと係数表の保存形式: "parquet" または "csv"
+CLEANED_STORAGE_FORMAT = "csv"  # 年ごとのクリーニング済みテーブルの保存形式（小さな表では Parquet のほうが大きく遅い）
+PARQUET_COMPRESSION = "zstd"
+PANEL_DATA_NAME = "panel_data"  # PANELDATA_DIR 内のパネルデータのファイル名（拡張子なし）
+EXPORT_PANEL_CSV = True  # パネルデータをCSVでもエクスポートする
+PANEL_DUPLICATE_POLICY = "first"  # 産業名がIDの名前と一致する行を優先しても同じ (industry_id, year) の行が残る場合: "first" / "last"（その行を残す）、"error"（中断する）
+
 #outputs files
 OUTPUT_PATH = "reports"
 
+# regression
+REGRESSION_RESULTS_FILE = "regression_results.json"  # OUTPUT_PATH 内の推定結果（テキストのレポートの元）
+REGRESSION_COEFFICIENTS_NAME = "regression_coefficients"  # OUTPUT_PATH 内の係数表（拡張子は STORAGE_FORMAT に従う）
+SPEC_GRID_FILE = "specification_grid.csv"  # OUTPUT_PATH 内の定式化グリッドの係数表
+REGRESSION_GRID_JOBS = 4  # 定式化を並行に推定するスレッド数
+REGRESSION_GRID_MAX_LAG = 3  # グリッドで試す研究開発費集約度の最大ラグ
+REGRESSION_GRID_EFFECTS = ["entity", "twoway"]  # "none" / "entity" / "time" / "twoway"
+REGRESSION_GRID_COV_TYPES = ["clustered", "robust"]  # "unadjusted" / "robust" / "clustered"
+BOOTSTRAP_REPS = 9999  # ワイルド・クラスタ・ブートストラップの複製数（0 で行わない）
+BOOTSTRAP_WEIGHTS = "webb"  # "rademacher" または "webb"（クラスタが少ないとき向け）
+PERMUTATION_REPS = 9999  # クラスタ内並べ替え検定の複製数（0 で行わない）
+RESAMPLING_SEED = 0
+RESAMPLING_JOBS = 1  # 複製のチャンクを並行に計算するプロセス数
+RESAMPLING_CHUNK_SIZE = 2000  # 1チャンクの複製数（乱数はチャンクごとに作るので結果はこの値に依存する）
+
+# pipeline
+PIPELINE_STATE = "pipeline_state.json"  # DATA_DIR 内の各ステージの入力ハッシュと出力の記録
+
+# scraper
+SCRAPER_CONCURRENT = True   # False で従来の逐次ダウンロード
+SCRAPER_MAX_WORKERS = 8     # スレッド数
+SCRAPER_MAX_PER_HOST = 4    # ホストごとの同時接続数
+SCRAPER_TIMEOUT = 30        # 秒
+SCRAPER_HTTP_RETRIES = 3    # セッション側の再試行回数（acquisition.py ではランナーが再試行するので0）
+DOWNLOAD_MANIFEST = "manifest.json"  # DOWNLOAD_DIR 内のダウンロード記録
+
+# 非同期の取得ランナー（acquisition.py）
+ACQ_MAX_CONCURRENCY = 12      # 全ソース合計の同時リクエスト数
+ACQ_HOST_MIN_INTERVAL = 0.25  # 同じホストへのリクエスト開始間隔（秒）
+ACQ_RETRIES = 3               # 失敗時の再試行回数
+ACQ_BACKOFF_BASE = 1.0        # 再試行の待ち時間の基準（秒、試行ごとに2倍＋ジッター）
+ACQ_BACKOFF_MAX = 30          # 再試行の待ち時間の上限（秒）
+
+# 議事録スクレイピング（main_scrapeminutes.py）
+BROWSER_POOL_SIZE = 4       # 同時に使うヘッドレスChromeの数
+BROWSER_WAIT_TIMEOUT = 30   # グラフ描画を待つ最大秒数
+MENTION_CHECKPOINT_DIR = "data/checkpoints/mentions"  # ソースごとの取得済み件数（{source}.jsonl）
+MENTION_CACHE_PATH = "data/cache/mention_queries.sqlite"  # クエリ単位の結果キャッシュ
+MENTION_CACHE_TTL_DAYS = 30
+MENTION_CACHE_MAX_ENTRIES = 10000
+
 # YEARS　TO　SCRAPE
 YEARS_TO_SCRAPE = list(range(2023, 2009, -1))
 
@@ -0,0 +1,214 @@
+# storage.py
+# 中間データ（クリーニング済みテーブル・パネルデータ）の保存形式を切り替えるモジュール。
+# パネルデータは型付き・圧縮の列指向形式（Parquet）、年ごとの小さなクリーニング済みテーブルは CSV が既定。
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+import schema
+import settings
+from industries import UNKNOWN_INDUSTRY_ID
+
+
+def to_typed_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    object 型の列を、すべて数値に変換できれば数値型に、そうでなければ文字列（欠損は NA のまま）にそろえる。
+    read_csv が行う型推定と同じ結果になるので、CSV と列指向形式のどちらから読んでも同じ値になる。
+    """
+    df = df.copy()
+    for col in df.columns[df.dtypes == object]:
+        try:
+            df[col] = pd.to_numeric(df[col])
+        except (ValueError, TypeError):
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+
+class CsvStorage:
+    name = "csv"
+    extension = ".csv"
+
+    def path(self, directory: str, stem) -> str:
+        return os.path.join(directory, f"{stem}{self.extension}")
+
+    def save(self, df: pd.DataFrame, directory: str, stem, index: bool = True) -> str:
+        os.makedirs(directory, exist_ok=True)
+        path = self.path(directory, stem)
+        df.to_csv(path, index=index)
+        return path
+
+    def load(self, path: str, index: bool = True) -> pd.DataFrame:
+        return pd.read_csv(path, index_col=0 if index else None)
+
+    def list(self, directory: str) -> dict:
+        """
+        ディレクトリ内のファイルを {ファイル名（拡張子なし）: パス} で返す。
+        """
+        files = glob.glob(os.path.join(directory, f"*{self.extension}"))
+        return {os.path.splitext(os.path.basename(f))[0]: f for f in sorted(files)}
+
+
+class ParquetStorage(CsvStorage):
+    name = "parquet"
+    extension = ".parquet"
+
+    def save(self, df: pd.DataFrame, directory: str, stem, index: bool = True) -> str:
+        os.makedirs(directory, exist_ok=True)
+        path = self.path(directory, stem)
+        to_typed_frame(df).to_parquet(path, index=index, compression=settings.PARQUET_COMPRESSION)
+        return path
+
+    def load(self, path: str, index: bool = True) -> pd.DataFrame:
+        return pd.read_parquet(path)
+
+
+STORAGES = {
+    "csv": CsvStorage,
+    "parquet": ParquetStorage,
+}
+
+
+def get_storage(name: str = None):
+    """
+    保存形式名からストレージを返す。Parquet に必要な pyarrow がない場合は CSV にフォールバックする。
+    """
+    name = name or settings.STORAGE_FORMAT
+    if name not in STORAGES:
+        raise ValueError(f"Unknown storage format '{name}'. Choose from {sorted(STORAGES)}.")
+    if name == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            print("警告: pyarrow がインストールされていないため、CSV で保存します。")
+            return CsvStorage()
+    return STORAGES[name]()
+
+
+def get_cleaned_storage():
+    """クリーニング済みテーブルのストレージ（settings.CLEANED_STORAGE_FORMAT）。"""
+    return get_storage(settings.CLEANED_STORAGE_FORMAT)
+
+
+def load_panel_data(storage=None) -> pd.DataFrame:
+    """
+    保存済みのパネルデータを読み込む。
+    """
+    storage = storage or get_storage()
+    panel_data = storage.load(storage.path(settings.PANELDATA_DIR, settings.PANEL_DATA_NAME), index=False)
+    # CSV から読んだ場合も、保存時と同じ型（数値の列は nullable な整数型）にそろえる
+    return schema.apply_panel_schema(panel_data)
+
+
+# 同じ (industry_id, year) の行が複数ある場合の扱い
+DUPLICATE_POLICIES = ("first", "last", "error")
+
+
+class PanelStore:
+    """
+    (industry_id, year) を主キーとするパネルデータ。
+
+    構築時に産業IDを解決できなかった行を落とし、主キーの重複を解消する。重複するキーに preferred が真の行
+    （例: 元の産業名がIDの名前と一致した行）があれば、まずそれ以外の行を落とす。それでも残る重複は
+    on_conflict に従う（"first" / "last" は最初 / 最後の行を残し、"error" は ValueError を送出する）。
+    落とした行は unresolved / duplicates に残る。行はパネルデータの順のまま data に持ち、
+    キー → 行位置の辞書で get / row を定数時間で引く。
+    """
+    KEY = ["industry_id", "year"]
+
+    def __init__(self, panel_data: pd.DataFrame, on_conflict: str = None, preferred: pd.Series = None,
+                 verbose: bool = True):
+        self.on_conflict = on_conflict or settings.PANEL_DUPLICATE_POLICY
+        if self.on_conflict not in DUPLICATE_POLICIES:
+            raise ValueError(f"Unknown conflict policy '{self.on_conflict}'. Choose from {list(DUPLICATE_POLICIES)}.")
+
+        unresolved = panel_data["industry_id"].isna() | (panel_data["industry_id"] == UNKNOWN_INDUSTRY_ID)
+        self.unresolved = panel_data[unresolved]
+        panel_data = panel_data[~unresolved]
+
+        # 行の順ではなく意味で決まる重複: 同じキーに preferred の行があれば、それ以外の行を落とす
+        outranked = pd.Series(False, index=panel_data.index)
+        if preferred is not None:
+            preferred = preferred.reindex(panel_data.index, fill_value=False).astype(bool)
+            has_preferred = preferred.groupby([panel_data[col] for col in self.KEY]).transform("any")
+            outranked = has_preferred & ~preferred
+        remaining = panel_data[~outranked]
+
+        keep = "last" if self.on_conflict == "last" else "first"
+        duplicated = remaining.duplicated(self.KEY, keep=keep)
+        if self.on_conflict == "error" and duplicated.any():
+            keys = list(remaining.loc[duplicated, self.KEY].itertuples(index=False, name=None))
+            raise ValueError(f"{len(keys)} duplicate (industry_id, year) key(s) in panel data: {keys[:5]}")
+        self.outranked = panel_data[outranked]
+        self.duplicates = pd.concat([self.outranked, remaining[duplicated]]).sort_index()
+        self.data = remaining[~duplicated].reset_index(drop=True)
+
+        ids = self.data["industry_id"].to_numpy()
+        years = self.data["year"].to_numpy()
+        self.positions = dict(zip(zip(ids, years.tolist()), range(len(self.data))))
+        self.positions_by_id = self.data.groupby("industry_id", sort=False).indices
+        if verbose:
+            self.report()
+
+    def report(self):
+        if len(self.unresolved):
+            print(f"⚠ 産業IDを解決できなかった {len(self.unresolved)} 行をパネルデータから除外しました")
+        if len(self.duplicates):
+            counts = self.duplicates["industry_id"].value_counts()
+            examples = ", ".join(f"{industry_id}×{count}" for industry_id, count in counts.head(5).items())
+            conflicting = len(self.conflicting_duplicates())
+            print(f"⚠ (industry_id, year) が重複する {len(self.duplicates)} 行を除外しました"
+                  f"（名前が一致する行を優先 {len(self.outranked)}、方針: {self.on_conflict}、"
+                  f"うち値の異なる行 {conflicting}）: {examples}")
+
+    def conflicting_duplicates(self) -> pd.DataFrame:
+        """
+        除外した重複行のうち、同じキーで残した行と値（キー以外の列）が異なる行。欠損同士は等しいとみなす。
+        """
+        columns = [col for col in self.duplicates.columns if col not in self.KEY]
+        kept = self.data[self.KEY + columns]
+        # 残した行のキーは一意なので、merged は duplicates と同じ順・同じ行数になる
+        merged = self.duplicates.merge(kept, on=self.KEY, how="left", suffixes=("", "_kept"))
+        differs = np.zeros(len(merged), dtype=bool)
+        for col in columns:
+            dropped, kept_values = merged[col], merged[f"{col}_kept"]
+            same = (dropped == kept_values).fillna(False) | (dropped.isna() & kept_values.isna())
+            differs |= ~same.to_numpy(dtype=bool)
+        return self.duplicates[differs]
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __contains__(self, key) -> bool:
+        return tuple(key) in self.positions
+
+    @property
+    def industry_ids(self) -> list:
+        return list(self.positions_by_id)
+
+    def row(self, industry_id: str, year: int) -> pd.Series:
+        """1つのキーの行。ない場合は KeyError。"""
+        return self.data.iloc[self.positions[(industry_id, year)]]
+
+    def get(self, industry_ids, years=None) -> pd.DataFrame:
+        """
+        industry_ids（1つまたはリスト）の行を、years を指定した場合はその年だけ、パネルデータの順で返す。
+        存在しないキーは無視する。
+        """
+        if isinstance(industry_ids, str):
+            industry_ids = [industry_ids]
+        if years is None:
+            parts = [self.positions_by_id[i] for i in industry_ids if i in self.positions_by_id]
+            positions = np.concatenate(parts) if parts else np.empty(0, dtype=np.intp)
+        else:
+            positions = np.fromiter((self.positions[(i, y)] for i in industry_ids for y in years
+                                     if (i, y) in self.positions), dtype=np.intp)
+        return self.data.take(np.unique(positions))
+
+
+def load_panel_store(storage=None) -> PanelStore:
+    """
+    保存済みのパネルデータを PanelStore として読み込む（保存時に主キーは一意になっている）。
+    """
+    return PanelStore(load_panel_data(storage))
@@ -1,14 +1,17 @@
 # produce plots
+import hashlib
 import os
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
 import seaborn as sns
-import matplotlib.pyplot as plt
 
-from matplotlib.font_manager import FontProperties
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from matplotlib.ticker import ScalarFormatter, PercentFormatter
-from industries import get_industries_id, get_industries_name, industryjptoen_dict
+from industries import industry_hierarchy, industryjptoen_dict
 import settings
+import storage
 import data_processor
 import japanize_matplotlib
 
@@ -26,20 +29,13 @@ class Plotsproducer:
             df['industry_name'] = df['industry_name'].apply(Plotsproducer.translate_industry_name_to_english)
         return df
 
-    def make_each_bar_chart(panel_data:pd.DataFrame, target_column:str, years:list, industry_id_list:list, save_dir: str, ax,
+    def make_each_bar_chart(panel: storage.PanelStore, target_column:str, years:list, industry_id_list:list, save_dir: str, ax,
                             ylabel:str, file_name: str, title_name: str):
         print(f"✓ {file_name}を作成します")
 
-        bar_chart_data = panel_data.copy()
-
-        bar_chart_data = bar_chart_data[bar_chart_data["year"].isin(years) & bar_chart_data['industry_id'].isin(industry_id_list)]
+        bar_chart_data = panel.get(industry_id_list, years)
         
-        # r_and_d_total と r_and_d_sales カラムを数値型に変換
-        # errors='coerce' を指定することで、変換できない値は NaN になる
-        bar_chart_data["r_and_d_total"] = pd.to_numeric(bar_chart_data["r_and_d_total"], errors='coerce')
-        bar_chart_data["r_and_d_sales"] = pd.to_numeric(bar_chart_data["r_and_d_sales"], errors='coerce')
-
-        # NaN 値（数値変換できなかったものや元々欠損だったもの）を含む行を除外
+        # 欠損値を含む行を除外（数値の列はクリーニング時に型が付いている）
         bar_chart_data = bar_chart_data.dropna(subset=["r_and_d_total", "r_and_d_sales"])
 
         # ゼロ除算を避けるために r_and_d_sales が 0 ではない行のみを保持
@@ -149,77 +145,81 @@ class Plotsproducer:
         ]
 
 
-        industry_id_series = panel_data["industry_id"].unique()
-
-        industry_id_list = list(industry_id_series)
+        panel = storage.PanelStore(panel_data, verbose=False)
+        industry_id_list = panel.industry_ids
 
-        large_industry_id_list = [i for i in industry_id_list if len(i) in [1, 2] and i in target_large_industries_list]
-        large_industry_id_exclude_manufacturing_list = [i for i in large_industry_id_list if i != "E"]
+        large_industry_id_list = [i for i in industry_id_list
+                                  if industry_hierarchy.level_of(i) == "major" and i in target_large_industries_list]
 
-
-        medium_industry_id_list = [i for i in industry_id_list if 
-                                    len(i) == 3
-                                    and ((int(i) <= 330 and int(i) % 10 == 0) or int(i) > 330)
-                                    and i in target_medium_industries_list
-                                ]
-        medium_industry_id_exclude_manufacturing_list = [i for i in medium_industry_id_list if int(i) >= 330]
+        medium_industry_id_list = [i for i in industry_id_list
+                                   if industry_hierarchy.level_of(i) == "medium" and i in target_medium_industries_list]
 
         years = [2010,2015,2020]
 
-        fig, axes = plt.subplots(nrows=1, ncols=3, figsize=(18, 6))
+        fig = Figure(figsize=(18, 6))
+        FigureCanvasAgg(fig)
+        axes = fig.subplots(nrows=1, ncols=3)
 
-        Plotsproducer.make_each_bar_chart(panel_data, target_column="r_and_d_total", years=years,
+        Plotsproducer.make_each_bar_chart(panel, target_column="r_and_d_total", years=years,
                                           industry_id_list=large_industry_id_list, save_dir=save_dir, ax=axes[0], ylabel = "R&D expenditure",
                                           file_name="1_R&D",  title_name="Three years' worth of R&D expenditure")
 
-        Plotsproducer.make_each_bar_chart(panel_data, target_column="patent_count", years=years,
+        Plotsproducer.make_each_bar_chart(panel, target_column="patent_count", years=years,
                                           industry_id_list=large_industry_id_list, save_dir=save_dir, ax=axes[1], ylabel = "The Number of Patents",
                                           file_name="2_Patent_Count", title_name="Three years' worth of The Number of Patents")
 
-        Plotsproducer.make_each_bar_chart(panel_data, target_column="r_and_d_total/r_and_d_sales", years=years,
+        Plotsproducer.make_each_bar_chart(panel, target_column="r_and_d_total/r_and_d_sales", years=years,
                                           industry_id_list=large_industry_id_list, save_dir=save_dir, ax=axes[2], ylabel = "R&D Expenditure / Sales",
                                           file_name="3_R&D_per_Sales", title_name = "Three years' worth of R&D Expenditure / Sales")
 
-        plt.tight_layout()
+        fig.tight_layout()
 
         save_path = os.path.join(save_dir, 'combined_bar_chart.png')
-        plt.savefig(save_path)
-        plt.close()
+        fig.savefig(save_path)
         print(f"✓ combined_figureを保存しました: {save_path}")
+        return save_path
 
-    def make_time_series(panel_data: pd.DataFrame, save_dir: str):
-        """Time Series: 特許権所有件数の推移（産業別）をプロットする"""
+    def make_patent_trend(panel_data: pd.DataFrame, save_dir: str):
+        """Time Series: 特許権所有件数の合計の推移をプロットする"""
         print("Produce Time Series")
-        plt.figure(figsize=(8, 5))
+        fig = Figure(figsize=(8, 5))
+        FigureCanvasAgg(fig)
+        ax = fig.subplots()
         yearly_patent = panel_data.groupby("year")["patent_count"].sum()
-        yearly_patent.plot(marker='o')
-        plt.xlabel("Year")
-        plt.ylabel("Patent count total")
-        plt.yscale('log')
-        plt.title("Annual trend of total patent count")
-        plt.grid(True)
+        yearly_patent.plot(marker='o', ax=ax)
+        ax.set_xlabel("Year")
+        ax.set_ylabel("Patent count total")
+        ax.set_yscale('log')
+        ax.set_title("Annual trend of total patent count")
+        ax.grid(True)
         save_path = os.path.join(save_dir, 'Annual_trend_of_total_patent_count.png')
-        plt.savefig(save_path)
-        plt.close()
-        
-        plt.figure(figsize=(8, 5))
+        fig.savefig(save_path)
+        print(f"✓ Time Seriesを保存しました: {save_path}")
+        return save_path
+
+    def make_patent_change(panel_data: pd.DataFrame, save_dir: str):
+        """Time Series: 特許権所有件数の合計の前年比をプロットする"""
+        fig = Figure(figsize=(8, 5))
+        FigureCanvasAgg(fig)
+        ax = fig.subplots()
+        yearly_patent = panel_data.groupby("year")["patent_count"].sum()
         yearly_patent_change = yearly_patent.pct_change(1).multiply(100)
-        yearly_patent_change.plot(marker='o')
-        plt.xlabel("Year")
-        plt.ylabel("Patent count total pct change  (%)")
-        plt.title("Year-Over-Year percent change in total patent count")
-        plt.grid(True)
+        yearly_patent_change.plot(marker='o', ax=ax)
+        ax.set_xlabel("Year")
+        ax.set_ylabel("Patent count total pct change  (%)")
+        ax.set_title("Year-Over-Year percent change in total patent count")
+        ax.grid(True)
         save_path = os.path.join(save_dir, 'Year-over-year_percent_change_in_total_patent_count.png')
-        plt.savefig(save_path)
-        plt.close()
+        fig.savefig(save_path)
         print(f"✓ Time Seriesを保存しました: {save_path}")
+        return save_path
 
 
-    def make_each_scatter_plots(panel_data: pd.DataFrame, target_index: pd.Series, save_dir: str, file_name: str, title_name: str):
+    def make_each_scatter_plots(plot_data: pd.DataFrame, save_dir: str, file_name: str, title_name: str):
         print(f"✓ {file_name}を作成します")
         
         # Patch: Clean data before plotting
-        df = panel_data[target_index].copy()
+        df = plot_data.copy()
         df = df.dropna(subset=["industry_name", "r_and_d_total", "patent_count"])
         df["industry_name"] = df["industry_name"].astype(str)
         
@@ -234,75 +234,107 @@ class Plotsproducer:
         ]
         for col in int_columns:
             if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int)
+                df[col] = df[col].fillna(0).astype(int)
 
-        plt.figure(figsize=(10, 6))
-        
         plot_df = df[(df["r_and_d_total"] > 0) & (df["patent_count"] > 0)].copy()
         if plot_df.empty:
             print(f"警告: {file_name}にはプロット可能なデータがありません。スキップします。")
-            return
+            return None
 
         plot_df["log_r_and_d_total"] = np.log10(plot_df["r_and_d_total"])
         plot_df["log_patent_count"] = np.log10(plot_df["patent_count"])
 
-        plt.figure(figsize=(10, 6))
+        fig = Figure(figsize=(10, 6))
+        FigureCanvasAgg(fig)
+        ax = fig.subplots()
     
-        ax = sns.scatterplot(data=plot_df, x="log_r_and_d_total", y="log_patent_count", hue="industry_name", palette="bright", style="industry_name")
-        ax = sns.regplot(data=plot_df, x='log_r_and_d_total', y='log_patent_count', ax=ax, scatter=False, line_kws={'color': 'black', 'linewidth': 1})
+        ax = sns.scatterplot(data=plot_df, x="log_r_and_d_total", y="log_patent_count", hue="industry_name", palette="bright", style="industry_name", ax=ax)
+        ax = sns.regplot(data=plot_df, x='log_r_and_d_total', y='log_patent_count', ax=ax, scatter=False, seed=0, line_kws={'color': 'black', 'linewidth': 1})
 
-        plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
-        plt.xlabel("R&D Expenditure (log10 scale)")
-        plt.ylabel("Number of patents held by the firms (log10 scale)")
-        plt.title(f"{title_name}")
-        plt.tight_layout()
-        plt.grid(True)
+        ax.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
+        ax.set_xlabel("R&D Expenditure (log10 scale)")
+        ax.set_ylabel("Number of patents held by the firms (log10 scale)")
+        ax.set_title(f"{title_name}")
+        fig.tight_layout()
+        ax.grid(True)
 
         save_path = os.path.join(save_dir, f'{file_name}.png')
-        plt.savefig(save_path)
-        plt.close()
+        fig.savefig(save_path)
 
         print(f"✓ {file_name}を保存しました: {save_path}")
+        return save_path
 
-    def make_scatter_plots(panel_data: pd.DataFrame, save_dir: str):
-        """Scatter Plot: 研究開発費と特許所有数の関係性をプロットする"""
-        print("Produce Scatter Plots")
+    def scatter_plot_targets(panel: storage.PanelStore) -> list:
+        """Scatter Plot: 研究開発費と特許所有数の関係性をプロットする対象を (file_name, title_name, 対象の行) で返す"""
+        targets = []
+        major_industry_ids = industry_hierarchy.ids_at("major")
 
         file_name = "1_R&D_vs_Patents_Major_Industry"
         title_name = "R&D expense vs Patents in Major Industry"
-        target_index = panel_data["industry_id"].apply(len).isin([1,2])
-        Plotsproducer.make_each_scatter_plots(panel_data, target_index, save_dir, file_name, title_name)
+        targets.append((file_name, title_name, panel.get(major_industry_ids)))
 
         file_name = "2_R&D_vs_Patents_Major_Industry_Excl_Manufacturing"
         title_name = "R&D expense vs Patents in Major Industry Excl Manufacturing"
-        target_index = panel_data["industry_id"].apply(len).isin([1,2]) & ~panel_data["industry_id"].isin(["E"])
-        Plotsproducer.make_each_scatter_plots(panel_data, target_index, save_dir, file_name, title_name)
+        targets.append((file_name, title_name, panel.get([i for i in major_industry_ids if i != "E"])))
 
         file_name = "3_R&D_vs_Patents_Manufacturing_Detail"
         title_name = "R&D expense vs Patents in Manufacturing Detail"
-        manufacturing_industry_cd_list = ["090","091","092","093","099","100","101","102","110","111","112","113","114","115","119","120","121","129","130","140","141","142","150","160","161","162","163","164","169","170","171","179","180","190","191","199","200","210","211","212","219","220","221","222","230","231","232","240","241","249","250","251","252","253","259","260","261","262","270","271","273","274","275","276","280","290","291","292","293","299","300","301","302","310","311","319","320"]
-        #If the last digit of industry_id is 0, it represents a medium classification; otherwise, it represents a small classification.
-        medium_class_manufacturing_industry_cd_list = [i for i in manufacturing_industry_cd_list if int(i) % 10 == 0]
-        target_index = panel_data["industry_id"].isin(medium_class_manufacturing_industry_cd_list)
-        Plotsproducer.make_each_scatter_plots(panel_data, target_index, save_dir, file_name, title_name)
+        # 製造業（E）の中分類
+        targets.append((file_name, title_name, panel.get(industry_hierarchy.children_of("E"))))
 
         file_name = "4_R&D_vs_Patents_Wholesale_Detail"
         title_name = "R&D expense vs Patents in Wholesale Detail"
-        wholesale_industry_cd_list = ["511","512","521","522","531","532","533","534","535","536","541","542","543","549","551","552","553","559"]
-        target_index = panel_data["industry_id"].isin(wholesale_industry_cd_list)
-        Plotsproducer.make_each_scatter_plots(panel_data, target_index, save_dir, file_name, title_name)
+        # 卸売業（I1）の中分類
+        targets.append((file_name, title_name, panel.get(industry_hierarchy.children_of("I1"))))
 
         file_name = "5_R&D_vs_Patents_Research_Professional_Technical_Detail"
         title_name = "R&D expense vs Patents in Research Professional Technical Detail"
-        academic_related_industry_cd_list = ["710","726","728","730","743","744","745","746"]
-        target_index = panel_data["industry_id"].isin(academic_related_industry_cd_list)
-        Plotsproducer.make_each_scatter_plots(panel_data, target_index, save_dir, file_name, title_name)
-        print("End producing Scatter Plots")
+        # 学術研究、専門・技術サービス業（L）の中分類
+        targets.append((file_name, title_name, panel.get(industry_hierarchy.children_of("L"))))
+        return targets
 
 ### 実行関数 ###
 
-    def generate_all_visualizations(panel_data: pd.DataFrame, patent_dict: dict):
-        """すべてのグラフを生成するメイン関数"""
+    def bar_chart_data(panel: storage.PanelStore) -> pd.DataFrame:
+        """棒グラフに使う行（対象の大分類・3年分）だけを取り出す"""
+        return panel.get(industry_hierarchy.ids_at("major"), [2010, 2015, 2020])
+
+    def plan_figures(panel_data: pd.DataFrame) -> list:
+        """
+        独立に描画できる図を (描画関数名, 入力データ, 引数) のリストにする。
+        入力データは各図が実際に使う panel_data の部分だけにしておき、再描画の判定に使う。
+        行は (industry_id, year) の PanelStore から引くので、重複したキーは合計などに二重に入らない。
+        時系列の合計は大分類の特許件数を年ごとに合計したもの（合計・中分類・小分類の行を重ねて数えない）。
+        """
+        panel = storage.PanelStore(panel_data)
+        rollups = industry_hierarchy.rollups(panel.data, ["patent_count"])
+        time_series_data = rollups["total"].reset_index()[["year", "patent_count"]]
+        figures = [
+            ("make_bar_charts", Plotsproducer.bar_chart_data(panel), {"save_dir": settings.BAR_CHARTS_DIR}),
+            ("make_patent_trend", time_series_data, {"save_dir": settings.TIMESERIES_DIR}),
+            ("make_patent_change", time_series_data, {"save_dir": settings.TIMESERIES_DIR}),
+        ]
+        for file_name, title_name, target_data in Plotsproducer.scatter_plot_targets(panel):
+            figures.append(("make_each_scatter_plots", target_data,
+                            {"save_dir": settings.PLOTS_DIR, "file_name": file_name, "title_name": title_name}))
+        return figures
+
+    def figure_fingerprint(renderer: str, data: pd.DataFrame, kwargs: dict) -> str:
+        """描画関数・引数・入力データ・描画コードのハッシュ"""
+        digest = hashlib.sha256()
+        digest.update(repr((renderer, sorted(kwargs.items()), list(data.columns), list(data.dtypes.astype(str)))).encode("utf-8"))
+        digest.update(pd.util.hash_pandas_object(data, index=True).values.tobytes())
+        for module in ["visualization.py", "industries.py"]:
+            digest.update(data_processor.file_sha256(os.path.join(settings.BASE_DIR, module)).encode("ascii"))
+        return digest.hexdigest()
+
+    def generate_all_visualizations(panel_data: pd.DataFrame,
+                                    jobs: int = settings.PLOT_JOBS, incremental: bool = settings.PLOT_INCREMENTAL):
+        """
+        すべてのグラフを生成するメイン関数。
+        図ごとに独立した Figure で描画し、jobs > 1 ならプロセスプールで並行に描く。
+        incremental の場合、入力データのハッシュが前回と同じで画像が残っている図は描き直さない。
+        """
         print("\n--- 可視化を開始します ---")
         if panel_data.empty:
             print("警告: パネルデータが空です。一部の可視化をスキップします。")
@@ -312,21 +344,43 @@ class Plotsproducer:
         os.makedirs(settings.BAR_CHARTS_DIR, exist_ok=True)
         os.makedirs(settings.TIMESERIES_DIR, exist_ok=True)
         os.makedirs(settings.PLOTS_DIR, exist_ok=True)
-        
-        # Notebook内の全プロットを生成
-        Plotsproducer.make_bar_charts(panel_data, settings.BAR_CHARTS_DIR)
-        Plotsproducer.make_time_series(panel_data, settings.TIMESERIES_DIR)
-        Plotsproducer.make_scatter_plots(panel_data, settings.PLOTS_DIR)
-        
-        print(f"--- 可視化完了 ---")
+
+        manifest = data_processor.JsonManifest(settings.RENDER_MANIFEST)
+        tasks = []
+        for renderer, data, kwargs in Plotsproducer.plan_figures(panel_data):
+            key = f"{renderer}:{kwargs.get('file_name', kwargs['save_dir'])}"
+            fingerprint = Plotsproducer.figure_fingerprint(renderer, data, kwargs)
+            entry = manifest.get(key)
+            if incremental and entry and entry["fingerprint"] == fingerprint and (
+                    entry["output"] is None or os.path.exists(entry["output"])):
+                print(f"✓ {key} は変更がないためスキップします")
+                continue
+            tasks.append((key, fingerprint, renderer, data, kwargs))
+
+        jobs = min(jobs, len(tasks), os.cpu_count() or 1)
+        if jobs > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                futures = [executor.submit(render_figure_task, renderer, data, kwargs) for _, _, renderer, data, kwargs in tasks]
+                outputs = [future.result() for future in futures]
+        else:
+            outputs = [render_figure_task(renderer, data, kwargs) for _, _, renderer, data, kwargs in tasks]
+
+        for (key, fingerprint, _, _, _), output in zip(tasks, outputs):
+            manifest.set(key, {"fingerprint": fingerprint, "output": output})
+        manifest.save()
+        print(f"--- 可視化完了 ({len(tasks)} rendered) ---")
+
+
+def render_figure_task(renderer: str, data: pd.DataFrame, kwargs: dict):
+    """プロセスプールで1枚の図を描く。保存したパス（描かなかった場合は None）を返す。"""
+    return getattr(Plotsproducer, renderer)(data, **kwargs)
 
 if __name__ == '__main__':
     # このスクリプト単体で実行する場合の処理
-    panel_path = os.path.join(settings.PANELDATA_DIR, 'panel_data.csv')
+    panel_storage = storage.get_storage()
+    panel_path = panel_storage.path(settings.PANELDATA_DIR, settings.PANEL_DATA_NAME)
     if os.path.exists(panel_path):
-        panel_df = pd.read_csv(panel_path)
-        # 時系列プロット用に特許データも読み込む
-        patent_dict_main = data_processor.PanelDataProducer.load_data_from_csv(settings.PATENT_COUNT_FILE_KEY) # data_processorから関数を借用
-        Plotsproducer.generate_all_visualizations(panel_df, patent_dict_main)
+        panel_df = storage.load_panel_data(panel_storage)
+        Plotsproducer.generate_all_visualizations(panel_df)
     else:
         print(f"エラー: {panel_path} が見つかりません。まず data_processor.py を実行してください。")